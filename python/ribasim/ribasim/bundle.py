@@ -0,0 +1,131 @@
+"""Columnar storage of the tables of a model, as an alternative to the GeoPackage.
+
+``Model.write(filepath, format="bundle")`` stores every table that would otherwise go
+into ``database.gpkg`` in a directory ``bundle`` in the input directory instead:
+one Arrow file per table, named like ``Basin_time.arrow``,
+with the geometries as WKB, and a small manifest, ``manifest.json``.
+Tables that are stored in their own Arrow file are kept there, as for a GeoPackage.
+
+The files are uncompressed by default, so that `Model.read` can memory map them,
+and the tables keep the dtypes they had in memory, so the conversion between
+a bundle and a GeoPackage, by reading one and writing the other, is lossless.
+Like those in `ribasim.cache`, the tables of a bundle of the current schema version
+were validated before they were written, so they are not validated again when read.
+To read only some columns of a table, without reading the model, use `read_table`.
+
+The Ribasim core only reads GeoPackages, so write the model as such to run it.
+"""
+
+import json
+import os
+from collections.abc import Sequence
+from os import PathLike
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import pandas as pd
+import tomli
+from pyarrow import feather
+
+import ribasim
+from ribasim.cache import _table_filename
+from ribasim.utils import _from_arrow_table
+
+__all__ = ("read_table",)
+
+BUNDLE = "bundle"
+MANIFEST = "manifest.json"
+
+
+class _BundleInfo(NamedTuple):
+    """The manifest of a bundle, which is needed to read it."""
+
+    path: Path
+    schema_version: int
+    # The file of every table in the bundle, by the name of the table
+    tables: dict[str, str]
+
+
+def _read_info(directory: Path) -> _BundleInfo | None:
+    """Read the manifest of the bundle in the input directory, if there is one."""
+    path = directory / BUNDLE
+    try:
+        manifest = json.loads((path / MANIFEST).read_text())
+    except FileNotFoundError:
+        return None
+    return _BundleInfo(path, manifest["schema_version"], manifest["tables"])
+
+
+def _write_info(path: Path, tables: Sequence[str]) -> None:
+    """Write the manifest last, and remove the files of tables that are gone."""
+    files = {table: _table_filename(table) for table in tables}
+    manifest: dict[str, Any] = {
+        "ribasim_version": ribasim.__version__,
+        "schema_version": ribasim.__schema_version__,
+        "tables": files,
+    }
+    temp_path = path / f".{MANIFEST}"
+    temp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(temp_path, path / MANIFEST)
+    for file in path.glob("*.arrow"):
+        if file.name not in files.values():
+            file.unlink()
+
+
+def _table_path(info: _BundleInfo, table: str) -> Path | None:
+    filename = info.tables.get(table)
+    return None if filename is None else info.path / filename
+
+
+def _read_table(
+    path: Path, columns: Sequence[str] | None = None, memory_map: bool = False
+) -> pd.DataFrame:
+    """Read a table from a bundle, with only `columns` and the index if given."""
+    if columns is not None:
+        schema = feather.read_table(path, memory_map=True).schema
+        index = [
+            name
+            for name in schema.pandas_metadata["index_columns"]
+            if isinstance(name, str)
+        ]
+        columns = [*index, *(name for name in columns if name not in index)]
+    return _from_arrow_table(
+        feather.read_table(path, columns=columns, memory_map=memory_map)
+    )
+
+
+def read_table(
+    filepath: str | PathLike[str],
+    table: str,
+    columns: Sequence[str] | None = None,
+    memory_map: bool = True,
+) -> pd.DataFrame:
+    """Read a table of a model that was written as a bundle, without reading the model.
+
+    Parameters
+    ----------
+    filepath : str | PathLike[str]
+        The path to the TOML file of the model.
+    table : str
+        The name of the table, like ``"Basin / time"``.
+    columns : Sequence[str] | None
+        Read only these columns, and the index. By default all columns are read.
+    memory_map : bool
+        Memory map the file instead of reading it.
+
+    Returns
+    -------
+    pd.DataFrame
+        The table as it was written, a GeoDataFrame for spatial tables.
+        The table is not migrated if it was written by an older version of Ribasim.
+    """
+    filepath = Path(filepath)
+    with open(filepath, "rb") as f:
+        config = tomli.load(f)
+    info = _read_info(filepath.parent / config.get("input_dir", "."))
+    if info is None:
+        raise ValueError(f"Model '{filepath}' is not written as a bundle.")
+    path = _table_path(info, table)
+    if path is None:
+        raise ValueError(f"The bundle of model '{filepath}' has no table {table}.")
+    return _read_table(path, columns, memory_map)
@@ -0,0 +1,203 @@
+"""On-disk cache of the validated tables of models, see `Model.read`.
+
+Each entry holds the tables of one model as uncompressed Arrow files.
+An entry is found by the hash of the TOML file and the GeoPackage,
+and is only used if the Arrow input files it was made from are unchanged too.
+Reading a model from its entry skips SQLite, migrations and validation.
+The files of the entry are read into memory, not memory mapped,
+so the model stays usable when the entry is removed, and doesn't keep it open.
+
+The cache is stored in the directory given by the environment variable
+``RIBASIM_CACHE_DIR``, by default ``~/.cache/ribasim``.
+When it grows over ``RIBASIM_CACHE_SIZE`` bytes, 2 GB by default,
+the least recently used entries are removed.
+To empty the cache, use `clear`, or run ``python -m ribasim.cache clear``.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import pandas as pd
+import pyarrow as pa
+import tomli
+from pyarrow import feather
+
+import ribasim
+from ribasim.db_utils import _DatabaseInfo
+from ribasim.utils import _to_arrow_table
+
+__all__ = ("cache_dir", "clear")
+
+DEFAULT_SIZE = 2_000_000_000
+MANIFEST = "manifest.json"
+
+
+class _CacheEntry(NamedTuple):
+    """A cache entry that holds the tables of a model."""
+
+    path: Path
+    database_info: _DatabaseInfo
+    # The tables by file name, see `_read_tables`
+    tables: dict[str, pa.Table]
+
+
+# The entry that `Model.read` reads the tables from, if any
+context_cache: ContextVar[_CacheEntry | None] = ContextVar(
+    "context_cache", default=None
+)
+
+
+def cache_dir() -> Path:
+    """Return the directory of the cache."""
+    directory = os.environ.get("RIBASIM_CACHE_DIR")
+    if directory is None:
+        return Path.home() / ".cache" / "ribasim"
+    return Path(directory)
+
+
+def clear() -> None:
+    """Remove all entries from the cache."""
+    directory = cache_dir()
+    if directory.exists():
+        shutil.rmtree(directory)
+
+
+def _max_size() -> int:
+    return int(os.environ.get("RIBASIM_CACHE_SIZE", DEFAULT_SIZE))
+
+
+def _file_hash(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()
+
+
+def _key(toml_path: Path) -> str:
+    """Hash the TOML file and the GeoPackage of a model, and the versions of Ribasim."""
+    with open(toml_path, "rb") as f:
+        config = tomli.load(f)
+    db_path = toml_path.parent / config.get("input_dir", ".") / "database.gpkg"
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{ribasim.__version__} {ribasim.__schema_version__}".encode())
+    digest.update(_file_hash(toml_path).encode())
+    digest.update(_file_hash(db_path).encode())
+    return digest.hexdigest()
+
+
+def _table_filename(table: str) -> str:
+    return f"{table.replace(' / ', '_')}.arrow"
+
+
+def _lookup(key: str, directory: Path) -> _CacheEntry | None:
+    """Find the entry of a model, if its Arrow input files in `directory` are unchanged."""
+    path = cache_dir() / key
+    try:
+        manifest = json.loads((path / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+    for filepath, file_hash in manifest["arrow_files"].items():
+        arrow_path = directory / filepath
+        if not arrow_path.is_file() or _file_hash(arrow_path) != file_hash:
+            return None
+    try:
+        tables = _read_tables(path)
+        # Keep track of the last use, for the eviction
+        os.utime(path / MANIFEST)
+    except OSError:
+        # The entry was removed in the meantime
+        return None
+    info = manifest["database_info"]
+    database_info = _DatabaseInfo(
+        info["schema_version"], frozenset(info["tables"]), info["contents"]
+    )
+    return _CacheEntry(path, database_info, tables)
+
+
+def _store(key: str, model: Any, directory: Path, database_info: _DatabaseInfo) -> None:
+    """Store the tables of a model that was just read, and evict old entries."""
+    root = cache_dir()
+    temp_path = root / f".{key}.{uuid.uuid4().hex}"
+    temp_path.mkdir(parents=True)
+    try:
+        arrow_files = {}
+        _write_table(model.node_table().df, temp_path / _table_filename("Node"))
+        _write_table(model.link.df, temp_path / _table_filename("Link"))
+        for sub in model._nodes():
+            for table in sub._tables():
+                _write_table(table.df, temp_path / _table_filename(table.tablename()))
+                if table.filepath is not None:
+                    arrow_files[str(table.filepath)] = _file_hash(
+                        directory / table.filepath
+                    )
+        manifest = {
+            "arrow_files": arrow_files,
+            "database_info": {
+                "schema_version": database_info.schema_version,
+                "tables": sorted(database_info.tables),
+                "contents": database_info.contents,
+            },
+        }
+        (temp_path / MANIFEST).write_text(json.dumps(manifest))
+        # Replace an entry of which the Arrow input files changed
+        shutil.rmtree(root / key, ignore_errors=True)
+        try:
+            temp_path.rename(root / key)
+        except OSError:
+            if not (root / key).is_dir():
+                raise
+            # Another process stored the same entry in the meantime
+            shutil.rmtree(temp_path, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+    _evict(_max_size())
+
+
+def _evict(max_size: int) -> None:
+    """Remove the least recently used entries until the cache fits in `max_size` bytes."""
+    entries = []
+    for path in cache_dir().iterdir():
+        manifest = path / MANIFEST
+        if path.name.startswith(".") or not manifest.is_file():
+            continue
+        size = sum(file.stat().st_size for file in path.iterdir())
+        entries.append((manifest.stat().st_mtime, size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            shutil.rmtree(path)
+        except OSError:
+            # In use by another process, remove the next one instead
+            continue
+        total -= size
+
+
+def _write_table(df: pd.DataFrame, path: Path) -> None:
+    """Write a table uncompressed, see `_to_arrow_table`."""
+    feather.write_feather(_to_arrow_table(df), path, compression="uncompressed")
+
+
+def _read_tables(path: Path) -> dict[str, pa.Table]:
+    """Read the tables of an entry, written by `_write_table`, into memory.
+
+    They are not memory mapped, since Windows cannot remove files that are mapped,
+    and models read from an entry would then keep `clear` and `_evict` from removing it.
+    """
+    return {
+        file.name: feather.read_table(file, memory_map=False)
+        for file in path.glob("*.arrow")
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["clear"]:
+        sys.exit("usage: python -m ribasim.cache clear")
+    clear()
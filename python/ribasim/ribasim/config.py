@@ -7,7 +7,7 @@ import numpy as np
 import pandas as pd
 import pydantic
 from geopandas import GeoDataFrame
-from pydantic import ConfigDict, Field, NonNegativeInt, model_validator
+from pydantic import ConfigDict, Field, NonNegativeInt, PrivateAttr, model_validator
 from shapely.geometry import Point
 
 from ribasim.geometry import BasinAreaSchema, NodeTable
@@ -219,28 +219,55 @@ class Node(pydantic.BaseModel):
         super().__init__(node_id=node_id, geometry=geometry, **kwargs)
 
     def into_geodataframe(self, node_type: str, node_id: int) -> GeoDataFrame:
+        return _records_into_geodataframe([self._into_record(node_type, node_id)])
+
+    def _into_record(self, node_type: str, node_id: int) -> dict[str, Any]:
         extra = self.model_extra if self.model_extra is not None else {}
-        gdf = GeoDataFrame(
-            data={
-                "node_id": pd.Series([node_id], dtype=np.int32),
-                "node_type": pd.Series([node_type], dtype=str),
-                "name": pd.Series([self.name], dtype=str),
-                "subnetwork_id": pd.Series([self.subnetwork_id], dtype=pd.Int32Dtype()),
-                "source_priority": pd.Series(
-                    [self.source_priority], dtype=pd.Int32Dtype()
-                ),
-                "cyclic_time": pd.Series([self.cyclic_time], dtype=bool),
-                **extra,
-            },
-            geometry=[self.geometry],
-        )
-        gdf.set_index("node_id", inplace=True)
-        return gdf
+        return {
+            "node_id": node_id,
+            "node_type": node_type,
+            "name": self.name,
+            "subnetwork_id": self.subnetwork_id,
+            "source_priority": self.source_priority,
+            "cyclic_time": self.cyclic_time,
+            **extra,
+            "geometry": self.geometry,
+        }
+
+
+def _records_into_geodataframe(
+    records: Sequence[dict[str, Any]], crs: Any = None
+) -> GeoDataFrame:
+    """Create a node table from records created by `Node._into_record`."""
+    df = pd.DataFrame.from_records(records)
+    gdf = GeoDataFrame(
+        df.astype(
+            {
+                "node_id": np.int32,
+                "node_type": str,
+                "name": str,
+                "subnetwork_id": pd.Int32Dtype(),
+                "source_priority": pd.Int32Dtype(),
+                "cyclic_time": bool,
+            }
+        ),
+        geometry="geometry",
+        crs=crs,
+    )
+    gdf.set_index("node_id", inplace=True)
+    return gdf
 
 
 class MultiNodeModel(NodeModel):
     node: NodeTable = Field(default_factory=NodeTable)
     _node_type: str
+    # Rows appended within `Model.batch`, which are only concatenated at the end.
+    _pending_records: list[dict[str, Any]] = PrivateAttr(default_factory=list)
+    _pending_frames: list[GeoDataFrame] = PrivateAttr(default_factory=list)
+    _pending_tables: dict[str, tuple[TableModel[Any], list[pd.DataFrame]]] = (
+        PrivateAttr(default_factory=dict)
+    )
+    _pending_nodes: dict[int, NodeData] = PrivateAttr(default_factory=dict)
 
     @model_validator(mode="after")
     def filter(self) -> "MultiNodeModel":
@@ -279,32 +306,196 @@ class MultiNodeModel(NodeModel):
                 f"Node IDs have to be unique, but {node_id} already exists."
             )
 
+        tables_to_append = []
         for table in tables:
+            assert table.df is not None
+            tables_to_append.append((table, table.df.assign(node_id=node_id)))
+
+        node_type = self.__class__.__name__
+        if self._parent._batch_depth > 0:
+            self._pending_records.append(node._into_record(node_type, node_id))
+            self._buffer_tables(tables_to_append)
+            self._pending_nodes[node_id] = NodeData(node_id, node_type, node.geometry)
+        else:
+            node_table = node.into_geodataframe(node_type=node_type, node_id=node_id)
+            self._append(node_table, tables_to_append)
+
+        self._parent._used_node_ids.add(node_id)
+        return self[node_id]
+
+    def add_many(
+        self,
+        node: pd.DataFrame,
+        tables: Sequence[TableModel[Any]] | None = None,
+    ) -> list[NodeData]:
+        """Add many nodes and the associated data to the model at once.
+
+        This is much faster than calling `add` for each node,
+        since every table is appended to only once.
+
+        Parameters
+        ----------
+        node : pd.DataFrame | GeoDataFrame
+            One row per node, with a Point `geometry` column and optionally
+            other columns of the Node table, like `name` or `subnetwork_id`.
+            If the index is named `node_id`, it holds the node IDs.
+            Otherwise new node IDs are generated.
+        tables : Sequence[TableModel[Any]] | None
+            Tables in long format, of which the `node_id` column refers to the index of `node`.
+
+        Returns
+        -------
+        list[NodeData]
+            The added nodes, in the order of `node`.
+
+        Raises
+        ------
+        ValueError
+            When node IDs are not unique or the tables refer to nodes that are not added.
+        """
+        if tables is None:
+            tables = []
+
+        if self._parent is None:
+            raise ValueError(
+                f"You can only add to a {self._node_type} MultiNodeModel when attached to a Model."
+            )
+
+        used_node_ids = self._parent._used_node_ids
+        labels = node.index
+        if labels.has_duplicates:
+            duplicates = labels[labels.duplicated()].unique().tolist()
+            raise ValueError(
+                f"Node IDs have to be unique, but {duplicates} occur more than once."
+            )
+        if labels.name == "node_id":
+            node_ids = labels.to_numpy(dtype=np.int64)
+            existing = used_node_ids.node_ids.intersection(node_ids.tolist())
+            if existing:
+                raise ValueError(
+                    f"Node IDs have to be unique, but {sorted(existing)} already exist."
+                )
+        else:
+            node_ids = used_node_ids.new_ids(len(node))
+
+        node_table = GeoDataFrame(node, geometry="geometry", copy=True)
+        if (node_table.geometry.isna() | node_table.geometry.is_empty).any():
+            raise ValueError("Node geometry must be a valid Point")
+        node_table["node_type"] = self.__class__.__name__
+        node_table.index = pd.Index(node_ids.astype(np.int32), name="node_id")
+
+        tables_to_append = []
+        for table in tables:
+            assert table.df is not None
+            position = labels.get_indexer(pd.Index(table.df["node_id"]))
+            if (position == -1).any():
+                missing = table.df["node_id"][position == -1].unique().tolist()
+                raise ValueError(
+                    f"{table.tablename()} refers to nodes that are not added: {missing}"
+                )
+            tables_to_append.append(
+                (table, table.df.assign(node_id=node_ids[position]))
+            )
+
+        self._append(node_table, tables_to_append)
+
+        used_node_ids.update(node_ids)
+        node_type = self.__class__.__name__
+        return [
+            NodeData(node_id=int(node_id), node_type=node_type, geometry=geometry)
+            for node_id, geometry in zip(node_ids, node_table.geometry)
+        ]
+
+    def _append(
+        self,
+        node_table: GeoDataFrame,
+        tables: Sequence[tuple[TableModel[Any], pd.DataFrame]],
+    ) -> None:
+        """Append rows to the node table and the tables of this node type.
+
+        Within `Model.batch` the rows are buffered, and only appended by `_flush`.
+        """
+        assert self._parent is not None
+        if node_table.crs is None:
+            node_table.set_crs(self._parent.crs, inplace=True)
+        else:
+            node_table.to_crs(self._parent.crs, inplace=True)
+
+        if self._parent._batch_depth > 0:
+            # Keep the nodes in the order in which they were added.
+            self._seal_records()
+            self._pending_frames.append(node_table)
+            self._buffer_tables(tables)
+            node_type = self.__class__.__name__
+            self._pending_nodes.update(
+                (node_id, NodeData(node_id, node_type, geometry))
+                for node_id, geometry in zip(
+                    node_table.index.tolist(), node_table.geometry
+                )
+            )
+        else:
+            self._extend(node_table, tables)
+
+    def _buffer_tables(
+        self, tables: Sequence[tuple[TableModel[Any], pd.DataFrame]]
+    ) -> None:
+        assert self._parent is not None
+        for table, table_to_append in tables:
+            if isinstance(table_to_append, GeoDataFrame):
+                table_to_append.set_crs(self._parent.crs, inplace=True)
+            member_name = _pascal_to_snake(table.__class__.__name__)
+            self._pending_tables.setdefault(member_name, (table, []))[1].append(
+                table_to_append
+            )
+
+    def _seal_records(self) -> None:
+        """Turn the buffered node records into a node table."""
+        if self._pending_records:
+            assert self._parent is not None
+            self._pending_frames.append(
+                _records_into_geodataframe(self._pending_records, self._parent.crs)
+            )
+            self._pending_records = []
+
+    def _flush(self) -> None:
+        """Append all rows buffered within `Model.batch` at once."""
+        self._seal_records()
+        if not self._pending_frames:
+            return
+        node_table = _concat(self._pending_frames)
+        tables = [
+            (table, _concat(dfs, ignore_index=True))
+            for table, dfs in self._pending_tables.values()
+        ]
+        self._pending_frames = []
+        self._pending_tables = {}
+        self._pending_nodes = {}
+        self._extend(node_table, tables)
+
+    def _extend(
+        self,
+        node_table: GeoDataFrame,
+        tables: Sequence[tuple[TableModel[Any], pd.DataFrame]],
+    ) -> None:
+        """Concatenate rows to the node table and the tables of this node type."""
+        for table, table_to_append in tables:
             member_name = _pascal_to_snake(table.__class__.__name__)
             existing_member = getattr(self, member_name)
             existing_table = (
                 existing_member.df if existing_member.df is not None else pd.DataFrame()
             )
-            assert table.df is not None
-            table_to_append = table.df.assign(node_id=node_id)
             if isinstance(table_to_append, GeoDataFrame):
+                assert self._parent is not None
                 table_to_append.set_crs(self._parent.crs, inplace=True)
             new_table = _concat([existing_table, table_to_append], ignore_index=True)
             setattr(self, member_name, new_table)
 
-        node_table = node.into_geodataframe(
-            node_type=self.__class__.__name__, node_id=node_id
-        )
-        node_table.set_crs(self._parent.crs, inplace=True)
         if self.node.df is None:
             self.node.df = node_table
         else:
             df = _concat([self.node.df, node_table])
             self.node.df = df
 
-        self._parent._used_node_ids.add(node_id)
-        return self[node_id]
-
     def __getitem__(self, index: int) -> NodeData:
         # Unlike TableModel, support only indexing single rows.
         if not isinstance(index, numbers.Integral):
@@ -314,9 +505,16 @@ class MultiNodeModel(NodeModel):
                 f"{node_model_name} index must be an integer, not {indextype}"
             )
 
-        row = self.node.df.loc[index]
+        if index in self._pending_nodes:
+            return self._pending_nodes[index]
+        # Look up the position instead of the row, which builds a Series,
+        # and read the node table itself, which may have been edited in place.
+        df = self.node.df
+        row = df.index.get_loc(index)
         return NodeData(
-            node_id=int(index), node_type=row["node_type"], geometry=row["geometry"]
+            node_id=int(index),
+            node_type=df["node_type"].array[row],
+            geometry=df["geometry"].array[row],
         )
 
 
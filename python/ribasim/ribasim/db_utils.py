@@ -1,6 +1,27 @@
-from contextlib import closing
+from collections.abc import Generator
+from contextlib import closing, contextmanager
 from pathlib import Path
 from sqlite3 import Connection, connect
+from typing import NamedTuple
+
+import numpy as np
+import pyarrow as pa
+
+from ribasim.utils import MissingOptionalModule
+
+try:
+    from adbc_driver_sqlite import dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = MissingOptionalModule("adbc_driver_sqlite", "adbc")  # type: ignore
+
+# The GeoPackage is written to a temporary file that is only moved in place
+# when it is complete, so we don't need to protect it against crashes halfway.
+WRITE_PRAGMAS = (
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
 
 
 def esc_id(identifier: str) -> str:
@@ -24,7 +45,165 @@ def _set_gpkg_attribute_table(connection: Connection, table: str) -> None:
     with closing(connection.cursor()) as cursor:
         sql = "INSERT OR REPLACE INTO gpkg_contents (table_name, data_type, identifier) VALUES (?, ?, ?)"
         cursor.execute(sql, (table, "attributes", table))
-    connection.commit()
+
+
+def _get_feature_layers(connection: Connection) -> list[str]:
+    """List the spatial layers registered in a GeoPackage."""
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'"
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+def _get_attribute_tables(connection: Connection) -> list[str]:
+    """List the non-spatial tables registered in a GeoPackage."""
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type = 'attributes'"
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+# Attribute tables that are not part of a node type
+METADATA_TABLES = ("ribasim_metadata", "layer_styles")
+
+
+def _drop_table(connection: Connection, table: str) -> None:
+    """Remove an attribute table from a GeoPackage."""
+    connection.execute(f"DROP TABLE IF EXISTS {esc_id(table)}")
+    connection.execute("DELETE FROM gpkg_contents WHERE table_name = ?", (table,))
+
+
+class _DeferredCommitConnection(Connection):
+    """SQLite connection that ignores intermediate commits and rollbacks.
+
+    Libraries like pandas commit after every table they write.
+    This connection leaves ending the transaction to `_write_transaction`.
+    """
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+@contextmanager
+def _write_transaction(db_path: Path) -> Generator[Connection, None, None]:
+    """Open a single connection that writes everything in one transaction."""
+    with closing(
+        connect(db_path, isolation_level=None, factory=_DeferredCommitConnection)
+    ) as connection:
+        for pragma in WRITE_PRAGMAS:
+            connection.execute(pragma)
+        connection.execute("BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+def _copy_table(connection: Connection, source_path: Path, table: str) -> None:
+    """Copy a table with its rows as is from another SQLite database."""
+    with closing(connect(source_path)) as source:
+        (create_table,) = source.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)
+        ).fetchone()
+        create_indices = source.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+            (table,),
+        ).fetchall()
+        connection.execute(f"DROP TABLE IF EXISTS {esc_id(table)}")
+        connection.execute(create_table)
+        cursor = source.execute(f"SELECT * FROM {esc_id(table)}")
+        placeholders = ", ".join("?" * len(cursor.description))
+        connection.executemany(
+            f"INSERT INTO {esc_id(table)} VALUES ({placeholders})", cursor
+        )
+        for (create_index,) in create_indices:
+            connection.execute(create_index)
+
+
+# Number of rows that are converted to Arrow at once
+READ_CHUNK_SIZE = 65_536
+
+
+def _read_arrow_table(
+    db_path: Path,
+    table: str,
+    types: dict[str, pa.DataType],
+    chunk_size: int = READ_CHUNK_SIZE,
+) -> pa.Table:
+    """Read a table into Arrow, without creating a DataFrame first.
+
+    With the optional ADBC SQLite driver the table is read by the driver.
+    Otherwise the rows are fetched in chunks, and converted column by column.
+
+    Parameters
+    ----------
+    db_path : Path
+    table : str
+        Name of the table.
+    types : dict[str, pa.DataType]
+        The Arrow type of each column. The types of other columns are inferred.
+    chunk_size : int
+        The number of rows that is converted to Arrow at once.
+    """
+    query = f"SELECT * FROM {esc_id(table)}"
+    arrow_table = None
+    if not isinstance(adbc_sqlite, MissingOptionalModule):
+        try:
+            with adbc_sqlite.connect(str(db_path)) as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(query)
+                    arrow_table = cursor.fetch_arrow_table()
+        except (adbc_sqlite.Error, OSError):
+            # The driver infers the types from the first rows,
+            # which fails if a column holds values of different types.
+            arrow_table = None
+    if arrow_table is None:
+        with closing(connect(db_path)) as connection:
+            arrow_table = _fetch_arrow_table(connection, query, chunk_size)
+    return _cast_columns(arrow_table, types)
+
+
+def _fetch_arrow_table(connection: Connection, query: str, chunk_size: int) -> pa.Table:
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(query)
+        names = [description[0] for description in cursor.description]
+        chunks = []
+        while rows := cursor.fetchmany(chunk_size):
+            values = np.array(rows, dtype=object)
+            chunks.append(
+                pa.table([pa.array(column) for column in values.T], names=names)
+            )
+    if not chunks:
+        return pa.table({name: pa.array([]) for name in names})
+    return pa.concat_tables(chunks, promote_options="permissive")
+
+
+def _cast_columns(table: pa.Table, types: dict[str, pa.DataType]) -> pa.Table:
+    """Cast the columns to the given types, leaving the columns that don't fit as is."""
+    for i, name in enumerate(table.column_names):
+        type = types.get(name)
+        column = table.column(i)
+        if type is None or column.type == type:
+            continue
+        try:
+            if pa.types.is_timestamp(type) and pa.types.is_string(column.type):
+                # We store TIMESTAMP in SQLite like "2025-05-29 14:16:00"
+                # see https://www.sqlite.org/lang_datefunc.html
+                column = column.cast(pa.timestamp("us")).cast(type, safe=False)
+            else:
+                column = column.cast(type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # Leave it to the schema validation
+            continue
+        table = table.set_column(i, name, column)
+    return table
 
 
 CREATE_TABLE_SQL = """
@@ -35,6 +214,42 @@ CREATE TABLE IF NOT EXISTS ribasim_metadata (
 """
 
 
+class _DatabaseInfo(NamedTuple):
+    """The metadata of a GeoPackage that is needed to read it."""
+
+    schema_version: int
+    # All tables in sqlite_master
+    tables: frozenset[str]
+    # The data type of every table in gpkg_contents, "features" or "attributes"
+    contents: dict[str, str]
+
+
+def _read_database_info(db_path: Path) -> _DatabaseInfo:
+    """Read the schema version and the listings of tables of a GeoPackage at once."""
+    with closing(connect(db_path)) as connection:
+        tables = frozenset(
+            name
+            for (name,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        )
+        contents = (
+            dict(connection.execute("SELECT table_name, data_type FROM gpkg_contents"))
+            if "gpkg_contents" in tables
+            else {}
+        )
+        schema_version = (
+            _read_db_schema_version(connection) if "ribasim_metadata" in tables else 0
+        )
+    return _DatabaseInfo(schema_version, tables, contents)
+
+
+def _read_db_schema_version(connection: Connection) -> int:
+    with closing(connection.cursor()) as cursor:
+        cursor.execute("SELECT value FROM ribasim_metadata WHERE key='schema_version'")
+        return int(cursor.fetchone()[0])
+
+
 def _get_db_schema_version(db_path: Path) -> int:
     """
     Get the schema version of the database.
@@ -45,21 +260,20 @@ def _get_db_schema_version(db_path: Path) -> int:
     with closing(connect(db_path)) as connection:
         if not exists(connection, "ribasim_metadata"):
             return 0
-        with closing(connection.cursor()) as cursor:
-            cursor.execute(
-                "SELECT value FROM ribasim_metadata WHERE key='schema_version'"
-            )
-            return int(cursor.fetchone()[0])
+        return _read_db_schema_version(connection)
+
+
+def _write_db_schema_version(connection: Connection, version: int = 1) -> None:
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+        cursor.execute(
+            "INSERT OR REPLACE INTO ribasim_metadata (key, value) VALUES ('schema_version', ?)",
+            (version,),
+        )
+    _set_gpkg_attribute_table(connection, "ribasim_metadata")
 
 
 def _set_db_schema_version(db_path: Path, version: int = 1) -> None:
     with closing(connect(db_path)) as connection:
-        if not exists(connection, "metadata"):
-            with closing(connection.cursor()) as cursor:
-                cursor.execute(CREATE_TABLE_SQL)
-                cursor.execute(
-                    "INSERT OR REPLACE INTO ribasim_metadata (key, value) VALUES ('schema_version', ?)",
-                    (version,),
-                )
-            _set_gpkg_attribute_table(connection, "ribasim_metadata")
-            connection.commit()
+        _write_db_schema_version(connection, version)
+        connection.commit()
@@ -302,15 +302,11 @@ def generate(
     """Generate a Delwaq model from a Ribasim model and results."""
     # Read in model and results
     model = ribasim.Model.read(toml_path)
-    results_folder = toml_path.parent / model.results_dir
     evaporate_mass = model.solver.evaporate_mass
 
-    basins = pd.read_feather(
-        toml_path.parent / results_folder / "basin.arrow", dtype_backend="pyarrow"
-    )
-    flows = pd.read_feather(
-        toml_path.parent / results_folder / "flow.arrow", dtype_backend="pyarrow"
-    )
+    results = model.read_results()
+    basins = results.read("basin")
+    flows = results.read("flow")
 
     output_path.mkdir(exist_ok=True)
 
@@ -0,0 +1,172 @@
+"""Row-level comparison of two tables, see `TableModel.diff`."""
+
+from typing import NamedTuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import shapely
+from numpy.typing import NDArray
+
+# The column that numbers rows with the same keys, to align duplicates in order
+OCCURRENCE = "_occurrence"
+# The column that holds the position of the rows in the tables that are merged
+ROW = "_row"
+
+
+class TableDiff(NamedTuple):
+    """The differences between the rows of two tables, self and other.
+
+    Rows are aligned on their keys: the sort keys of the table,
+    or the index for tables without sort keys, like the Node and Link tables.
+    Rows with the same keys are aligned in order of occurrence.
+    Geometries are given as WKB.
+    """
+
+    # The columns that the rows are aligned on
+    keys: list[str]
+    # Rows of self of which the keys are not in other
+    added: pa.Table
+    # Rows of other of which the keys are not in self
+    removed: pa.Table
+    # Per column, the keys and both values of the aligned rows that differ
+    changed: dict[str, pa.Table]
+    # Columns that are only in self or only in other
+    columns_added: list[str]
+    columns_removed: list[str]
+
+    def __bool__(self) -> bool:
+        """Check whether there are any differences."""
+        return bool(
+            self.added.num_rows
+            or self.removed.num_rows
+            or self.changed
+            or self.columns_added
+            or self.columns_removed
+        )
+
+    def report(self) -> str:
+        """Summarize the differences."""
+        lines = [
+            f"Rows aligned on: {', '.join(self.keys)}",
+            f"Rows only in self: {self.added.num_rows}",
+            f"Rows only in other: {self.removed.num_rows}",
+        ]
+        if self.columns_added:
+            lines.append(f"Columns only in self: {', '.join(self.columns_added)}")
+        if self.columns_removed:
+            lines.append(f"Columns only in other: {', '.join(self.columns_removed)}")
+        for column, table in self.changed.items():
+            lines.append(f"Column {column}: {table.num_rows} rows differ")
+        return "\n".join(lines)
+
+
+def _to_arrow(df: pd.DataFrame) -> pa.Table:
+    geometry = {
+        str(name): shapely.to_wkb(df[name].to_numpy())
+        for name, dtype in df.dtypes.items()
+        if dtype == "geometry"
+    }
+    return pa.Table.from_pandas(
+        pd.DataFrame(df).assign(**geometry), preserve_index=False
+    )
+
+
+def _equal(a: pd.Series, b: pd.Series, rtol: float, atol: float) -> NDArray[np.bool_]:
+    """Compare values, taking missing values as equal, and floats within a tolerance."""
+    if a.dtype == "geometry" or b.dtype == "geometry":
+        a_geometry = gpd.GeoSeries(a).to_numpy()
+        b_geometry = gpd.GeoSeries(b).to_numpy()
+        return shapely.equals_exact(a_geometry, b_geometry, tolerance=atol) | (
+            shapely.is_missing(a_geometry) & shapely.is_missing(b_geometry)
+        )
+    missing = (a.isna() & b.isna()).to_numpy(dtype=bool)
+    if pd.api.types.is_float_dtype(a.dtype) and pd.api.types.is_float_dtype(b.dtype):
+        a_values = a.to_numpy(dtype=np.float64, na_value=np.nan)
+        b_values = b.to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.isclose(a_values, b_values, rtol=rtol, atol=atol) | missing
+    return (a == b).fillna(False).to_numpy(dtype=bool) | missing
+
+
+def _with_keys(df: pd.DataFrame, keys: list[str]) -> tuple[pd.DataFrame, list[str]]:
+    """Move the index into a column if it is the key, and return the keys."""
+    if not keys:
+        df = pd.DataFrame(df).reset_index()
+        return df, [str(df.columns[0])]
+    return pd.DataFrame(df).reset_index(drop=True), keys
+
+
+def _diff_tables(
+    self_df: pd.DataFrame,
+    other_df: pd.DataFrame,
+    keys: list[str],
+    columns: list[str] | None = None,
+    rtol: float = 0.0,
+    atol: float = 0.0,
+) -> TableDiff:
+    """Compare two tables row by row, aligning them on `keys`, or the index if empty.
+
+    Only `columns` are compared if given, otherwise all columns.
+    Floats are equal if they are close, see `numpy.isclose`.
+    """
+    b, _ = _with_keys(other_df, keys)
+    a, keys = _with_keys(self_df, keys)
+    if columns is None:
+        a_columns = [c for c in a.columns if c not in keys]
+        b_columns = [c for c in b.columns if c not in keys]
+    else:
+        a_columns = [c for c in columns if c in a.columns and c not in keys]
+        b_columns = [c for c in columns if c in b.columns and c not in keys]
+    common = [c for c in a_columns if c in b_columns]
+
+    if len(a) == len(b) and all(_equal(a[k], b[k], 0.0, 0.0).all() for k in keys):
+        # The keys are the same and in the same order, so the rows are aligned already
+        added = a.iloc[:0]
+        removed = b.iloc[:0]
+        aligned = a[keys]
+        self_values = {column: a[column] for column in common}
+        other_values = {column: b[column] for column in common}
+    else:
+        on = [*keys, OCCURRENCE]
+        a[OCCURRENCE] = a.groupby(keys, sort=False, dropna=False).cumcount()
+        b[OCCURRENCE] = b.groupby(keys, sort=False, dropna=False).cumcount()
+        merged = (
+            a[on + common]
+            .assign(**{ROW: np.arange(len(a))})
+            .merge(
+                b[on + common].assign(**{ROW: np.arange(len(b))}),
+                on=on,
+                how="outer",
+                suffixes=("_self", "_other"),
+                indicator=True,
+                sort=False,
+            )
+        )
+        side = merged.pop("_merge").to_numpy()
+        added = a.iloc[np.sort(merged[f"{ROW}_self"][side == "left_only"].astype(int))]
+        removed = b.iloc[
+            np.sort(merged[f"{ROW}_other"][side == "right_only"].astype(int))
+        ]
+        both = merged[side == "both"]
+        aligned = both[keys]
+        self_values = {column: both[f"{column}_self"] for column in common}
+        other_values = {column: both[f"{column}_other"] for column in common}
+
+    changed = {}
+    for column in common:
+        differs = ~_equal(self_values[column], other_values[column], rtol, atol)
+        if differs.any():
+            rows = aligned[differs].copy()
+            rows["self"] = self_values[column][differs]
+            rows["other"] = other_values[column][differs]
+            changed[column] = _to_arrow(rows)
+
+    return TableDiff(
+        keys=keys,
+        added=_to_arrow(added[keys + a_columns]),
+        removed=_to_arrow(removed[keys + b_columns]),
+        changed=changed,
+        columns_added=[c for c in a_columns if c not in b_columns],
+        columns_removed=[c for c in b_columns if c not in a_columns],
+    )
@@ -1,5 +1,7 @@
+from collections import Counter
+from collections.abc import Iterable, Sequence
 from pathlib import Path
-from typing import NamedTuple
+from typing import Any, ClassVar, NamedTuple
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -7,15 +9,14 @@ import pandas as pd
 import pandera as pa
 import shapely
 from matplotlib.axes import Axes
-from numpy.typing import NDArray
+from numpy.typing import ArrayLike, NDArray
 from pandera.dtypes import Int32
 from pandera.typing import Index, Series
 from pandera.typing.geopandas import GeoDataFrame, GeoSeries
 from pydantic import NonNegativeInt, PrivateAttr, model_validator
 from shapely.geometry import LineString, MultiLineString, Point
 
-from ribasim.db_utils import _get_db_schema_version
-from ribasim.input_base import SpatialTableModel
+from ribasim.input_base import SpatialTableModel, _database_info
 from ribasim.utils import UsedIDs, _concat
 from ribasim.validation import (
     can_connect,
@@ -37,6 +38,31 @@ SPATIALCONTROLNODETYPES = {
 }
 
 
+# Lookup arrays indexed by node type code, for vectorized validation of many links.
+NODE_TYPES = sorted(node_type_connectivity)
+CONNECTIVITY = np.array(
+    [[can_connect(up, down) for down in NODE_TYPES] for up in NODE_TYPES]
+)
+FLOW_LINK_NEIGHBOR_AMOUNT = np.array(
+    [flow_link_neighbor_amount[node_type] for node_type in NODE_TYPES]
+)
+CONTROL_LINK_NEIGHBOR_AMOUNT = np.array(
+    [control_link_neighbor_amount[node_type] for node_type in NODE_TYPES]
+)
+
+
+def _node_type_codes(node_type: NDArray[np.object_]) -> NDArray[np.int8]:
+    """Convert node type names to indices into NODE_TYPES."""
+    return pd.Categorical(node_type, categories=NODE_TYPES).codes
+
+
+def _pair_key(from_node_id: ArrayLike, to_node_id: ArrayLike) -> NDArray[np.int64]:
+    """Combine two non-negative int32 node IDs into a single int64 key."""
+    return (np.asarray(from_node_id, dtype=np.int64) << 32) | np.asarray(
+        to_node_id, dtype=np.int64
+    )
+
+
 class NodeData(NamedTuple):
     node_id: int
     node_type: str
@@ -46,6 +72,52 @@ class NodeData(NamedTuple):
         return f"{self.node_type} #{self.node_id}"
 
 
+class NodeIndex:
+    """Lookup of the nodes of a sorted node table by node_id, with `index.get_indexer`.
+
+    It holds the node types and geometries as arrays, with the node type codes
+    into NODE_TYPES for vectorized validation.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.index = df.index
+        self.node_type: NDArray[np.object_] = df["node_type"].to_numpy(dtype=object)
+        self.node_code = _node_type_codes(self.node_type)
+        self.geometry: NDArray[np.object_] = df["geometry"].to_numpy()
+
+
+class LinkIndex:
+    """Adjacency index of a link table, to validate new links in constant time.
+
+    It holds the set of (from_node_id, to_node_id) pairs, and the number of
+    in and out links per (node_id, link_type).
+    """
+
+    def __init__(self, df: pd.DataFrame | None = None):
+        self.pairs: set[tuple[int, int]] = set()
+        self.in_degree: Counter[tuple[int, str]] = Counter()
+        self.out_degree: Counter[tuple[int, str]] = Counter()
+        self.n_links = 0
+        if df is not None:
+            self.update(
+                df["from_node_id"].tolist(),
+                df["to_node_id"].tolist(),
+                df["link_type"].tolist(),
+            )
+
+    def update(
+        self,
+        from_node_ids: Iterable[int],
+        to_node_ids: Iterable[int],
+        link_types: Iterable[str],
+    ) -> None:
+        links = list(zip(from_node_ids, to_node_ids, link_types))
+        self.pairs.update((from_id, to_id) for from_id, to_id, _ in links)
+        self.in_degree.update((to_id, type_) for _, to_id, type_ in links)
+        self.out_degree.update((from_id, type_) for from_id, _, type_ in links)
+        self.n_links += len(links)
+
+
 class LinkSchema(_GeoBaseSchema):
     link_id: Index[Int32] = pa.Field(default=0, ge=0, check_name=True)
     name: Series[str] = pa.Field(default="")
@@ -63,6 +135,16 @@ class LinkTable(SpatialTableModel[LinkSchema]):
     """Defines the connections between nodes."""
 
     _used_link_ids: UsedIDs = PrivateAttr(default_factory=UsedIDs)
+    _parent: Any | None = PrivateAttr(default=None)
+    _index: LinkIndex = PrivateAttr(default_factory=LinkIndex)
+    _indexed_df: Any | None = PrivateAttr(default=None)
+    # Rows added within `Model.batch`, which are only concatenated at the end.
+    _pending: list[dict[str, Any]] = PrivateAttr(default_factory=list)
+    _unpickled: ClassVar[frozenset[str]] = SpatialTableModel._unpickled | {
+        "_parent",
+        "_index",
+        "_indexed_df",
+    }
 
     @model_validator(mode="after")
     def _update_used_ids(self) -> "LinkTable":
@@ -73,12 +155,39 @@ class LinkTable(SpatialTableModel[LinkSchema]):
 
     @classmethod
     def _from_db(cls, path: Path, table: str) -> pd.DataFrame | None:
-        schema_version = _get_db_schema_version(path)
+        schema_version = _database_info(path).schema_version
         # The table name was changed from "Edge" to "Link" in schema_version 4.
         if schema_version < 4:
             table = "Edge"
         return super()._from_db(path, table)
 
+    def _link_index(self) -> LinkIndex:
+        """Return the adjacency index, rebuilding it when `df` was replaced."""
+        df = self.df
+        if df is not self._indexed_df or (
+            df is not None and len(df) + len(self._pending) != self._index.n_links
+        ):
+            self._index = LinkIndex(df)
+            self._index.update(
+                [row["from_node_id"] for row in self._pending],
+                [row["to_node_id"] for row in self._pending],
+                [row["link_type"] for row in self._pending],
+            )
+            self._indexed_df = df
+        return self._index
+
+    def _update_link_index(
+        self,
+        from_node_ids: Iterable[int],
+        to_node_ids: Iterable[int],
+        link_types: Iterable[str],
+        previous_df: Any,
+    ) -> None:
+        """Add new links to the index, if it was up to date before they were appended."""
+        if previous_df is self._indexed_df:
+            self._index.update(from_node_ids, to_node_ids, link_types)
+            self._indexed_df = self.df
+
     def add(
         self,
         from_node: NodeData,
@@ -112,28 +221,23 @@ class LinkTable(SpatialTableModel[LinkSchema]):
                 f"Node #{to_node.node_id} of type {to_node.node_type} cannot be downstream of node #{from_node.node_id} of type {from_node.node_type}. Possible downstream node types: {node_type_connectivity[from_node.node_type]}."
             )
 
-        if self.df is not None:
-            if (
-                "UserDemand" not in [from_node.node_type, to_node.node_type]
-                and not self.df[
-                    (self.df.from_node_id == to_node.node_id)
-                    & (self.df.to_node_id == from_node.node_id)
-                ].empty
-            ):
-                raise ValueError(
-                    f"Link ({from_node}, {to_node}) is not allowed since the opposite link already exists (this is only allowed for UserDemand)."
-                )
+        index = self._link_index()
+        if (
+            "UserDemand" not in [from_node.node_type, to_node.node_type]
+            and (to_node.node_id, from_node.node_id) in index.pairs
+        ):
+            raise ValueError(
+                f"Link ({from_node}, {to_node}) is not allowed since the opposite link already exists (this is only allowed for UserDemand)."
+            )
 
-        geometry_to_append = (
-            [LineString([from_node.geometry, to_node.geometry])]
-            if geometry is None
-            else [geometry]
-        )
         link_type = (
             "control" if from_node.node_type in SPATIALCONTROLNODETYPES else "flow"
         )
         self._validate_link(to_node, from_node, link_type)
-        assert self.df is not None
+        if (from_node.node_id, to_node.node_id) in index.pairs:
+            raise ValueError(
+                f"Links have to be unique, but link with from_node_id {from_node.node_id} to_node_id {to_node.node_id} already exists."
+            )
         if link_id is None:
             link_id = self._used_link_ids.new_id()
         elif link_id in self._used_link_ids:
@@ -141,37 +245,205 @@ class LinkTable(SpatialTableModel[LinkSchema]):
                 f"Link IDs have to be unique, but {link_id} already exists."
             )
 
-        table_to_append = GeoDataFrame[LinkSchema](
-            data={
-                "from_node_id": [from_node.node_id],
-                "to_node_id": [to_node.node_id],
-                "link_type": [link_type],
-                "name": [name],
+        self._pending.append(
+            {
+                "link_id": link_id,
+                "from_node_id": from_node.node_id,
+                "to_node_id": to_node.node_id,
+                "link_type": link_type,
+                "name": name,
                 **kwargs,
-            },
-            geometry=geometry_to_append,
-            crs=self.df.crs,
-            index=pd.Index([link_id], name="link_id"),
+                "geometry": LineString([from_node.geometry, to_node.geometry])
+                if geometry is None
+                else geometry,
+            }
         )
+        index.update([from_node.node_id], [to_node.node_id], [link_type])
+        self._used_link_ids.add(link_id)
+        if self._parent is None or self._parent._batch_depth == 0:
+            self._flush()
 
+    def _flush(self) -> None:
+        """Append all links buffered within `Model.batch` at once."""
+        if not self._pending:
+            return
+        assert self.df is not None
+        pending = self._pending
+        self._pending = []
+        table_to_append = GeoDataFrame[LinkSchema](
+            pd.DataFrame.from_records(pending, index="link_id"),
+            geometry="geometry",
+            crs=self.df.crs,
+        )
+        previous_df = self.df
         self.df = GeoDataFrame[LinkSchema](_concat([self.df, table_to_append]))
-        if self.df.duplicated(subset=["from_node_id", "to_node_id"]).any():
+        if previous_df is self._indexed_df:
+            self._indexed_df = self.df
+
+    def add_many(
+        self,
+        from_node_ids: ArrayLike,
+        to_node_ids: ArrayLike,
+        geometry: Sequence[LineString | MultiLineString] | None = None,
+        link_type: str | Sequence[str] | None = None,
+        name: str | Sequence[str] = "",
+    ) -> None:
+        """
+        Add many links between nodes at once.
+
+        This is much faster than calling `add` for each link,
+        since all links are validated together and appended to the table only once.
+
+        Parameters
+        ----------
+        from_node_ids : ArrayLike
+            The node IDs of the upstream nodes.
+        to_node_ids : ArrayLike
+            The node IDs of the downstream nodes.
+        geometry : Sequence[LineString | MultiLineString] | None
+            The geometries of the links. If not supplied, straight lines between the nodes are created.
+        link_type : str | Sequence[str] | None
+            The type of the links (flow or control).
+            It is inferred from the type of the upstream nodes as in `add`,
+            if supplied it is checked against that.
+        name : str | Sequence[str]
+            Optional names for the links.
+        """
+        if self._parent is None:
             raise ValueError(
-                f"Links have to be unique, but link with from_node_id {from_node.node_id} to_node_id {to_node.node_id} already exists."
+                "You can only add many links to a LinkTable when attached to a Model."
             )
-        self._used_link_ids.add(link_id)
+        # Validate against the nodes and links buffered in batch mode as well.
+        self._parent._flush()
+        assert self.df is not None
+
+        from_id = np.asarray(from_node_ids, dtype=np.int64)
+        to_id = np.asarray(to_node_ids, dtype=np.int64)
+        if from_id.shape != to_id.shape:
+            raise ValueError("from_node_ids and to_node_ids must have the same length.")
+        n = len(from_id)
+
+        node = self._parent._node_index()
+        from_index = node.index.get_indexer(from_id)
+        to_index = node.index.get_indexer(to_id)
+        missing = np.union1d(from_id[from_index == -1], to_id[to_index == -1])
+        if missing.size > 0:
+            raise ValueError(f"Nodes {missing.tolist()} do not exist.")
+
+        node_code = node.node_code
+        from_type = node.node_type[from_index]
+        to_type = node.node_type[to_index]
+
+        invalid = ~CONNECTIVITY[node_code[from_index], node_code[to_index]]
+        if invalid.any():
+            i = np.flatnonzero(invalid)[0]
+            raise ValueError(
+                f"Node #{to_id[i]} of type {to_type[i]} cannot be downstream of node #{from_id[i]} of type {from_type[i]}. Possible downstream node types: {node_type_connectivity[from_type[i]]}."
+            )
+
+        link_types = np.where(
+            np.isin(from_type, list(SPATIALCONTROLNODETYPES)), "control", "flow"
+        ).astype(object)
+        if link_type is not None:
+            given = np.broadcast_to(np.asarray(link_type, dtype=object), (n,))
+            mismatch = given != link_types
+            if mismatch.any():
+                i = np.flatnonzero(mismatch)[0]
+                raise ValueError(
+                    f"Link ({from_type[i]} #{from_id[i]}, {to_type[i]} #{to_id[i]}) must be a {link_types[i]} link, not {given[i]!r}."
+                )
+
+        key = _pair_key(from_id, to_id)
+        all_key = np.concatenate(
+            [_pair_key(self.df["from_node_id"], self.df["to_node_id"]), key]
+        )
+        opposite = np.isin(_pair_key(to_id, from_id), all_key) & (
+            (from_type != "UserDemand") & (to_type != "UserDemand")
+        )
+        if opposite.any():
+            i = np.flatnonzero(opposite)[0]
+            raise ValueError(
+                f"Link ({from_type[i]} #{from_id[i]}, {to_type[i]} #{to_id[i]}) is not allowed since the opposite link already exists (this is only allowed for UserDemand)."
+            )
+
+        all_from = np.concatenate([self.df["from_node_id"].to_numpy(), from_id])
+        all_to = np.concatenate([self.df["to_node_id"].to_numpy(), to_id])
+        all_link_type = np.concatenate(
+            [self.df["link_type"].to_numpy(dtype=object), link_types]
+        )
+        for type_, amount in (
+            ("flow", FLOW_LINK_NEIGHBOR_AMOUNT),
+            ("control", CONTROL_LINK_NEIGHBOR_AMOUNT),
+        ):
+            is_type = all_link_type == type_
+            for direction, all_ids, new_ids, column in (
+                ("in", all_to, to_id, 1),
+                ("out", all_from, from_id, 3),
+            ):
+                node_ids = np.unique(new_ids[link_types == type_])
+                count = (
+                    pd.Series(all_ids[is_type]).value_counts().reindex(node_ids)
+                ).to_numpy()
+                maximum = amount[node_code[node.index.get_indexer(node_ids)], column]
+                exceeded = count > maximum
+                if exceeded.any():
+                    i = np.flatnonzero(exceeded)[0]
+                    raise ValueError(
+                        f"Node {node_ids[i]} can have at most {maximum[i]} {type_} link {direction}neighbor(s) (got {count[i]})"
+                    )
+
+        duplicated = pd.Series(all_key).duplicated().to_numpy()[len(self.df) :]
+        if duplicated.any():
+            i = np.flatnonzero(duplicated)[0]
+            raise ValueError(
+                f"Links have to be unique, but link with from_node_id {from_id[i]} to_node_id {to_id[i]} already exists."
+            )
+
+        if geometry is None:
+            # Take the coordinates per link, get_coordinates would skip missing points
+            from_geometry = node.geometry[from_index]
+            to_geometry = node.geometry[to_index]
+            xy = np.stack(
+                [
+                    shapely.get_x(from_geometry),
+                    shapely.get_y(from_geometry),
+                    shapely.get_x(to_geometry),
+                    shapely.get_y(to_geometry),
+                ],
+                axis=1,
+            )
+            # The coordinates of missing and empty points are NaN
+            no_geometry = np.isnan(xy).any(axis=1)
+            if no_geometry.any():
+                i = np.flatnonzero(no_geometry)[0]
+                raise ValueError(
+                    f"Link ({from_type[i]} #{from_id[i]}, {to_type[i]} #{to_id[i]}) needs a geometry, since one of its nodes has none."
+                )
+            geometry = shapely.linestrings(xy.reshape(n, 2, 2))
+
+        link_ids = self._used_link_ids.new_ids(n)
+        table_to_append = GeoDataFrame[LinkSchema](
+            data={
+                "from_node_id": from_id,
+                "to_node_id": to_id,
+                "link_type": link_types,
+                "name": np.broadcast_to(np.asarray(name, dtype=object), (n,)),
+            },
+            geometry=geometry,
+            crs=self.df.crs,
+            index=pd.Index(link_ids, name="link_id"),
+        )
+        previous_df = self.df
+        self.df = GeoDataFrame[LinkSchema](_concat([self.df, table_to_append]))
+        self._update_link_index(
+            from_id.tolist(), to_id.tolist(), link_types.tolist(), previous_df
+        )
+        self._used_link_ids.update(link_ids)
 
     def _validate_link(self, to_node: NodeData, from_node: NodeData, link_type: str):
-        assert self.df is not None
-        in_neighbor: int = self.df.loc[
-            (self.df["to_node_id"] == to_node.node_id)
-            & (self.df["link_type"] == link_type)
-        ].shape[0]
-
-        out_neighbor: int = self.df.loc[
-            (self.df["from_node_id"] == from_node.node_id)
-            & (self.df["link_type"] == link_type)
-        ].shape[0]
+        index = self._link_index()
+        in_neighbor: int = index.in_degree[(to_node.node_id, link_type)]
+        out_neighbor: int = index.out_degree[(from_node.node_id, link_type)]
         # validation on neighbor amount
         max_in_flow: int = flow_link_neighbor_amount[to_node.node_type][1]
         max_out_flow: int = flow_link_neighbor_amount[from_node.node_type][3]
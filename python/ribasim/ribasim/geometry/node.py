@@ -43,7 +43,9 @@ class NodeTable(SpatialTableModel[NodeSchema]):
         """Filter the node table based on the node type."""
         if self.df is not None:
             mask = self.df[self.df["node_type"] != nodetype].index
-            self.df.drop(mask, inplace=True)
+            if len(mask) > 0:
+                self.df.drop(mask, inplace=True)
+                self._edited()
 
     def plot_allocation_networks(self, ax=None, zorder=None) -> Any:
         if ax is None:
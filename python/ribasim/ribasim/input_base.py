@@ -1,29 +1,30 @@
 import operator
+import os
 import re
-import warnings
+import shutil
 from abc import ABC, abstractmethod
-from collections.abc import Callable, Generator
-from contextlib import closing
+from collections.abc import Callable, Generator, Hashable
 from contextvars import ContextVar
 from pathlib import Path
-from sqlite3 import connect
+from sqlite3 import Connection
 from typing import (
     Any,
+    ClassVar,
     Generic,
+    Literal,
+    NamedTuple,
     TypeVar,
     cast,
 )
 
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-    import datacompy
-
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import pydantic
 from pandera.typing import DataFrame
 from pandera.typing.geopandas import GeoDataFrame
+from pyarrow import feather
 from pydantic import BaseModel as PydanticBaseModel
 from pydantic import (
     ConfigDict,
@@ -31,6 +32,7 @@ from pydantic import (
     Field,
     PrivateAttr,
     ValidationInfo,
+    ValidatorFunctionWrapHandler,
     field_validator,
     model_serializer,
     model_validator,
@@ -38,15 +40,27 @@ from pydantic import (
 )
 
 import ribasim
+from ribasim.bundle import _read_table as _read_bundle_table
+from ribasim.bundle import _table_path
+from ribasim.cache import _table_filename
 from ribasim.db_utils import (
-    _get_db_schema_version,
+    _copy_table,
+    _DatabaseInfo,
+    _read_arrow_table,
+    _read_database_info,
     _set_gpkg_attribute_table,
-    esc_id,
-    exists,
+    _write_transaction,
 )
+from ribasim.diff import _diff_tables
 from ribasim.schemas import _BaseSchema
-
-from .styles import _add_styles_to_geopackage
+from ribasim.utils import (
+    _content_hash,
+    _file_stamp,
+    _from_arrow_table,
+    _from_ipc,
+    _to_arrow_table,
+    _to_ipc,
+)
 
 __all__ = ("TableModel",)
 
@@ -78,6 +92,17 @@ context_file_writing: ContextVar[dict[str, Any]] = ContextVar(
 TableT = TypeVar("TableT", bound=_BaseSchema)
 
 
+def _database_info(db_path: Path) -> _DatabaseInfo:
+    """Get the metadata of a GeoPackage.
+
+    During `Model.read` this is read once and kept in the loading context.
+    """
+    context = context_file_loading.get()
+    if context.get("database") == db_path and "database_info" in context:
+        return context["database_info"]
+    return _read_database_info(db_path)
+
+
 class BaseModel(PydanticBaseModel):
     """Overrides Pydantic BaseModel to set our own config."""
 
@@ -94,11 +119,31 @@ class BaseModel(PydanticBaseModel):
         """Return the names of the fields contained in the Model."""
         return list(cls.model_fields.keys())
 
+    # Private attributes that are not pickled but reset to their default,
+    # like references to the parent and caches.
+    _unpickled: ClassVar[frozenset[str]] = frozenset()
+
     def model_dump(self, **kwargs) -> dict[str, Any]:
         return super().model_dump(serialize_as_any=True, **kwargs)
 
+    def __getstate__(self) -> dict[Any, Any]:
+        state = super().__getstate__()
+        private = state["__pydantic_private__"]
+        if private:
+            state["__pydantic_private__"] = {
+                name: self.__private_attributes__[name].get_default()
+                if name in self._unpickled
+                else value
+                for name, value in private.items()
+            }
+        return state
+
     def diff(
-        self, other: "BaseModel", ignore_meta: bool = False
+        self,
+        other: "BaseModel",
+        ignore_meta: bool = False,
+        rtol: float = 0.0,
+        atol: float = 0.0,
     ) -> dict[str, Any] | None:
         """
         Compare two instances of a BaseModel.
@@ -108,23 +153,26 @@ class BaseModel(PydanticBaseModel):
         If they are equal, return None. Otherwise, return a nested dictionary with the differences.
         When the differences are not a DataFrame (like the toml config),
         the dict has self and other as key.
-        For DataFrames we return a dict with diff as key, and a datacompy Comparison object.
+        For DataFrames we return a dict with diff as key, and a `TableDiff` object,
+        which holds the rows that were added, removed or changed.
 
         When ignore_meta is set to True, the meta_* columns in the DataFrames are ignored.
         Note that in that case the key will still be returned and the value will be None.
+        Floats in the DataFrames are taken to be equal within the relative and absolute
+        tolerance rtol and atol, see `numpy.isclose`.
 
         Examples
         --------
         >>> nbasic == basic
         False
         >>> x = nbasic.diff(basic)
-        {'basin': {'node': {'diff': <datacompy.core.Compare object at 0x16e5a45c0>},
-                'static': {'diff': <datacompy.core.Compare object at 0x16eb90080>}},
+        {'basin': {'node': {'diff': TableDiff(keys=['node_id'], ...)},
+                'static': {'diff': TableDiff(keys=['node_id'], ...)}},
         'solver': {'saveat': {'other': 86400.0, 'self': 0.0}}}
-        >>> x["basin"]["static"]["diff"].report()
-        DataComPy Comparison
-        --------------------
-        ...
+        >>> print(x["basin"]["static"]["diff"].report())
+        Rows aligned on: node_id
+        Rows only in self: 1
+        Rows only in other: 0
         """
         if not (isinstance(other, self.__class__)):
             raise ValueError(f"Cannot compare {self} with {other}")
@@ -138,8 +186,7 @@ class BaseModel(PydanticBaseModel):
                 continue
             if isinstance(self_attr, BaseModel):
                 data[key] = self_attr.diff(
-                    other_attr,
-                    ignore_meta=ignore_meta,
+                    other_attr, ignore_meta=ignore_meta, rtol=rtol, atol=atol
                 )
             else:
                 data[key] = {"self": self_attr, "other": other_attr}
@@ -261,45 +308,312 @@ class FileModel(BaseModel, ABC):
         raise NotImplementedError()
 
 
+class _TableSource(NamedTuple):
+    """The file a table is read from when its DataFrame is first accessed."""
+
+    path: Path
+    # The name of the table in the GeoPackage, or None for Arrow files
+    table: str | None
+    schema_version: int
+    # Whether an Arrow file is memory mapped instead of read into memory
+    memory_map: bool = False
+    # The validated copy of the table in the cache of `Model.read`
+    cache: pa.Table | None = None
+    # Whether the Arrow file is part of a bundle, see `ribasim.bundle`
+    bundle: bool = False
+
+
+class _SharedFrame:
+    """A DataFrame that is shared by the tables of a model and its clones.
+
+    Each table copies it when its `df` is first accessed, except the last one.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.holders = 0
+
+
+ArrowCompression = Literal["zstd", "lz4", "uncompressed"]
+ModelFormat = Literal["geopackage", "bundle"]
+
+
+def _write_feather(
+    data: pd.DataFrame | pa.Table, path: Path, compression: ArrowCompression
+) -> None:
+    """Write an Arrow file next to `path` and then move it in place.
+
+    On POSIX a DataFrame that memory maps the old file keeps its data,
+    even if it is the DataFrame that is written.
+    Windows cannot replace a file that is memory mapped,
+    see `TableModel._release_memory_map`.
+    """
+    temp_path = path.with_name(f".{path.name}")
+    compression_level = 6 if compression == "zstd" else None
+    feather.write_feather(
+        data, temp_path, compression=compression, compression_level=compression_level
+    )
+    try:
+        os.replace(temp_path, path)
+    except OSError as e:
+        temp_path.unlink(missing_ok=True)
+        if os.name != "nt":
+            raise
+        raise PermissionError(
+            f"Cannot replace '{path}', it may be memory mapped by a DataFrame of a model "
+            "read with `memory_map=True`. Delete such DataFrames first, or write elsewhere."
+        ) from e
+
+
 class TableModel(FileModel, Generic[TableT]):
     df: DataFrame[TableT] | None = Field(default=None, exclude=True, repr=False)
     _sort_keys: list[str] = PrivateAttr(default=[])
+    # Whether the table is only read from file when `df` is first accessed
+    _lazy: ClassVar[bool] = True
+    _source: _TableSource | None = PrivateAttr(default=None)
+    # The file the table was last read from or written to, with the size and
+    # modification time of the file and the edit key of the table, see `_is_synced`.
+    _synced: tuple[Path, tuple[int, int] | None, tuple[Hashable, ...]] | None = (
+        PrivateAttr(default=None)
+    )
+    # The DataFrame shared with the tables of clones until `df` is accessed, see `Model.clone`.
+    _shared: _SharedFrame | None = PrivateAttr(default=None)
+    # The Arrow file that `df` may refer to, if it was read with `memory_map=True`.
+    _memory_map: Path | None = PrivateAttr(default=None)
+    # The number of times `df` was assigned or edited in place, see `_edit_key`.
+    _version: int = PrivateAttr(default=0)
+    # The hash of the content of `df`, with the edit key it was computed for.
+    _hash: tuple[tuple[Hashable, ...], str] | None = PrivateAttr(default=None)
+    _unpickled: ClassVar[frozenset[str]] = frozenset(
+        {"_shared", "_memory_map", "_hash"}
+    )
+
+    @field_validator("df", mode="wrap")
+    @classmethod
+    def _defer_loading(cls, v: Any, handler: ValidatorFunctionWrapHandler) -> Any:
+        # `_load` gives a source instead of a DataFrame for tables that are read lazily,
+        # which is moved out of `df` by `_set_source`.
+        if isinstance(v, _TableSource):
+            return v
+        return handler(v)
+
+    @model_validator(mode="after")
+    def _set_source(self) -> "TableModel[TableT]":
+        # Until the table is read, `df` is missing from the instance dict, see `__getattr__`.
+        # Assigning a DataFrame replaces the source.
+        if "df" in self.__dict__:
+            df = self.__dict__["df"]
+            if isinstance(df, _TableSource):
+                del self.__dict__["df"]
+                self._source = df
+            else:
+                self._source = None
+            if self._shared is not None:
+                self._shared.holders -= 1
+                self._shared = None
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "df" and self._source is not None:
+            # The source is only dropped once the table is read,
+            # so a read that fails raises the same error when it is tried again
+            source = self._source
+            if source.cache is not None or (
+                source.bundle and source.schema_version == ribasim.__schema_version__
+            ):
+                # Cached tables and the tables of a bundle of this schema version
+                # were validated before they were written
+                self.__dict__["df"] = self._read(source)
+                self._source = None
+            else:
+                self.df = cast("DataFrame[TableT] | None", self._read(source))
+            if source.memory_map:
+                self._memory_map = source.path.resolve()
+            if source.schema_version == ribasim.__schema_version__:
+                self._mark_synced(source.path)
+            return self.__dict__["df"]
+        if name == "df" and self._shared is not None:
+            shared = self._shared
+            shared.holders -= 1
+            self._shared = None
+            # The last table to access the DataFrame can take it as is
+            self.__dict__["df"] = shared.df if shared.holders == 0 else shared.df.copy()
+            return self.__dict__["df"]
+        return super().__getattr__(name)  # type: ignore[misc]
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name == "df":
+            self._version += 1
+
+    def _edit_key(self) -> tuple[Hashable, ...]:
+        """Return a cheap signal that changes whenever `df` is assigned.
+
+        It is the identity of `df`, the number of assignments, the shape and the columns,
+        so caches keyed on it don't have to look at the data.
+        Edits of values in place, like ``table.df.loc[0, "level"] = 1.0``, are not seen,
+        until `df` is assigned again, e.g. ``table.df = table.df``.
+        """
+        df = self.df
+        if df is None:
+            return (None, self._version)
+        return id(df), self._version, df.shape, tuple(df.columns)
+
+    def _edited(self) -> None:
+        """Record that `df` was edited in place, see `_edit_key`."""
+        self._version += 1
+
+    def _share(self, shared: _SharedFrame) -> None:
+        """Let the table copy `df` from `shared` when it is first accessed, see `Model.clone`."""
+        self.__dict__.pop("df", None)
+        self._version += 1
+        shared.holders += 1
+        self._shared = shared
+
+    def _release_memory_map(self, path: Path) -> None:
+        """Copy `df` into memory if it may refer to the memory mapped file at `path`.
+
+        This is only needed on Windows, which cannot replace a file that is memory mapped.
+        DataFrames derived from `df` may still refer to the file,
+        in which case `_write_feather` raises.
+        """
+        if os.name != "nt" or self._memory_map != path.resolve():
+            return
+        df = self.df
+        if df is not None:
+            self.__dict__["df"] = _from_ipc(_to_ipc(df))
+        self._memory_map = None
+
+    def _has_data(self) -> bool:
+        """Check whether the table contains data, without reading it."""
+        return (
+            self._source is not None or self._shared is not None or self.df is not None
+        )
+
+    def _unread_source(self) -> _TableSource | None:
+        """Return the source if the table was not read, and can be copied as is."""
+        source = self._source
+        if source is not None and source.schema_version == ribasim.__schema_version__:
+            return source
+        return None
+
+    def _mark_synced(self, path: Path) -> None:
+        """Record that `path` holds the current content of the table.
+
+        Only the file and the edit key are recorded, so this does not look at the data.
+        """
+        if self._source is None and self.df is not None:
+            path = path.resolve()
+            self._synced = (path, _file_stamp(path), self._edit_key())
+        else:
+            self._synced = None
+
+    def _is_synced(self, path: Path) -> bool:
+        """Check whether the table is unchanged since it was read from or written to `path`.
+
+        That is, `path` was not modified since, and `df` was not assigned, see `_edit_key`.
+        """
+        path = path.resolve()
+        source = self._unread_source()
+        if source is not None:
+            return source.path.resolve() == path
+        return self._synced is not None and self._synced == (
+            path,
+            _file_stamp(path),
+            self._edit_key(),
+        )
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Generic classes like TableModel[BasinStaticSchema] are not found by name
+        # when unpickling, so they are created again from their origin and arguments.
+        metadata = type(self).__pydantic_generic_metadata__
+        origin = metadata["origin"] or type(self)
+        return (_new_table_model, (origin, metadata["args"]), self.__getstate__())
+
+    def __getstate__(self) -> dict[Any, Any]:
+        if self._source is not None or self._shared is not None:
+            # Read the table now, since its file may be gone when it is unpickled
+            self.df
+        state = super().__getstate__()
+        df = state["__dict__"].get("df")
+        if df is not None:
+            # With pickle protocol 5 the Arrow buffers are passed out-of-band
+            state["__dict__"] = {**state["__dict__"], "df": _to_ipc(df)}
+        return state
+
+    def __setstate__(self, state: dict[Any, Any]) -> None:
+        df = state["__dict__"].get("df")
+        if isinstance(df, pa.Buffer):
+            state["__dict__"] = {**state["__dict__"], "df": _from_ipc(df)}
+        super().__setstate__(state)
+
+    def content_hash(self) -> str | None:
+        """Return a hash of the content of the table, or None if it has no data.
+
+        The hash covers the values, the index, the column names and the dtypes,
+        and is the same for equal tables, also across sessions.
+        It is cached until `df` is assigned or changes shape, so edits of values in place,
+        like ``table.df.loc[0, "level"] = 1.0``, are only seen after ``table.df = table.df``.
+        """
+        df = self.df
+        if df is None:
+            return None
+        key = self._edit_key()
+        if self._hash is None or self._hash[0] != key:
+            self._hash = (key, _content_hash(df))
+        return self._hash[1]
+
+    def _same_source(self, other: "TableModel[Any]") -> bool:
+        """Check whether both tables are still to be read from the same file."""
+        source = self._unread_source()
+        other_source = other._unread_source()
+        return (
+            source is not None
+            and other_source is not None
+            and source.path.resolve() == other_source.path.resolve()
+            and source.table == other_source.table
+        )
 
     def __eq__(self, other: Any) -> bool:
         if isinstance(other, TableModel):
+            if self._same_source(other):
+                return True
             if self.df is None and other.df is None:
                 return True
             if self.df is None or other.df is None:
                 return False
-            else:
-                return self.df.equals(other.df)
+            return self.content_hash() == other.content_hash()
 
         return NotImplemented
 
-    def diff(self, other: BaseModel, ignore_meta=False) -> dict[str, Any] | None:
+    def diff(
+        self,
+        other: BaseModel,
+        ignore_meta: bool = False,
+        rtol: float = 0.0,
+        atol: float = 0.0,
+    ) -> dict[str, Any] | None:
         # Only diff with other TableModel[TableT] instances
         if not (isinstance(other, self.__class__)):
             raise ValueError(f"Cannot compare {self} with {other}")
-        # Both are None
-        if self.df is None and other.df is None:
+        # Both are None, or the same
+        if self._same_source(other) or (self.df is None and other.df is None):
             return None
         # Both are DataFrames
         elif self.df is not None and other.df is not None:
-            # Differences might've been in the meta columns
-            # so we check if the DataFrames are equal again
-            if ignore_meta:
-                a = self.df.loc[:, self.columns()]
-                b = other.df.loc[:, self.columns()]
-                if a.equals(b):
-                    return None
-            else:
-                a = self.df
-                b = other.df
-
-            comp = datacompy.Compare(
-                a, b, on_index=True, df1_name="self", df2_name="other"
+            if self.content_hash() == other.content_hash():
+                return None
+            # Differences might've been in the meta columns,
+            # or within the tolerance, in which case there is no diff
+            table_diff = _diff_tables(
+                self.df,
+                other.df,
+                self._sort_keys,
+                columns=self.columns() if ignore_meta else None,
+                rtol=rtol,
+                atol=atol,
             )
-            return {"diff": comp}
+            return {"diff": table_diff} if table_diff else None
         # One of the instances is None
         else:
             return {"self": self.df, "other": other.df}
@@ -309,12 +623,6 @@ class TableModel(FileModel, Generic[TableT]):
     def _check_schema(cls, v: DataFrame[TableT]):
         """Allow only extra columns with `meta_` prefix."""
         if isinstance(v, pd.DataFrame | gpd.GeoDataFrame):
-            # On reading from geopackage, migrate the tables when necessary
-            db_path = context_file_loading.get().get("database")
-            if db_path is not None:
-                version = _get_db_schema_version(db_path)
-                if version < ribasim.__schema_version__:
-                    v = cls.tableschema().migrate(v, version)
             for colname in v.columns:
                 if colname not in cls.columns() and not colname.startswith("meta_"):
                     raise ValueError(
@@ -370,22 +678,70 @@ class TableModel(FileModel, Generic[TableT]):
     @classmethod
     def _load(cls, filepath: Path | None) -> dict[str, Any]:
         db = context_file_loading.get().get("database")
-        if filepath is not None and db is not None:
-            adf = cls._from_arrow(filepath)
-            # TODO Store filepath?
-            return {"df": adf}
-        elif db is not None:
-            ddf = cls._from_db(db, cls.tablename())
-            return {"df": ddf}
-        else:
+        bundle = context_file_loading.get().get("bundle")
+        if bundle is not None:
+            if filepath is not None:
+                directory = context_file_loading.get().get("directory", Path("."))
+                source = _TableSource(directory / filepath, None, bundle.schema_version)
+            else:
+                path = _table_path(bundle, cls.tablename())
+                if path is None:
+                    return {"df": None}
+                # Like cached tables, the tables of a bundle are read lazily,
+                # including the spatial ones
+                source = _TableSource(path, None, bundle.schema_version, bundle=True)
+            return {"df": source if cls._lazy or source.bundle else cls._read(source)}
+        if db is None:
             return {}
 
+        info = _database_info(db)
+        if filepath is not None:
+            directory = context_file_loading.get().get("directory", Path("."))
+            source = _TableSource(directory / filepath, None, info.schema_version)
+        else:
+            source = _TableSource(db, cls.tablename(), info.schema_version)
+
+        cache = context_file_loading.get().get("cache")
+        if cache is not None:
+            # Cached tables are read lazily, including the spatial ones
+            cached = cache.get(_table_filename(cls.tablename()))
+            return {"df": None if cached is None else source._replace(cache=cached)}
+
+        if cls._lazy and source.table is not None and source.table not in info.tables:
+            return {"df": None}
+
+        if cls._lazy:
+            return {"df": source}
+        else:
+            return {"df": cls._read(source)}
+
+    @classmethod
+    def _read(cls, source: _TableSource) -> pd.DataFrame | None:
+        """Read the table from its source, migrating it when necessary."""
+        df: pd.DataFrame | None
+        if source.cache is not None:
+            return _from_arrow_table(source.cache)
+        if source.bundle:
+            df = _read_bundle_table(source.path, memory_map=source.memory_map)
+        elif source.table is None:
+            df = cls._from_arrow(source.path, source.memory_map)
+        else:
+            df = cls._from_db(source.path, source.table)
+        if df is not None and source.schema_version < ribasim.__schema_version__:
+            df = cls.tableschema().migrate(df, source.schema_version)
+        return df
+
     def _save(self, directory: DirectoryPath, input_dir: DirectoryPath) -> None:
         # TODO directory could be used to save an arrow file
         db_path = context_file_writing.get().get("database")
-        self.sort()
+        bundle_path = context_file_writing.get().get("bundle")
+        # Tables that were not read are still sorted as they were written
+        if self._unread_source() is None:
+            self.sort()
         if self.filepath is not None:
             self._write_arrow(self.filepath, directory, input_dir)
+        elif bundle_path is not None:
+            self._write_bundle(bundle_path)
         elif db_path is not None:
             self._write_geopackage(db_path)
 
@@ -393,15 +749,28 @@ class TableModel(FileModel, Generic[TableT]):
         """
         Write the contents of the input to a database.
 
+        During `Model.write` all tables share a single connection and transaction.
+        Otherwise a connection is opened for this table only.
+
         Parameters
         ----------
-        connection : Connection
-            SQLite connection to the database.
+        temp_path : Path
+            Path to the GeoPackage.
         """
-        assert self.df is not None
-        table = self.tablename()
+        connection = context_file_writing.get().get("connection")
+        if connection is None:
+            with _write_transaction(temp_path) as connection:
+                self._write_table(connection)
+        else:
+            self._write_table(connection)
 
-        with closing(connect(temp_path)) as connection:
+    def _write_table(self, connection: Connection) -> None:
+        table = self.tablename()
+        source = self._unread_source()
+        if source is not None and source.table is not None:
+            _copy_table(connection, source.path, source.table)
+        else:
+            assert self.df is not None
             self.df.to_sql(
                 table,
                 connection,
@@ -409,44 +778,73 @@ class TableModel(FileModel, Generic[TableT]):
                 if_exists="replace",
                 dtype={"fid": "INTEGER PRIMARY KEY AUTOINCREMENT"},
             )
-
-            _set_gpkg_attribute_table(connection, table)
-            # Set geopackage attribute table
+        # Set geopackage attribute table
+        _set_gpkg_attribute_table(connection, table)
 
     def _write_arrow(self, filepath: Path, directory: Path, input_dir: Path) -> None:
-        """Write the contents of the input to a an arrow file."""
-        assert self.df is not None
+        """Write the contents of the input to a an arrow file.
+
+        Unless `Model.write` is given a compression, files of tables that were
+        not read are copied as is, and other tables are compressed with zstd.
+        """
         path = directory / input_dir / filepath
         path.parent.mkdir(parents=True, exist_ok=True)
-        self.df.to_feather(
-            path,
-            compression="zstd",
-            compression_level=6,
-        )
+        compression = context_file_writing.get().get("arrow_compression")
+        source = self._unread_source()
+        if source is not None and source.table is None:
+            if compression is None:
+                if not (path.exists() and path.samefile(source.path)):
+                    # The file may be a hard link, see `Model.write_scenarios`,
+                    # so replace it instead of writing into it.
+                    path.unlink(missing_ok=True)
+                    shutil.copyfile(source.path, path)
+            else:
+                # Recompress without converting to pandas.
+                # Not memory mapped, since Windows cannot replace the file if it is the same.
+                table = feather.read_table(source.path, memory_map=False)
+                _write_feather(table, path, compression)
+            return
+        self._release_memory_map(path)
+        assert self.df is not None
+        _write_feather(self.df, path, compression or "zstd")
+
+    def _write_bundle(self, bundle_path: Path) -> None:
+        """Write the table to its Arrow file in a bundle, see `ribasim.bundle`.
+
+        The tables keep their dtypes, and geometries are written as WKB.
+        Unless `Model.write` is given a compression, files are written uncompressed,
+        and the files of tables that were not read are copied as is.
+        """
+        path = bundle_path / _table_filename(self.tablename())
+        compression = context_file_writing.get().get("arrow_compression")
+        source = self._unread_source()
+        if source is not None and source.bundle and compression is None:
+            if not (path.exists() and path.samefile(source.path)):
+                path.unlink(missing_ok=True)
+                shutil.copyfile(source.path, path)
+            return
+        self._release_memory_map(path)
+        assert self.df is not None
+        _write_feather(_to_arrow_table(self.df), path, compression or "uncompressed")
 
     @classmethod
     def _from_db(cls, path: Path, table: str) -> pd.DataFrame | None:
-        with closing(connect(path)) as connection:
-            if exists(connection, table):
-                query = f"select * from {esc_id(table)}"
-                df = pd.read_sql_query(
-                    query,
-                    connection,
-                    # we store TIMESTAMP in SQLite like "2025-05-29 14:16:00"
-                    # see https://www.sqlite.org/lang_datefunc.html
-                    parse_dates={"time": {"format": "ISO8601"}},
-                    dtype_backend="pyarrow",
-                )
-                df.set_index("fid", inplace=True)
-            else:
-                df = None
-
-            return df
+        if table not in _database_info(path).tables:
+            return None
+        arrow_table = _read_arrow_table(path, table, cls._arrow_types())
+        df = arrow_table.to_pandas(types_mapper=pd.ArrowDtype)
+        df.index = pd.Index(df.pop("fid").to_numpy(dtype=np.int32), name="fid")
+        return df
 
     @classmethod
-    def _from_arrow(cls, path: Path) -> pd.DataFrame:
-        directory = context_file_loading.get().get("directory", Path("."))
-        return pd.read_feather(directory / path, dtype_backend="pyarrow")
+    def _from_arrow(cls, path: Path, memory_map: bool = False) -> pd.DataFrame:
+        """Read an Arrow file into a DataFrame with pyarrow dtypes.
+
+        If the file is memory mapped and uncompressed,
+        the DataFrame refers to the pages of the file instead of copying them.
+        """
+        table = feather.read_table(path, memory_map=memory_map)
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
 
     def sort(self):
         """Sort the table as required.
@@ -469,6 +867,18 @@ class TableModel(FileModel, Generic[TableT]):
         T: TableT = fieldtype.__args__[0]
         return T
 
+    @classmethod
+    def _arrow_types(cls) -> dict[str, pa.DataType]:
+        """Retrieve the Arrow types of the columns, as required by the schema."""
+        columns = cls.tableschema().to_schema().columns
+        types = {
+            name: column.dtype.type.pyarrow_dtype
+            for name, column in columns.items()
+            if isinstance(column.dtype.type, pd.ArrowDtype)
+        }
+        types["fid"] = pa.int32()
+        return types
+
     @classmethod
     def columns(cls) -> list[str]:
         """Retrieve column names."""
@@ -501,57 +911,69 @@ class TableModel(FileModel, Generic[TableT]):
         return self.df.loc[self.df["node_id"].isin(np_index), :]
 
 
+def _new_table_model(
+    origin: type[TableModel[Any]], args: tuple[Any, ...]
+) -> TableModel[Any]:
+    cls = origin[args] if args else origin  # type: ignore[index]
+    return cls.__new__(cls)
+
+
 class SpatialTableModel(TableModel[TableT], Generic[TableT]):
     df: GeoDataFrame[TableT] | None = Field(default=None, exclude=True, repr=False)
+    # Spatial tables are written by pyogrio, and the nodes and links are needed right away
+    _lazy: ClassVar[bool] = False
 
     def sort(self):
         # Only sort the index (node_id / link_id) since this needs to be sorted in a GeoPackage.
         # Under most circumstances, this retains the input order,
         # making the link_id as stable as possible; useful for post-processing.
-        self.df.sort_index(inplace=True)
+        if not self.df.index.is_monotonic_increasing:
+            self.df.sort_index(inplace=True)
+            self._edited()
 
     @classmethod
     def _from_db(cls, path: Path, table: str):
-        with closing(connect(path)) as connection:
-            if exists(connection, table):
-                # pyogrio hardcodes fid name on reading
-                df = gpd.read_file(
-                    path,
-                    layer=table,
-                    engine="pyogrio",
-                    fid_as_index=True,
-                    use_arrow=True,
-                    # tell pyarrow to map to pd.ArrowDtype rather than NumPy
-                    arrow_to_pandas_kwargs={"types_mapper": pd.ArrowDtype},
-                )
-            else:
-                df = None
-
-            return df
+        # Spatial layers are registered in gpkg_contents
+        if table not in _database_info(path).contents:
+            return None
+        # pyogrio hardcodes fid name on reading
+        return gpd.read_file(
+            path,
+            layer=table,
+            engine="pyogrio",
+            fid_as_index=True,
+            use_arrow=True,
+            # tell pyarrow to map to pd.ArrowDtype rather than NumPy
+            arrow_to_pandas_kwargs={"types_mapper": pd.ArrowDtype},
+        )
 
-    def _write_geopackage(self, path: Path) -> None:
+    def _write_geopackage(self, temp_path: Path) -> None:
         """
         Write the contents of the input to the GeoPackage.
 
+        Spatial layers are written by pyogrio with its own connection,
+        so this has to happen before the shared connection of `Model.write` is opened.
+
         Parameters
         ----------
-        path : Path
+        temp_path : Path
+            Path to the GeoPackage.
         """
         assert self.df is not None
         self.df.to_file(
-            path,
+            temp_path,
             layer=self.tablename(),
             driver="GPKG",
             index=True,
             fid=self.df.index.name,
             engine="pyogrio",
         )
-        _add_styles_to_geopackage(path, self.tablename())
 
 
 class ChildModel(BaseModel):
     _parent: Any | None = None
     _parent_field: str | None = None
+    _unpickled: ClassVar[frozenset[str]] = frozenset({"_parent"})
 
     @model_validator(mode="after")
     def _check_parent(self) -> "ChildModel":
@@ -596,7 +1018,7 @@ class NodeModel(ChildModel):
             attr = getattr(self, key)
             if (
                 isinstance(attr, TableModel)
-                and (attr.df is not None)
+                and attr._has_data()
                 and not (isinstance(attr, ribasim.geometry.node.NodeTable))
             ):
                 yield attr
@@ -607,9 +1029,35 @@ class NodeModel(ChildModel):
             node_ids.update(table._node_ids())
         return node_ids
 
-    def _save(self, directory: DirectoryPath, input_dir: DirectoryPath):
-        for table in self._tables():
-            table._save(directory, input_dir)
+    def _save(
+        self,
+        directory: DirectoryPath,
+        input_dir: DirectoryPath,
+        spatial: bool = False,
+        synced: Path | None = None,
+    ):
+        """Save either the spatial tables or the other tables of this node type to the GeoPackage.
+
+        Tables that are stored in Arrow files are saved separately, see `_arrow_tables`.
+        Tables that are unchanged since they were read from or written to
+        the GeoPackage `synced` are skipped.
+        """
+        for table in self._gpkg_tables(spatial):
+            if synced is None or not table._is_synced(synced):
+                table._save(directory, input_dir)
+
+    def _gpkg_tables(self, spatial: bool) -> list[TableModel[Any]]:
+        """Return either the spatial tables or the other tables that are stored in the GeoPackage."""
+        return [
+            table
+            for table in self._tables()
+            if table.filepath is None
+            and isinstance(table, SpatialTableModel) == spatial
+        ]
+
+    def _arrow_tables(self) -> list[TableModel[Any]]:
+        """Return the tables of this node type that are stored in Arrow files."""
+        return [table for table in self._tables() if table.filepath is not None]
 
     def _repr_content(self) -> str:
         """Generate a succinct overview of the content.
@@ -620,7 +1068,7 @@ class NodeModel(ChildModel):
         for field in self._fields():
             attr = getattr(self, field)
             if isinstance(attr, TableModel):
-                if attr.df is not None:
+                if attr._has_data():
                     content.append(field)
             else:
                 content.append(field)
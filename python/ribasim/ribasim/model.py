@@ -1,16 +1,24 @@
 import datetime
+import hashlib
+import json
 import logging
+import os
+import pickle
 import shutil
-from collections.abc import Generator
+from collections.abc import Generator, Hashable, Mapping
+from contextlib import contextmanager
+from contextvars import copy_context
 from os import PathLike
 from pathlib import Path
-from typing import Any
+from typing import Any, ClassVar, cast
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import tomli
 import tomli_w
 from matplotlib import pyplot as plt
+from pandera.typing import DataFrame
 from pandera.typing.geopandas import GeoDataFrame
 from pydantic import (
     DirectoryPath,
@@ -21,6 +29,8 @@ from pydantic import (
 )
 
 import ribasim
+from ribasim import bundle as _bundle
+from ribasim import cache as _cache
 from ribasim.config import (
     Allocation,
     Basin,
@@ -44,24 +54,37 @@ from ribasim.config import (
     Terminal,
     UserDemand,
 )
-from ribasim.db_utils import _set_db_schema_version
-from ribasim.geometry.link import LinkSchema, LinkTable
+from ribasim.db_utils import (
+    METADATA_TABLES,
+    _drop_table,
+    _get_attribute_tables,
+    _get_feature_layers,
+    _read_database_info,
+    _write_db_schema_version,
+    _write_transaction,
+)
+from ribasim.geometry.link import LinkSchema, LinkTable, NodeIndex
 from ribasim.geometry.node import NodeTable
 from ribasim.input_base import (
+    ArrowCompression,
     ChildModel,
     FileModel,
+    ModelFormat,
+    NodeModel,
     SpatialTableModel,
+    TableModel,
+    _SharedFrame,
     context_file_loading,
     context_file_writing,
 )
+from ribasim.results import ResultsReader
+from ribasim.styles import _add_styles_to_geopackage
 from ribasim.utils import (
     MissingOptionalModule,
     UsedIDs,
     _concat,
-    _link_lookup,
-    _node_lookup,
+    _executor,
     _node_lookup_numpy,
-    _time_in_ns,
 )
 from ribasim.validation import control_link_neighbor_amount, flow_link_neighbor_amount
 
@@ -111,28 +134,84 @@ class Model(FileModel):
     use_validation: bool = Field(default=True, exclude=True)
 
     _used_node_ids: UsedIDs = PrivateAttr(default_factory=UsedIDs)
+    _batch_depth: int = PrivateAttr(default=0)
+    # The edit keys of the node tables of all node types, the NodeTable computed from them
+    # and its index.
+    _node_table_cache: (
+        tuple[list[tuple[Hashable, ...]], NodeTable, NodeIndex] | None
+    ) = PrivateAttr(default=None)
+    _unpickled: ClassVar[frozenset[str]] = frozenset({"_node_table_cache"})
 
     @model_validator(mode="after")
     def _set_node_parent(self) -> "Model":
+        self._set_parents()
+        return self
+
+    def __getstate__(self) -> dict[Any, Any]:
+        self._flush()
+        return super().__getstate__()
+
+    def __setstate__(self, state: dict[Any, Any]) -> None:
+        super().__setstate__(state)
+        self._set_parents()
+
+    def to_ipc_bytes(self) -> bytes:
+        """Serialize the model, with all tables as Arrow IPC streams.
+
+        This is a cheap way to pass a model to another process, for instance through
+        shared memory, where `from_ipc_bytes` reads it without copying the tables.
+        Tables that were not read yet from the files of the model are read first,
+        so the result doesn't depend on these files.
+        Pickling a model with protocol 5 similarly passes the tables as out-of-band buffers.
+        """
+        buffers: list[pickle.PickleBuffer] = []
+        data = pickle.dumps(self, protocol=5, buffer_callback=buffers.append)
+        column = pa.array(
+            [data, *(buffer.raw() for buffer in buffers)], type=pa.large_binary()
+        )
+        table = pa.table({"buffer": column})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+    @classmethod
+    def from_ipc_bytes(cls, data: bytes | memoryview | pa.Buffer) -> "Model":
+        """Deserialize a model written by `to_ipc_bytes`."""
+        table = pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+        data, *buffers = (
+            value.as_buffer() for value in table.column("buffer").combine_chunks()
+        )
+        model = pickle.loads(data, buffers=buffers)
+        if not isinstance(model, cls):
+            raise ValueError(f"Expected a {cls.__name__}, got {type(model).__name__}.")
+        return model
+
+    def _set_parents(self) -> None:
         for (
             k,
             v,
         ) in self._children().items():
             setattr(v, "_parent", self)
             setattr(v, "_parent_field", k)
-        return self
+        self.link._parent = self
 
     @model_validator(mode="after")
     def _ensure_link_table_is_present(self) -> "Model":
         if self.link.df is None:
             self.link.df = GeoDataFrame[LinkSchema](index=pd.Index([], name="link_id"))
-        self.link.df = self.link.df.set_geometry("geometry", crs=self.crs)
+        df = self.link.df
+        # Only assign when needed, since this runs on every assignment to the model,
+        # and an assigned table counts as changed, see `TableModel._edit_key`
+        if df.active_geometry_name != "geometry" or df.crs != self.crs:
+            self.link.df = df.set_geometry("geometry", crs=self.crs)
         return self
 
     @model_validator(mode="after")
     def _update_used_ids(self) -> "Model":
-        # Only update the used node IDs if we read from a database
-        if "database" in context_file_loading.get():
+        # Only update the used node IDs if we read from a database or bundle
+        context = context_file_loading.get()
+        if "database" in context or "bundle" in context:
             df = self.node_table().df
             assert df is not None
             if len(df.index) > 0:
@@ -150,7 +229,10 @@ class Model(FileModel):
         # By overriding `BaseModel.model_post_init` we can set them explicitly,
         # and enforce that they are always written.
         self.model_fields_set.update({"input_dir", "results_dir"})
-        self.edge = self.link  # Backwards compatible alias for link
+        # Backwards compatible alias for link.
+        # Set it directly, since assignment validation would load the file again.
+        assert self.__pydantic_extra__ is not None
+        self.__pydantic_extra__["edge"] = self.link
 
     def __repr__(self) -> str:
         """Generate a succinct overview of the Model content.
@@ -196,30 +278,277 @@ class Model(FileModel):
             tomli_w.dump(content, f)
         return fn
 
-    def _save(self, directory: DirectoryPath, input_dir: DirectoryPath):
+    def _save(
+        self,
+        directory: DirectoryPath,
+        input_dir: DirectoryPath,
+        max_workers: int = 1,
+        incremental: bool = False,
+    ):
         # We write all tables to a temporary GeoPackage with a dot prefix,
         # and at the end move this over the target file.
         # This does not throw a PermissionError if the file is open in QGIS.
         db_path = directory / input_dir / ".database.gpkg"
+        target = db_path.with_name("database.gpkg")
 
         # avoid adding tables to existing model
         db_path.parent.mkdir(parents=True, exist_ok=True)
         db_path.unlink(missing_ok=True)
         context_file_writing.get()["database"] = db_path
 
-        self.link._save(directory, input_dir)
         node = self.node_table()
+        assert node.df is not None
+        gpkg_tables = [
+            table for sub in self._nodes() for table in sub._gpkg_tables(False)
+        ]
+        spatial_tables: list[TableModel[Any]] = [
+            self.link,
+            node,
+            *(table for sub in self._nodes() for table in sub._gpkg_tables(True)),
+        ]
+        arrow_tables = [table for sub in self._nodes() for table in sub._arrow_tables()]
+
+        # An incremental write starts from a copy of the existing GeoPackage,
+        # and only writes the tables that changed since they were read or written.
+        synced = None
+        changed_spatial_tables = spatial_tables
+        changed_arrow_tables = arrow_tables
+        if incremental and self._can_update(target, spatial_tables):
+            shutil.copyfile(target, db_path)
+            synced = target
+            changed_spatial_tables = [
+                t for t in spatial_tables if not t._is_synced(target)
+            ]
+            changed_arrow_tables = [
+                t
+                for t in arrow_tables
+                if not t._is_synced(directory / input_dir / cast(Path, t.filepath))
+            ]
+
+        with _executor(max_workers) as executor:
+            # Arrow files don't depend on the GeoPackage or each other,
+            # so these are written by the workers while this thread writes the GeoPackage.
+            futures = [
+                executor.submit(copy_context().run, table._save, directory, input_dir)
+                for table in changed_arrow_tables
+            ]
+
+            # The spatial layers are written by pyogrio, which creates the GeoPackage.
+            for table in changed_spatial_tables:
+                table._save(directory, input_dir)
+
+            # Everything else is written over one connection, in a single transaction.
+            with _write_transaction(db_path) as connection:
+                context_file_writing.get()["connection"] = connection
+                try:
+                    _write_db_schema_version(connection, ribasim.__schema_version__)
+                    for layer in _get_feature_layers(connection):
+                        _add_styles_to_geopackage(connection, layer)
+
+                    if synced is not None:
+                        # Drop the tables that were removed or moved to Arrow files
+                        names = {table.tablename() for table in gpkg_tables}
+                        for name in _get_attribute_tables(connection):
+                            if name not in names and name not in METADATA_TABLES:
+                                _drop_table(connection, name)
+
+                    for sub in self._nodes():
+                        sub._save(directory, input_dir, synced=synced)
+                finally:
+                    del context_file_writing.get()["connection"]
+
+            for future in futures:
+                future.result()
+
+        shutil.move(db_path, target)
+        # The GeoPackage replaces the bundle that may have been written here before
+        shutil.rmtree(directory / input_dir / _bundle.BUNDLE, ignore_errors=True)
+
+        # Remember what was written, for the next incremental write.
+        # All tables are marked, since the GeoPackage was replaced.
+        for table in gpkg_tables + spatial_tables:
+            table._mark_synced(target)
+        for table in arrow_tables:
+            table._mark_synced(directory / input_dir / cast(Path, table.filepath))
+
+    def _save_bundle(
+        self,
+        directory: DirectoryPath,
+        input_dir: DirectoryPath,
+        max_workers: int = 1,
+        incremental: bool = False,
+    ):
+        """Write the tables to a bundle of Arrow files instead of a GeoPackage.
+
+        See `ribasim.bundle`. All files are written by `max_workers` threads.
+        """
+        bundle_path = directory / input_dir / _bundle.BUNDLE
+        bundle_path.mkdir(parents=True, exist_ok=True)
+        context_file_writing.get()["bundle"] = bundle_path
 
+        node = self.node_table()
         assert node.df is not None
-        node._save(directory, input_dir)
+        tables: list[TableModel[Any]] = [
+            self.link,
+            node,
+            *(table for sub in self._nodes() for table in sub._tables()),
+        ]
+        paths = [self._table_path(table, directory / input_dir) for table in tables]
+
+        # An incremental write only writes the tables that changed,
+        # if the bundle has the same schema version.
+        info = _bundle._read_info(directory / input_dir)
+        written = list(zip(tables, paths))
+        if (
+            incremental
+            and info is not None
+            and info.schema_version == ribasim.__schema_version__
+        ):
+            written = [
+                (table, path) for table, path in written if not table._is_synced(path)
+            ]
 
-        # Run after geopackage schema has been created
-        _set_db_schema_version(db_path, ribasim.__schema_version__)
+        with _executor(max_workers) as executor:
+            futures = [
+                executor.submit(copy_context().run, table._save, directory, input_dir)
+                for table, _ in written
+            ]
+            for future in futures:
+                future.result()
+        _bundle._write_info(
+            bundle_path,
+            [table.tablename() for table in tables if table.filepath is None],
+        )
+        # The bundle replaces the GeoPackage that may have been written here before
+        (directory / input_dir / "database.gpkg").unlink(missing_ok=True)
 
-        for sub in self._nodes():
-            sub._save(directory, input_dir)
+        for table, path in zip(tables, paths):
+            table._mark_synced(path)
+
+    @staticmethod
+    def _table_path(table: TableModel[Any], directory: Path) -> Path:
+        """Return the file of a table in a bundle in `directory`."""
+        if table.filepath is not None:
+            return directory / table.filepath
+        return directory / _bundle.BUNDLE / _cache._table_filename(table.tablename())
+
+    def _can_update(self, target: Path, spatial_tables: list[TableModel[Any]]) -> bool:
+        """Check whether the GeoPackage at `target` can be updated in place of a full write.
+
+        pyogrio can replace spatial layers, but not remove them,
+        so the spatial layers need to be the same.
+        """
+        if not target.is_file():
+            return False
+        info = _read_database_info(target)
+        features = {name for name, kind in info.contents.items() if kind == "features"}
+        return info.schema_version == ribasim.__schema_version__ and features == {
+            table.tablename() for table in spatial_tables
+        }
+
+    def _mark_synced(self) -> None:
+        """Record that the tables that were read are unchanged since reading them."""
+        assert self.filepath is not None
+        directory = self.filepath.parent / self.input_dir
+        db_path = directory / "database.gpkg"
+        bundle = not db_path.is_file()
+        spatial_tables: list[TableModel[Any]] = [
+            self.link,
+            *(table for sub in self._nodes() for table in sub._gpkg_tables(True)),
+        ]
+        node = self.node_table()
+        for table in [node, *spatial_tables]:
+            table._mark_synced(
+                self._table_path(table, directory) if bundle else db_path
+            )
 
-        shutil.move(db_path, db_path.with_name("database.gpkg"))
+    @classmethod
+    def _read_with_cache(cls, filepath: Path) -> "Model":
+        with open(filepath, "rb") as f:
+            directory = filepath.parent / tomli.load(f).get("input_dir", ".")
+        if not (directory / "database.gpkg").is_file():
+            # A bundle is read about as fast as the cache
+            return cls(filepath=filepath)  # type: ignore
+        key = _cache._key(filepath)
+        entry = _cache._lookup(key, directory)
+        token = _cache.context_cache.set(entry)
+        try:
+            model = cls(filepath=filepath)  # type: ignore
+        finally:
+            _cache.context_cache.reset(token)
+        if entry is None:
+            database_info = _read_database_info(directory / "database.gpkg")
+            _cache._store(key, model, directory, database_info)
+        return model
+
+    def _memory_map_tables(self) -> None:
+        """Let the tables that are read from Arrow files memory map them."""
+        for sub in self._nodes():
+            for table in sub._tables():
+                source = table._source
+                if source is not None and source.table is None:
+                    table._source = source._replace(memory_map=True)
+
+    def _read_tables(self, max_workers: int) -> None:
+        """Read all tables that are read lazily, with `max_workers` threads."""
+        tables = [
+            table
+            for sub in self._nodes()
+            for table in sub._tables()
+            if table._source is not None
+        ]
+        if not tables:
+            return
+        assert self.filepath is not None
+        db_path = self.filepath.parent / self.input_dir / "database.gpkg"
+        # Let the workers share the GeoPackage metadata, like during `_load`.
+        token = None
+        if db_path.is_file():
+            token = context_file_loading.set(
+                {"database": db_path, "database_info": _read_database_info(db_path)}
+            )
+        try:
+            with _executor(max_workers) as executor:
+                futures = [
+                    executor.submit(copy_context().run, getattr, table, "df")
+                    for table in tables
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            if token is not None:
+                context_file_loading.reset(token)
+
+    @contextmanager
+    def batch(self) -> Generator[None, None, None]:
+        """Defer appending nodes and links to the tables until the end of the block.
+
+        Within the block, `add` buffers the new rows instead of appending them to
+        the tables one by one, which is slow for large models.
+        IDs, connectivity and neighbor amounts are still checked on every `add`,
+        and added nodes can be retrieved with e.g. `model.basin[1]` as usual.
+        At the end of the block every table is concatenated and validated once.
+
+        Examples
+        --------
+        >>> with model.batch():
+        ...     model.basin.add(Node(1, Point(0.0, 0.0)), [basin.State(level=[1.0])])
+        ...     model.basin.add(Node(2, Point(1.0, 0.0)), [basin.State(level=[1.0])])
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush()
+
+    def _flush(self) -> None:
+        """Append all nodes and links buffered within `batch` to the tables."""
+        for child in self._children().values():
+            if isinstance(child, MultiNodeModel):
+                child._flush()
+        self.link._flush()
 
     def set_crs(self, crs: str) -> None:
         """Set the coordinate reference system of the data in the model.
@@ -239,16 +568,106 @@ class Model(FileModel):
     def _apply_crs_function(self, function_name: str, crs: str) -> None:
         """Apply `function_name`, with `crs` as the first and only argument to all spatial tables."""
         getattr(self.link.df, function_name)(crs, inplace=True)
+        self.link._edited()
         for sub in self._nodes():
             if sub.node.df is not None:
                 getattr(sub.node.df, function_name)(crs, inplace=True)
+                sub.node._edited()
             for table in sub._tables():
                 if isinstance(table, SpatialTableModel) and table.df is not None:
                     getattr(table.df, function_name)(crs, inplace=True)
+                    table._edited()
         self.crs = crs
 
+    def fingerprint(self) -> str:
+        """Return a hash of the content of the model.
+
+        It covers the configuration and the content of all tables,
+        see `TableModel.content_hash`, but not the location of the model.
+        Equal models have the same fingerprint, also across sessions,
+        which makes it useful as a key to look up earlier results.
+        """
+        self._flush()
+        config = self.model_dump(exclude_none=True, by_alias=True, context="write")
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        for table in self._all_tables():
+            digest.update(f"{table.tablename()} {table.content_hash()}".encode())
+        return digest.hexdigest()
+
+    def clone(self) -> "Model":
+        """Return a copy of the model that shares the data of the tables with this model.
+
+        This is much faster than ``model_copy(deep=True)`` for large models,
+        since only the tables that are used are copied.
+        The tables of both models copy the shared data when their DataFrame is first
+        accessed, so edits to a table in place, like
+        ``model.basin.static.df.loc[0, "drainage"] = 1.0``, only change one model.
+        """
+        self._flush()
+        # Share the DataFrames, and keep the clone from copying this model through
+        # the parent of its children.
+        memo: dict[int, Any] = {id(self): None, id(self._node_table_cache): None}
+        for table in self._all_tables():
+            df = table.__dict__.get("df")
+            if df is not None:
+                table._share(_SharedFrame(df))
+            if table._shared is not None:
+                memo[id(table._shared)] = table._shared
+            # Sources are immutable, and may hold the tables read from the cache
+            if table._source is not None:
+                memo[id(table._source)] = table._source
+        model = self.__deepcopy__(memo)
+        model._set_parents()
+        for table in model._all_tables():
+            if table._shared is not None:
+                table._shared.holders += 1
+        return model
+
+    def _all_tables(self) -> Generator[TableModel[Any], Any, None]:
+        """Return the link table and the tables of all node types, also without data."""
+        yield self.link
+        for child in self._children().values():
+            if isinstance(child, NodeModel):
+                for key in child._fields():
+                    table = getattr(child, key)
+                    if isinstance(table, TableModel):
+                        yield table
+
+    def _tables_by_name(self) -> dict[str, TableModel[Any]]:
+        """Return the link table and the tables of all node types by name, except the nodes."""
+        return {
+            table.tablename(): table
+            for table in self._all_tables()
+            if not isinstance(table, NodeTable)
+        }
+
     def node_table(self) -> NodeTable:
-        """Compute the full sorted NodeTable from all node types."""
+        """Compute the full sorted NodeTable from all node types.
+
+        The result is cached, and only computed again when the node table of some
+        node type is assigned, like after adding nodes. Edits in place, like
+        ``model.basin.node.df.loc[1, "name"] = "a"``, are only seen once the
+        node table is assigned again, e.g. ``model.basin.node.df = model.basin.node.df``.
+        The result should not be modified.
+        """
+        return self._node_table()[0]
+
+    def _node_table_key(self) -> list[tuple[Hashable, ...]]:
+        """Return the edit keys of the node tables of all node types, see `TableModel._edit_key`."""
+        return [
+            child.node._edit_key()
+            for child in self._children().values()
+            if isinstance(child, MultiNodeModel)
+        ]
+
+    def _node_table(self) -> tuple[NodeTable, NodeIndex]:
+        self._flush()
+        key = self._node_table_key()
+        cached = self._node_table_cache
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+
         df_chunks = [node.node.df for node in self._nodes()]
         df = (
             _concat(df_chunks)
@@ -259,7 +678,13 @@ class Model(FileModel):
         node_table.sort()
         assert node_table.df is not None
         assert node_table.df.index.is_unique, "node_id must be unique"
-        return node_table
+        index = NodeIndex(node_table.df)
+        self._node_table_cache = (key, node_table, index)
+        return node_table, index
+
+    def _node_index(self) -> NodeIndex:
+        """Return the index of the nodes of all node types, see `node_table`."""
+        return self._node_table()[1]
 
     def _nodes(self) -> Generator[MultiNodeModel, Any, None]:
         """Return all non-empty MultiNodeModel instances."""
@@ -281,19 +706,57 @@ class Model(FileModel):
         }
 
     @classmethod
-    def read(cls, filepath: str | PathLike[str]) -> "Model":
+    def read(
+        cls,
+        filepath: str | PathLike[str],
+        max_workers: int | None = None,
+        memory_map: bool = False,
+        cache: bool = False,
+    ) -> "Model":
         """Read a model from a TOML file.
 
         Parameters
         ----------
         filepath : str | PathLike[str]
             The path to the TOML file.
+        max_workers : int | None
+            By default tables are only read when they are first accessed.
+            If given, all tables are read right away, by this many threads.
+        memory_map : bool
+            Memory map the Arrow files of the tables instead of reading them.
+            The tables of uncompressed files are then backed by the pages of the file,
+            which processes reading the same file share.
+            See the `arrow_compression` argument of `Model.write`.
+            Windows cannot replace a file that is memory mapped, so there writing the model
+            to the same location first copies its tables into memory, and fails
+            if other DataFrames still refer to the file.
+        cache : bool
+            Use the on-disk cache of validated tables, see `ribasim.cache`.
+            If the model is unchanged since it was last read with the cache,
+            its tables are read from the cache without migrating and validating them.
+            Otherwise the model is read as usual, and all tables are stored in the cache.
         """
         if not Path(filepath).is_file():
             raise FileNotFoundError(f"File '{filepath}' does not exist.")
-        return cls(filepath=filepath)  # type: ignore
-
-    def write(self, filepath: str | PathLike[str]) -> Path:
+        if cache:
+            model = cls._read_with_cache(Path(filepath))
+        else:
+            model = cls(filepath=filepath)  # type: ignore
+        model._mark_synced()
+        if memory_map:
+            model._memory_map_tables()
+        if max_workers is not None:
+            model._read_tables(max_workers)
+        return model
+
+    def write(
+        self,
+        filepath: str | PathLike[str],
+        max_workers: int = 1,
+        arrow_compression: ArrowCompression | None = None,
+        incremental: bool = False,
+        format: ModelFormat = "geopackage",
+    ) -> Path:
         """Write the contents of the model to disk and save it as a TOML configuration file.
 
         If ``filepath.parent`` does not exist, it is created before writing.
@@ -302,7 +765,31 @@ class Model(FileModel):
         ----------
         filepath : str | PathLike[str]
             A file path with .toml extension.
+        max_workers : int
+            The number of threads that write the Arrow files,
+            while the GeoPackage is written by the calling thread.
+            Defaults to 1, writing everything one after another.
+        arrow_compression : str | None
+            The compression of the tables that are stored in Arrow files,
+            "zstd", "lz4" or "uncompressed".
+            Uncompressed files can be memory mapped by `Model.read`.
+            By default tables are compressed with zstd,
+            and the files of tables that were not read are copied as is.
+        incremental : bool
+            Only write the tables that changed since they were read from,
+            or last written to, the same location.
+            A table counts as changed once its ``df`` is assigned,
+            so after editing it in place, assign it again, e.g. ``table.df = table.df``.
+            The GeoPackage is still written to a temporary copy that replaces it at the end.
+            If the spatial layers were added or removed, everything is written.
+        format : str
+            "geopackage" to write the tables to ``database.gpkg``, as the Ribasim core requires,
+            or "bundle" to write them to a directory of Arrow files, see `ribasim.bundle`.
+            A bundle is much faster to read and write, and can be memory mapped,
+            but cannot be opened in QGIS or run by the core.
+            Either replaces the other if it was written to the same location before.
         """
+        self._flush()
         if self.use_validation:
             self._validate_model()
 
@@ -310,129 +797,180 @@ class Model(FileModel):
         self.filepath = filepath
         if not filepath.suffix == ".toml":
             raise ValueError(f"Filepath '{filepath}' is not a .toml file.")
-        context_file_writing.set({})
+        if format not in ("geopackage", "bundle"):
+            raise ValueError(
+                f"Unknown format '{format}', use 'geopackage' or 'bundle'."
+            )
+        context_file_writing.set({"arrow_compression": arrow_compression})
         directory = filepath.parent
         directory.mkdir(parents=True, exist_ok=True)
-        self._save(directory, self.input_dir)
+        if format == "bundle":
+            self._save_bundle(directory, self.input_dir, max_workers, incremental)
+        else:
+            self._save(directory, self.input_dir, max_workers, incremental)
         fn = self._write_toml(filepath)
 
         context_file_writing.set({})
         return fn
 
-    def _validate_model(self):
-        df_link = self.link.df
-        df_chunks = [node.node.df for node in self._nodes()]
-        df_node = _concat(df_chunks)
-
-        df_graph = df_link
-        # Join df_link with df_node to get to_node_type
-        df_graph = df_graph.join(
-            df_node[["node_type"]], on="from_node_id", how="left", rsuffix="_from"
-        )
-        df_graph = df_graph.rename(columns={"node_type": "from_node_type"})
-
-        df_graph = df_graph.join(
-            df_node[["node_type"]], on="to_node_id", how="left", rsuffix="_to"
-        )
-        df_graph = df_graph.rename(columns={"node_type": "to_node_type"})
-
-        if not self._has_valid_neighbor_amount(
-            df_graph, flow_link_neighbor_amount, "flow", df_node["node_type"]
-        ):
-            raise ValueError("Minimum flow inneighbor or outneighbor unsatisfied")
-        if not self._has_valid_neighbor_amount(
-            df_graph, control_link_neighbor_amount, "control", df_node["node_type"]
-        ):
-            raise ValueError("Minimum control inneighbor or outneighbor unsatisfied")
-
-    def _has_valid_neighbor_amount(
+    def write_scenarios(
         self,
-        df_graph: pd.DataFrame,
-        link_amount: dict[str, list[int]],
-        link_type: str,
-        nodes,
-    ) -> bool:
-        """Check if the neighbor amount of the two nodes connected by the given link meet the minimum requirements."""
-        is_valid = True
-
-        # filter graph by link type
-        df_graph = df_graph.loc[df_graph["link_type"] == link_type]
-
-        # count occurrence of "from_node" which reflects the number of outneighbors
-        from_node_count = (
-            df_graph.groupby("from_node_id").size().reset_index(name="from_node_count")
-        )
-
-        # append from_node_count column to from_node_id and from_node_type
-        from_node_info = (
-            df_graph[["from_node_id", "from_node_type"]]
-            .drop_duplicates()
-            .merge(from_node_count, on="from_node_id", how="left")
-        )
-        from_node_info = from_node_info[
-            ["from_node_id", "from_node_count", "from_node_type"]
-        ]
-
-        # add the node that is not the upstream of any other nodes
-        from_node_info = self._add_source_sink_node(nodes, from_node_info, "from")
-
-        # loop over all the "from_node" and check if they have enough outneighbor
-        for _, row in from_node_info.iterrows():
-            # from node's outneighbor
-            if row["from_node_count"] < link_amount[row["from_node_type"]][2]:
-                is_valid = False
-                logging.error(
-                    f"Node {row['from_node_id']} must have at least {link_amount[row['from_node_type']][2]} outneighbor(s) (got {row['from_node_count']})"
-                )
+        directory: str | PathLike[str],
+        scenarios: Mapping[str, Mapping[str, pd.DataFrame]],
+        max_workers: int = 1,
+    ) -> dict[str, Path]:
+        """Write variants of the model, each with some of its tables replaced.
 
-        # count occurrence of "to_node" which reflects the number of inneighbors
-        to_node_count = (
-            df_graph.groupby("to_node_id").size().reset_index(name="to_node_count")
-        )
+        The model is written once, after which every scenario starts from a copy of its files,
+        in which only the replaced tables are written.
+        Arrow files are hard linked instead of copied where possible.
 
-        # append to_node_count column to result
-        to_node_info = (
-            df_graph[["to_node_id", "to_node_type"]]
-            .drop_duplicates()
-            .merge(to_node_count, on="to_node_id", how="left")
-        )
-        to_node_info = to_node_info[["to_node_id", "to_node_count", "to_node_type"]]
+        Parameters
+        ----------
+        directory : str | PathLike[str]
+            The directory in which every scenario is written to ``<name>/ribasim.toml``.
+        scenarios : Mapping[str, Mapping[str, pd.DataFrame]]
+            Per scenario name, the tables to replace by their name, like ``"Basin / static"``.
+        max_workers : int
+            The number of processes that write scenarios.
+            Defaults to 1, writing them one after another.
 
-        # add the node that is not the downstream of any other nodes
-        to_node_info = self._add_source_sink_node(nodes, to_node_info, "to")
+        Returns
+        -------
+        dict[str, Path]
+            The TOML file of every scenario.
+        """
+        self._flush()
+        names = self._tables_by_name()
+        for scenario, tables in scenarios.items():
+            for name in tables:
+                if name not in names:
+                    raise ValueError(
+                        f"Scenario {scenario} replaces unknown table {name}."
+                    )
+
+        directory = Path(directory)
+        base = directory / ".base"
+        # The clone is written, to keep the location of this model
+        self.clone().write(base / "ribasim.toml", max_workers=max_workers)
+        try:
+            with _executor(max_workers, processes=True) as executor:
+                futures = {
+                    scenario: executor.submit(
+                        Model._write_scenario,
+                        base,
+                        directory / scenario / "ribasim.toml",
+                        tables,
+                    )
+                    for scenario, tables in scenarios.items()
+                }
+                return {
+                    scenario: future.result() for scenario, future in futures.items()
+                }
+        finally:
+            shutil.rmtree(base, ignore_errors=True)
 
-        # loop over all the "to_node" and check if they have enough inneighbor
-        for _, row in to_node_info.iterrows():
-            if row["to_node_count"] < link_amount[row["to_node_type"]][0]:
-                is_valid = False
-                logging.error(
-                    f"Node {row['to_node_id']} must have at least {link_amount[row['to_node_type']][0]} inneighbor(s) (got {row['to_node_count']})"
+    @classmethod
+    def _write_scenario(
+        cls, base: Path, filepath: Path, tables: Mapping[str, pd.DataFrame]
+    ) -> Path:
+        """Write a scenario, starting from the files of the model written to `base`."""
+        for path in base.rglob("*"):
+            if not path.is_file():
+                continue
+            target = filepath.parent / path.relative_to(base)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.unlink(missing_ok=True)
+            # Arrow files are only ever replaced, so they can be shared between scenarios,
+            # while the GeoPackage and the TOML file are written into.
+            if path.suffix == ".arrow":
+                try:
+                    os.link(path, target)
+                    continue
+                except OSError:
+                    pass
+            shutil.copyfile(path, target)
+
+        model = cls.read(filepath)
+        by_name = model._tables_by_name()
+        for name, df in tables.items():
+            by_name[name].df = cast(DataFrame[Any], df)
+        return model.write(filepath, incremental=True)
+
+    def _validate_model(self) -> None:
+        report = self.neighbor_amount_report()
+        # Maximum amounts are already enforced when links are added
+        report = report.loc[report["got"] < report["minimum"]]
+        for row in report.itertuples():
+            logging.error(
+                f"Node {row.node_id} must have at least {row.minimum} {row.direction}neighbor(s) (got {row.got})"
+            )
+        for link_type in ("flow", "control"):
+            if (report["link_type"] == link_type).any():
+                raise ValueError(
+                    f"Minimum {link_type} inneighbor or outneighbor unsatisfied"
                 )
 
-        return is_valid
-
-    def _add_source_sink_node(
-        self, nodes, node_info: pd.DataFrame, direction: str
-    ) -> pd.DataFrame:
-        """Loop over node table.
+    def neighbor_amount_report(self) -> pd.DataFrame:
+        """Report the nodes with fewer or more in- or outneighbors than their node type allows.
 
-        Add the nodes whose id are missing in the from_node and to_node column in the link table because they are not the upstream or downstrem of other nodes.
+        The minimum and maximum amounts of neighbors per node type and link type
+        are listed in `ribasim.validation`, and the maximum amounts are the same
+        that `LinkTable.add` enforces.
 
-        Specify that their occurrence in from_node table or to_node table is 0.
+        Returns
+        -------
+        pd.DataFrame
+            A row for every shortage or excess, with the columns node_id, node_type,
+            direction ("in" or "out"), link_type ("flow" or "control"),
+            got, minimum and maximum.
         """
-        # loop over nodes, add the one that is not the downstream (from) or upstream (to) of any other nodes
-        for index, node in enumerate(nodes):
-            if nodes.index[index] not in node_info[f"{direction}_node_id"].to_numpy():
-                new_row = {
-                    f"{direction}_node_id": nodes.index[index],
-                    f"{direction}_node_count": 0,
-                    f"{direction}_node_type": node,
-                }
-                node_info = _concat(
-                    [node_info, pd.DataFrame([new_row])], ignore_index=True
-                )
+        df_node = self.node_table().df
+        assert df_node is not None
+        node_id = df_node.index.to_numpy()
+        node_type = pd.Series(df_node["node_type"].to_numpy())
+        df_link = self.link.df
+        assert df_link is not None
 
-        return node_info
+        reports = []
+        for link_type, neighbor_amount in (
+            ("flow", flow_link_neighbor_amount),
+            ("control", control_link_neighbor_amount),
+        ):
+            links = df_link.loc[df_link["link_type"] == link_type]
+            # The minimum and maximum amount of inneighbors are at position 0 and 1,
+            # of outneighbors at 2 and 3
+            for direction, column, position in (
+                ("in", "to_node_id", 0),
+                ("out", "from_node_id", 2),
+            ):
+                got = (
+                    pd.Series(links[column].to_numpy(dtype=np.int64))
+                    .value_counts()
+                    .reindex(node_id, fill_value=0)
+                    .to_numpy()
+                )
+                minimum, maximum = (
+                    node_type.map({k: v[i] for k, v in neighbor_amount.items()})
+                    .fillna(0)
+                    .to_numpy(dtype=np.int64)
+                    for i in (position, position + 1)
+                )
+                invalid = (got < minimum) | (got > maximum)
+                reports.append(
+                    pd.DataFrame(
+                        {
+                            "node_id": node_id[invalid],
+                            "node_type": node_type.to_numpy()[invalid],
+                            "direction": direction,
+                            "link_type": link_type,
+                            "got": got[invalid],
+                            "minimum": minimum[invalid],
+                            "maximum": maximum[invalid],
+                        }
+                    )
+                )
+        return _concat(reports, ignore_index=True)
 
     @classmethod
     def _load(cls, filepath: Path | None) -> dict[str, Any]:
@@ -447,9 +985,23 @@ class Model(FileModel):
             db_path = directory / "database.gpkg"
 
             if not db_path.is_file():
-                raise FileNotFoundError(f"Database file '{db_path}' does not exist.")
+                bundle = _bundle._read_info(directory)
+                if bundle is None:
+                    raise FileNotFoundError(
+                        f"Database file '{db_path}' does not exist."
+                    )
+                context_file_loading.get()["bundle"] = bundle
+                return config
 
             context_file_loading.get()["database"] = db_path
+            entry = _cache.context_cache.get()
+            if entry is None:
+                context_file_loading.get()["database_info"] = _read_database_info(
+                    db_path
+                )
+            else:
+                context_file_loading.get()["cache"] = entry.tables
+                context_file_loading.get()["database_info"] = entry.database_info
 
             return config
         else:
@@ -584,6 +1136,21 @@ class Model(FileModel):
 
         return ax
 
+    def read_results(self) -> ResultsReader:
+        """Return a reader of the results of the model, after it was run.
+
+        The results are read from the results directory next to the TOML file,
+        only when and as far as they are needed, see `ribasim.results.ResultsReader`.
+
+        Examples
+        --------
+        >>> results = model.read_results()
+        >>> flow = results.read("flow", time=("2020-01-01", "2020-02-01"), node_id=6)
+        >>> daily = results.aggregate("flow", "D")
+        """
+        self._checked_toml_path()
+        return ResultsReader(self)
+
     def to_xugrid(self, add_flow: bool = False, add_allocation: bool = False):
         """Convert the network to a `xugrid.UgridDataset`.
 
@@ -664,31 +1231,7 @@ class Model(FileModel):
                 "perhaps the model needs to be run first."
             )
 
-        basin_df = pd.read_feather(basin_path, dtype_backend="pyarrow")
-        flow_df = pd.read_feather(flow_path, dtype_backend="pyarrow")
-        _time_in_ns(basin_df)
-        _time_in_ns(flow_df)
-
-        # add the xugrid dimension indices to the dataframes
-        link_dim = uds.grid.edge_dimension
-        node_dim = uds.grid.node_dimension
-        node_lookup = _node_lookup(uds)
-        link_lookup = _link_lookup(uds)
-        flow_df[link_dim] = link_lookup[flow_df["link_id"]].to_numpy()
-        basin_df[node_dim] = node_lookup[basin_df["node_id"]].to_numpy()
-
-        # add flow results to the UgridDataset
-        flow_da = flow_df.set_index(["time", link_dim])["flow_rate"].to_xarray()
-        uds[flow_da.name] = flow_da
-
-        # add basin results to the UgridDataset
-        basin_df.drop(columns=["node_id"], inplace=True)
-        basin_ds = basin_df.set_index(["time", node_dim]).to_xarray()
-
-        for var_name, da in basin_ds.data_vars.items():
-            uds[var_name] = da
-
-        return uds
+        return self._add_variables(uds, ResultsReader(self)._flow_variables(uds))
 
     def _add_allocation(self, uds):
         toml_path = self._checked_toml_path()
@@ -702,39 +1245,12 @@ class Model(FileModel):
                 "perhaps the model needs to be run first, or allocation is not used."
             )
 
-        alloc_flow_df = pd.read_feather(
-            alloc_flow_path,
-            columns=[
-                "time",
-                "link_id",
-                "flow_rate",
-                "optimization_type",
-                "demand_priority",
-            ],
-            dtype_backend="pyarrow",
-        )
-        _time_in_ns(alloc_flow_df)
-
-        # add the xugrid link dimension index to the dataframe
-        link_dim = uds.grid.edge_dimension
-        link_lookup = _link_lookup(uds)
-        alloc_flow_df[link_dim] = link_lookup[alloc_flow_df["link_id"]].to_numpy()
-
-        # "flow_rate_allocated" is the sum of all allocated flow rates over the demand priorities
-        allocate_df = alloc_flow_df.loc[
-            alloc_flow_df["optimization_type"] == "allocate"
-        ]
-        uds["flow_rate_allocated"] = (
-            allocate_df.groupby(["time", link_dim])["flow_rate"].sum().to_xarray()
-        )
-
-        # also add the individual demand priorities and optimization types
-        # added as separate variables to ensure QGIS / MDAL compatibility
-        for (optimization_type, demand_priority), group in alloc_flow_df.groupby(
-            ["optimization_type", "demand_priority"]
-        ):
-            varname = f"{optimization_type}_priority_{demand_priority}"
-            da = group.set_index(["time", link_dim])["flow_rate"].to_xarray()
-            uds[varname] = da
+        return self._add_variables(uds, ResultsReader(self)._allocation_variables(uds))
 
+    @staticmethod
+    def _add_variables(uds, variables):
+        """Add the results at all times to the UgridDataset."""
+        uds = uds.assign_coords(time=variables.times)
+        for name, values in variables.read(variables.times).items():
+            uds[name] = (("time", variables.dims[name]), values)
         return uds
@@ -0,0 +1,874 @@
+"""Read the results that the Ribasim core writes, see `ResultsReader`.
+
+Every results file is an Arrow file, with one row per time and node, link or
+other object, see the `DIMENSIONS` of each file.
+The files are memory mapped. Uncompressed record batches are read as views of the file,
+of compressed ones only the columns that are needed are decompressed.
+A compressed record batch can only be decompressed as a whole,
+which for the single record batch the core writes is the whole run.
+Filters are first evaluated on the columns they need, after which the other columns
+are only read for the record batches that have matching rows.
+
+Most results files have the same number of rows at every saved time, in time order.
+This layout is inferred from the time column the first time a file is read by time,
+and kept in memory until the file changes.
+A time window then maps straight to a range of rows,
+which is a slice of the memory mapped record batches.
+The same layout lets results with the dimensions time and one ID,
+like basin and flow, be viewed as arrays of time by ID without a pivot,
+see `_dense_dataset`.
+
+`ResultsReader.to_ugrid_netcdf` writes the results on the network to a UGRID NetCDF file
+a time window at a time, see `_write_ugrid_netcdf`.
+Only uncompressed results, or compressed results in many record batches, are streamed,
+since every window reads the record batches it overlaps.
+
+`ResultsReader.aggregate` integrates the rates in the results over periods like days or months,
+`SLICE_ROWS` rows at a time, see `_aggregate`.
+The value at each time is the mean over the interval that starts at that time,
+up to the next time in the results, or the end time of the model for the last one.
+"""
+
+from collections.abc import Callable, Sequence
+from functools import lru_cache, reduce
+from os import PathLike
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from numpy.typing import NDArray
+
+from ribasim.utils import (
+    MissingOptionalModule,
+    _file_stamp,
+    _link_lookup,
+    _node_lookup,
+    _on_grid,
+    _time_in_ns,
+)
+
+if TYPE_CHECKING:
+    from ribasim.model import Model
+
+try:
+    import xarray
+except ImportError:
+    xarray = MissingOptionalModule("xarray", "netcdf")  # type: ignore
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = MissingOptionalModule("netCDF4", "netcdf")  # type: ignore
+
+ResultsOutput = Literal["pandas", "arrow", "xarray"]
+
+# The number of rows of a record batch that `_aggregate` processes at once
+SLICE_ROWS = 65_536
+
+# The columns that identify the rows of every results file, the dimensions in xarray
+DIMENSIONS: dict[str, list[str]] = {
+    "basin_state": ["node_id"],
+    "basin": ["time", "node_id"],
+    "flow": ["time", "link_id"],
+    "concentration": ["time", "node_id", "substance"],
+    "control": ["time", "control_node_id"],
+    "allocation": ["time", "node_id", "demand_priority"],
+    "allocation_flow": ["time", "link_id", "optimization_type", "demand_priority"],
+    "subgrid_level": ["time", "subgrid_id"],
+    "solver_stats": ["time"],
+}
+
+# The columns that are (mean) rates over the interval that starts at their time, in m³/s
+RATES: dict[str, list[str]] = {
+    "basin": [
+        "inflow_rate",
+        "outflow_rate",
+        "storage_rate",
+        "precipitation",
+        "evaporation",
+        "drainage",
+        "infiltration",
+        "balance_error",
+    ],
+    "flow": ["flow_rate"],
+    "allocation": ["demand", "allocated", "realized"],
+    "allocation_flow": ["flow_rate"],
+}
+
+AggregateMethod = Literal["volume", "mean"]
+
+
+class _Filter(NamedTuple):
+    """A filter on the rows of a results file."""
+
+    # The columns the filter needs
+    columns: list[str]
+    # Gives the mask of the rows of a record batch that pass
+    mask: Callable[[pa.RecordBatch], pa.Array]
+
+
+def _time_filter(start: Any, end: Any) -> _Filter:
+    """Keep the rows from `start` up to and including `end`, either may be None."""
+    bounds = [
+        (pc.greater_equal, pd.Timestamp(start)) if start is not None else None,
+        (pc.less_equal, pd.Timestamp(end)) if end is not None else None,
+    ]
+
+    def mask(batch: pa.RecordBatch) -> pa.Array:
+        column = batch.column("time")
+        masks = [
+            compare(column, pa.scalar(bound, column.type))
+            for compare, bound in filter(None, bounds)
+        ]
+        return reduce(pc.and_, masks)
+
+    return _Filter(["time"], mask)
+
+
+def _isin_filter(columns: list[str], values: Sequence[Any]) -> _Filter:
+    """Keep the rows of which any of `columns` holds one of `values`."""
+
+    def mask(batch: pa.RecordBatch) -> pa.Array:
+        masks = [
+            pc.fill_null(pc.is_in(batch.column(column), pa.array(values)), False)
+            for column in columns
+        ]
+        return reduce(pc.or_, masks)
+
+    return _Filter(columns, mask)
+
+
+class _TimeLayout(NamedTuple):
+    """The layout of a results file with the same number of rows at every time."""
+
+    # The saved times, in order
+    times: NDArray[np.datetime64]
+    rows_per_time: int
+    # The number of rows of every record batch
+    batch_rows: list[int]
+
+    def rows(self, start: Any, end: Any) -> tuple[int, int]:
+        """Return the rows from `start` up to and including `end`, either may be None."""
+        first = 0 if start is None else self._index(start, "left")
+        last = len(self.times) if end is None else self._index(end, "right")
+        return first * self.rows_per_time, max(first, last) * self.rows_per_time
+
+    def _index(self, time: Any, side: Literal["left", "right"]) -> int:
+        value = np.datetime64(pd.Timestamp(time)).astype(self.times.dtype)
+        return int(np.searchsorted(self.times, value, side=side))
+
+
+def _time_layout(path: Path) -> _TimeLayout | None:
+    """Return the layout of a results file, if it has one, see `_infer_time_layout`.
+
+    The layout is kept in memory with the size and modification time of the file,
+    so it is inferred again if the file is written again.
+    """
+    return _cached_time_layout(path.resolve(), _file_stamp(path))
+
+
+@lru_cache(maxsize=32)
+def _cached_time_layout(
+    path: Path, stamp: tuple[int, int] | None
+) -> _TimeLayout | None:
+    return _infer_time_layout(path)
+
+
+def _infer_time_layout(path: Path) -> _TimeLayout | None:
+    """Check whether every time has the same number of rows, in time order."""
+    reader = _open(path)
+    if "time" not in reader.schema.names:
+        return None
+    reader = _open(path, ["time"])
+    batches = [reader.get_batch(i) for i in range(reader.num_record_batches)]
+    if not batches:
+        return None
+    time = pa.chunked_array([batch.column("time") for batch in batches]).to_numpy()
+    if len(time) == 0:
+        return None
+    changes = np.flatnonzero(time != time[0])
+    rows_per_time = int(changes[0]) if len(changes) else len(time)
+    if len(time) % rows_per_time != 0:
+        return None
+    steps = time.reshape(-1, rows_per_time)
+    times = steps[:, 0]
+    if not (steps == times[:, np.newaxis]).all() or (np.diff(times) <= 0).any():
+        return None
+    return _TimeLayout(times, rows_per_time, [batch.num_rows for batch in batches])
+
+
+def _open(path: Path, columns: list[str] | None = None) -> pa.ipc.RecordBatchFileReader:
+    """Memory map a results file, only decompressing `columns` of its record batches.
+
+    The record batches of an uncompressed file are views of the memory mapped file.
+    These have all columns, since reading only some fields copies the batch.
+    """
+    source = pa.memory_map(str(path))
+    if columns is None or not _is_compressed(path):
+        return pa.ipc.open_file(source)
+    schema = pa.ipc.open_file(source).schema
+    options = pa.ipc.IpcReadOptions(
+        included_fields=sorted(schema.get_field_index(name) for name in columns)
+    )
+    return pa.ipc.open_file(source, options=options)
+
+
+def _is_compressed(path: Path) -> bool:
+    """Check whether the record batches of a results file are compressed."""
+    return _cached_is_compressed(path.resolve(), _file_stamp(path))
+
+
+@lru_cache(maxsize=32)
+def _cached_is_compressed(path: Path, stamp: tuple[int, int] | None) -> bool:
+    # Read the first column of the first record batch as a stream from the memory map,
+    # of which the buffers are views of the file only if it is uncompressed.
+    mapped = pa.memory_map(str(path)).read_buffer()
+    options = pa.ipc.IpcReadOptions(included_fields=[0])
+    # The file format is the stream format after the magic bytes and padding
+    reader = pa.ipc.open_stream(mapped.slice(8), options=options)
+    try:
+        batch = reader.read_next_batch()
+    except StopIteration:
+        return False
+    end = mapped.address + mapped.size
+    return any(
+        not mapped.address <= buffer.address < end
+        for buffer in batch.column(0).buffers()
+        if buffer is not None and buffer.size > 0
+    )
+
+
+def _node_columns(path: Path) -> list[str]:
+    """Return the columns with the nodes of the rows, like those of a flow link."""
+    names = _open(path).schema.names
+    if "node_id" not in names and "from_node_id" in names:
+        return ["from_node_id", "to_node_id"]
+    return ["node_id"]
+
+
+def _batch_slices(
+    batch_rows: Sequence[int], rows: tuple[int, int]
+) -> list[tuple[int, int, int]]:
+    """Return the record batches with a range of rows, and the offset and length in each."""
+    slices = []
+    start = 0
+    for i, n in enumerate(batch_rows):
+        first, last = max(rows[0], start), min(rows[1], start + n)
+        if first < last:
+            slices.append((i, first - start, last - first))
+        start += n
+    return slices
+
+
+def _read_results(
+    path: Path,
+    columns: Sequence[str] | None,
+    filters: Sequence[_Filter],
+    slices: Sequence[tuple[int, int, int | None]] | None = None,
+) -> pa.Table:
+    """Read `columns` of the rows of a results file that pass all `filters`.
+
+    If `slices` are given, only those parts of the record batches are read,
+    see `_batch_slices`.
+    """
+    schema = _open(path).schema
+    names = schema.names if columns is None else list(columns)
+    for name in [*names, *(name for f in filters for name in f.columns)]:
+        if name not in schema.names:
+            raise ValueError(
+                f"Results file '{path.name}' has no column '{name}', "
+                f"only {', '.join(schema.names)}."
+            )
+    output_schema = pa.schema([schema.field(name) for name in names])
+
+    reader = _open(path, names)
+    if slices is None:
+        slices = [(i, 0, None) for i in range(reader.num_record_batches)]
+    filter_columns = list(dict.fromkeys(name for f in filters for name in f.columns))
+    filter_reader = _open(path, filter_columns) if filters else None
+    batches = []
+    for i, offset, length in slices:
+        mask = None
+        if filter_reader is not None:
+            filter_batch = filter_reader.get_batch(i).slice(offset, length)
+            mask = reduce(pc.and_, (f.mask(filter_batch) for f in filters))
+            if not pc.any(mask).as_py():
+                # Skip reading the other columns of this batch
+                continue
+        batch = reader.get_batch(i).slice(offset, length).select(names)
+        if mask is not None and not pc.all(mask).as_py():
+            batch = batch.filter(mask)
+        batches.append(batch)
+    return pa.Table.from_batches(batches, output_schema)
+
+
+def _to_numpy(column: pa.ChunkedArray) -> np.ndarray[Any, Any]:
+    """Convert a column to NumPy, without a copy if it is a single chunk without nulls."""
+    array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+    return array.to_numpy(zero_copy_only=False)
+
+
+def _dense_dataset(table: pa.Table, dims: list[str]) -> Any:
+    """View results with the same IDs in the same order at every time as 2D arrays.
+
+    The columns are reshaped to (time, ID) arrays, which are views of the
+    memory mapped columns if the file is uncompressed and has a single record batch,
+    as the core writes it.
+    Returns None if the results don't have this layout.
+    """
+    if len(dims) != 2 or dims[0] != "time" or table.num_rows == 0:
+        return None
+    time_name, id_name = dims
+    if table[id_name].null_count > 0:
+        return None
+    time = _to_numpy(table[time_name])
+    ids = _to_numpy(table[id_name])
+    changes = np.flatnonzero(time != time[0])
+    n = int(changes[0]) if len(changes) else len(time)
+    if len(time) % n != 0:
+        return None
+    time = time.reshape(-1, n)
+    ids = ids.reshape(-1, n)
+    if not ((time == time[:, :1]).all() and (ids == ids[0]).all()):
+        return None
+    if len(np.unique(ids[0])) != n:
+        return None
+
+    shape = time.shape
+    data_vars = {
+        name: (dims, _to_numpy(table[name]).reshape(shape))
+        for name in table.column_names
+        if name not in dims
+    }
+    coords = {
+        time_name: time[:, 0].astype("datetime64[ns]"),
+        id_name: ids[0],
+    }
+    return xarray.Dataset(data_vars, coords=coords)
+
+
+def _convert(table: pa.Table, name: str, output: ResultsOutput) -> Any:
+    """Convert the results to pandas with pyarrow dtypes, or to xarray, or not at all."""
+    if output == "arrow":
+        return table
+    if output == "pandas":
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    if output == "xarray":
+        dense = _dense_dataset(table, DIMENSIONS[name])
+        if dense is not None:
+            return dense
+        df = table.to_pandas()
+        if "time" in df.columns:
+            _time_in_ns(df)
+        dims = [dim for dim in DIMENSIONS[name] if dim in df.columns]
+        return xarray.Dataset.from_dataframe(df.set_index(dims))
+    raise ValueError(f"Unknown output '{output}', use 'pandas', 'arrow' or 'xarray'.")
+
+
+def _unique_rows(path: Path, columns: list[str]) -> list[tuple[Any, ...]]:
+    """Return the sorted unique rows of `columns`, reading a record batch at a time."""
+    reader = _open(path, columns)
+    unique: set[tuple[Any, ...]] = set()
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i).select(columns)
+        table = pa.Table.from_batches([batch]).group_by(columns).aggregate([])
+        unique.update(zip(*(table[name].to_pylist() for name in columns)))
+    return sorted(unique)
+
+
+class _GridVariables(NamedTuple):
+    """Results on the nodes or links of a UGRID network, read a time window at a time."""
+
+    # The times of the results, the time dimension of all variables
+    times: pd.DatetimeIndex
+    # The grid dimension of every variable, by name
+    dims: dict[str, str]
+    # Reads all variables at some of the times, as arrays of time by grid dimension
+    read: Callable[[pd.DatetimeIndex], dict[str, NDArray[np.float64]]]
+
+
+def _write_ugrid_netcdf(
+    path: Path, uds: Any, variables: _GridVariables, chunk_time: int
+) -> None:
+    """Write the network, and then the variables `chunk_time` times at a time.
+
+    The variables are stored in chunks of `chunk_time` times, so that writing
+    a time window only touches its own chunks.
+    Nothing that is read for a window is kept for the next one.
+    """
+    times = variables.times
+    ds = uds.assign_coords(time=times).ugrid.to_dataset()
+    ds.to_netcdf(path, engine="netcdf4")
+    with netCDF4.Dataset(path, "a") as nc:
+        created = {}
+        for name, dim in variables.dims.items():
+            var = nc.createVariable(
+                name,
+                "f8",
+                ("time", dim),
+                fill_value=np.nan,
+                chunksizes=(max(1, min(chunk_time, len(times))), ds.sizes[dim]),
+            )
+            # The attribute xarray writes to associate the IDs with the variable
+            coords = sorted(
+                str(key)
+                for key, coord in ds.coords.items()
+                if coord.dims == (dim,) and key != dim
+            )
+            var.setncattr("coordinates", " ".join(coords))
+            created[name] = var
+        for start in range(0, len(times), chunk_time):
+            chunk = times[start : start + chunk_time]
+            for name, values in variables.read(chunk).items():
+                created[name][start : start + len(chunk)] = values
+
+
+def _period_edges(periods: Any, start: Any, end: Any) -> pd.DatetimeIndex:
+    """Return the edges of the periods, each period runs up to the next edge.
+
+    `periods` is either a frequency like "D" or "MS", of which the first period
+    contains `start` and the last one `end`, or the edges themselves.
+    """
+    if not isinstance(periods, str):
+        edges = pd.DatetimeIndex(periods)
+        if len(edges) < 2 or not edges.is_monotonic_increasing:
+            raise ValueError(
+                "The edges of the periods need to be at least two increasing times."
+            )
+        return edges.as_unit("ns")
+    offset = pd.tseries.frequencies.to_offset(periods)
+    start = pd.Timestamp(start)
+    if isinstance(offset, pd.tseries.offsets.Tick):
+        first = start.floor(offset)
+    else:
+        first = offset.rollback(start.normalize())
+    end = max(pd.Timestamp(end), first)
+    edges = pd.date_range(first, end, freq=offset)
+    if edges[-1] < end or len(edges) == 1:
+        edges = pd.date_range(first, periods=len(edges) + 1, freq=offset)
+    return edges.as_unit("ns")
+
+
+class _Pieces(NamedTuple):
+    """The parts of the intervals of the results that fall within each period."""
+
+    # The first piece of every interval, and the end of the last as last element
+    offsets: NDArray[np.int64]
+    # The period and the duration in seconds of every piece, ordered by interval
+    period: NDArray[np.int64]
+    seconds: NDArray[np.float64]
+
+
+def _pieces(
+    starts: NDArray[np.datetime64], end: Any, edges: pd.DatetimeIndex
+) -> _Pieces:
+    """Split the intervals between `starts` and up to `end` at the edges of the periods."""
+    starts = starts.astype("datetime64[ns]")
+    ends = np.append(starts[1:], np.datetime64(pd.Timestamp(end), "ns"))
+    edges_ns = edges.to_numpy()
+    n_periods = len(edges_ns) - 1
+    first = np.clip(np.searchsorted(edges_ns, starts, side="right") - 1, 0, None)
+    last = np.clip(
+        np.searchsorted(edges_ns, ends, side="left") - 1, None, n_periods - 1
+    )
+    counts = np.clip(last - first + 1, 0, None)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    interval = np.repeat(np.arange(len(starts)), counts)
+    period = first[interval] + np.arange(offsets[-1]) - offsets[interval]
+    overlap = np.minimum(ends[interval], edges_ns[period + 1]) - np.maximum(
+        starts[interval], edges_ns[period]
+    )
+    seconds = np.clip(overlap / np.timedelta64(1, "s"), 0.0, None)
+    return _Pieces(offsets, period, seconds)
+
+
+def _aggregate(
+    path: Path,
+    keys: list[str],
+    columns: list[str],
+    starts: NDArray[np.datetime64],
+    end: Any,
+    edges: pd.DatetimeIndex,
+) -> pa.Table:
+    """Integrate `columns` over the periods between `edges`, for every combination of `keys`.
+
+    The record batches are processed in slices of `SLICE_ROWS` rows, since the core
+    writes a single record batch per file. Every slice is split in the pieces of its
+    intervals that fall within each period, of which the values times the duration
+    are summed per period. These sums of all slices are then added.
+    The slices of an uncompressed file are views of the memory mapped file,
+    so the memory use is bounded by the slice size.
+    A compressed record batch is first decompressed as a whole,
+    so only the memory use beyond the columns that are read is bounded.
+    The table has the sums, and the seconds of the periods with results as "seconds".
+    """
+    pieces = _pieces(starts, end, edges)
+    period_start = edges.to_numpy()[:-1]
+    starts = starts.astype("datetime64[ns]")
+    group = ["time", *keys]
+    sums = [*columns, "seconds"]
+
+    def reduce_(table: pa.Table) -> pa.Table:
+        table = table.group_by(group).aggregate([(name, "sum") for name in sums])
+        return table.select([*group, *(f"{name}_sum" for name in sums)]).rename_columns(
+            [*group, *sums]
+        )
+
+    reader = _open(path, ["time", *keys, *columns])
+    schema = reader.schema
+    fields = [pa.field("time", pa.timestamp("ns"))]
+    fields += [schema.field(key) for key in keys]
+    fields += [pa.field(name, pa.float64()) for name in sums]
+    partials = [pa.schema(fields).empty_table()]
+
+    def integrate(batch: pa.RecordBatch) -> pa.Table:
+        time = batch.column("time").to_numpy().astype("datetime64[ns]")
+        interval = np.searchsorted(starts, time)
+        counts = np.diff(pieces.offsets)[interval]
+        rows = np.repeat(np.arange(batch.num_rows), counts)
+        piece = (
+            pieces.offsets[interval[rows]]
+            + np.arange(len(rows))
+            - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        seconds = pa.array(pieces.seconds[piece])
+        values = {
+            name: pc.multiply(batch.column(name).take(rows).cast(pa.float64()), seconds)
+            for name in columns
+        }
+        table = pa.table(
+            {
+                "time": pa.array(period_start[pieces.period[piece]]),
+                **{key: batch.column(key).take(rows) for key in keys},
+                **values,
+                "seconds": seconds,
+            },
+            schema=pa.schema(fields),
+        )
+        return reduce_(table)
+
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        for offset in range(0, batch.num_rows, SLICE_ROWS):
+            partials.append(integrate(batch.slice(offset, SLICE_ROWS)))
+    table = reduce_(pa.concat_tables(partials))
+    return table.sort_by([(name, "ascending") for name in group])
+
+
+class ResultsReader:
+    """Read the results of a model that was run, see `Model.read_results`.
+
+    Parameters
+    ----------
+    model : Model
+        The model, which needs to be written to the directory it was run in.
+    """
+
+    def __init__(self, model: "Model"):
+        self.model = model
+
+    def read(
+        self,
+        name: str,
+        columns: Sequence[str] | None = None,
+        time: tuple[Any, Any] | None = None,
+        node_id: Sequence[int] | int | None = None,
+        link_id: Sequence[int] | int | None = None,
+        node_type: Sequence[str] | str | None = None,
+        output: ResultsOutput = "pandas",
+    ) -> Any:
+        """Read the results of a model that was run, only reading what is needed.
+
+        The results file is memory mapped, and only the given columns and
+        the record batches with rows that pass the filters are read.
+        If every time has the same number of rows, a time window is read as a range of rows.
+        See `ribasim.results`.
+
+        Parameters
+        ----------
+        name : str
+            The name of the results file without extension, like "basin" or "flow".
+        columns : Sequence[str] | None
+            The columns to read, by default all.
+        time : tuple[Any, Any] | None
+            Only read the rows from the start up to and including the end time.
+            Either may be None to leave that side open.
+        node_id : Sequence[int] | int | None
+            Only read the rows of these nodes.
+            For flow results, the rows of the links from or to these nodes.
+        link_id : Sequence[int] | int | None
+            Only read the rows of these links.
+        node_type : Sequence[str] | str | None
+            Only read the rows of nodes of these types, like node_id.
+        output : str
+            "pandas" for a DataFrame with pyarrow dtypes,
+            "arrow" for a pyarrow Table,
+            or "xarray" for a Dataset with the `DIMENSIONS` of the file as dimensions.
+        """
+        path = self._path(name)
+        node_columns = _node_columns(path)
+        filters = []
+        slices = None
+        if time is not None and time != (None, None):
+            layout = _time_layout(path)
+            if layout is None:
+                filters.append(_time_filter(*time))
+            else:
+                slices = _batch_slices(layout.batch_rows, layout.rows(*time))
+        if node_id is not None:
+            filters.append(_isin_filter(node_columns, np.atleast_1d(node_id).tolist()))
+        if link_id is not None:
+            filters.append(_isin_filter(["link_id"], np.atleast_1d(link_id).tolist()))
+        if node_type is not None:
+            node = self.model.node_table().df
+            assert node is not None
+            node_ids = node.index[node["node_type"].isin(np.atleast_1d(node_type))]
+            filters.append(_isin_filter(node_columns, node_ids.tolist()))
+        table = _read_results(path, columns, filters, slices)
+        return _convert(table, name, output)
+
+    def times(self, name: str) -> pd.DatetimeIndex:
+        """Return the times at which there are results, in order.
+
+        Parameters
+        ----------
+        name : str
+            The name of the results file without extension, like "basin" or "flow".
+        """
+        path = self._path(name)
+        layout = _time_layout(path)
+        if layout is not None:
+            times = layout.times
+        else:
+            time = self.read(name, columns=["time"], output="arrow")["time"]
+            times = pc.unique(time).sort().to_numpy()
+        return pd.DatetimeIndex(times.astype("datetime64[ns]"), name="time")
+
+    def aggregate(
+        self,
+        name: str,
+        periods: str | Sequence[Any],
+        columns: Sequence[str] | None = None,
+        how: AggregateMethod = "volume",
+        output: ResultsOutput = "pandas",
+    ) -> Any:
+        """Aggregate the results over periods, like the volumes per day or mean rates per month.
+
+        The value at each time in the results holds from that time up to the next time
+        in the results, or the end time of the model for the last one,
+        since the Ribasim core writes the mean rates over those intervals.
+        Intervals that span multiple periods are split between them.
+        The results are processed in slices of rows, which for uncompressed results,
+        as written with ``results.compression = False``, are read from the file one at a time,
+        so these can be larger than memory.
+        Compressed results are decompressed a record batch at a time,
+        and the core writes a single one, so the columns that are aggregated
+        need to fit in memory, see `ribasim.results`.
+
+        Parameters
+        ----------
+        name : str
+            The name of the results file without extension, like "basin" or "flow".
+        periods : str | Sequence[Any]
+            A frequency like "D", "MS" or "YS" for days, months or years,
+            or the edges of the periods, of which each period runs up to the next edge.
+        columns : Sequence[str] | None
+            The columns to aggregate, by default the `RATES` of the file.
+        how : str
+            "volume" to integrate rates in m³/s to volumes in m³,
+            or "mean" for the mean over the part of the period with results,
+            which can also be taken of other numeric columns, like the level.
+        output : str
+            "pandas", "arrow" or "xarray", like for `read`.
+
+        Returns
+        -------
+        Any
+            The aggregates by the `DIMENSIONS` of the file,
+            of which the time is the start of each period with results.
+        """
+        path = self._path(name)
+        schema = _open(path).schema
+        dims = DIMENSIONS[name]
+        if how == "volume":
+            allowed = [
+                column for column in RATES.get(name, []) if column in schema.names
+            ]
+        elif how == "mean":
+            allowed = [
+                field.name
+                for field in schema
+                if field.name not in dims
+                and (
+                    pa.types.is_floating(field.type) or pa.types.is_integer(field.type)
+                )
+            ]
+        else:
+            raise ValueError(f"Unknown method '{how}', use 'volume' or 'mean'.")
+        if columns is None:
+            if name not in RATES:
+                raise ValueError(f"Results '{name}' have no rates, give the columns.")
+            columns = [column for column in RATES[name] if column in schema.names]
+        for column in columns:
+            if column not in allowed:
+                raise ValueError(
+                    f"Cannot take the {how} of column '{column}' of results '{name}', "
+                    f"only of {', '.join(allowed)}."
+                )
+
+        model = self.model
+        starts = self.times(name).to_numpy()
+        start = starts[0] if len(starts) else model.starttime
+        edges = _period_edges(periods, start, model.endtime)
+        keys = [dim for dim in dims if dim != "time"]
+        table = _aggregate(path, keys, list(columns), starts, model.endtime, edges)
+        if how == "mean":
+            for column in columns:
+                mean = pc.divide(table[column], table["seconds"])
+                table = table.set_column(
+                    table.schema.get_field_index(column), column, mean
+                )
+        return _convert(table.drop_columns(["seconds"]), name, output)
+
+    def to_ugrid_netcdf(
+        self,
+        path: str | PathLike[str],
+        chunk_time: int = 100,
+        add_allocation: bool = False,
+    ) -> None:
+        """Write the network with the results to a UGRID NetCDF file, in time chunks.
+
+        The network is written first, after which the results are read and written
+        `chunk_time` times at a time.
+        For uncompressed results, as written with ``results.compression = False``,
+        the memory use then does not depend on the length of the run.
+        Compressed results are not streamed: these are decompressed a record batch at a time,
+        and the core writes a single one. Every window then decompresses the columns
+        it needs for the whole run, so a larger `chunk_time` saves time.
+        The file has the same variables as `Model.to_xugrid` with the same results added.
+        This method will throw `ImportError` if the optional dependency `xugrid`
+        or `netCDF4` isn't installed.
+
+        Parameters
+        ----------
+        path : str | PathLike[str]
+            The path of the NetCDF file.
+        chunk_time : int
+            The number of times to read and write at once.
+        add_allocation : bool
+            Write the allocation results instead of the flow and basin results.
+        """
+        if chunk_time < 1:
+            raise ValueError(f"chunk_time must be positive, not {chunk_time}.")
+        uds = self.model.to_xugrid()
+        if add_allocation:
+            variables = self._allocation_variables(uds)
+        else:
+            variables = self._flow_variables(uds)
+        _write_ugrid_netcdf(Path(path), uds, variables, chunk_time)
+
+    def _flow_variables(self, uds: Any) -> _GridVariables:
+        """Return the flow rates on the links and the basin results on the nodes."""
+        link_dim = uds.grid.edge_dimension
+        node_dim = uds.grid.node_dimension
+        link_lookup = _link_lookup(uds)
+        node_lookup = _node_lookup(uds)
+        basin_path = self._path("basin")
+        basin_names = [
+            name
+            for name in _open(basin_path).schema.names
+            if name not in DIMENSIONS["basin"]
+        ]
+        dims = {"flow_rate": link_dim} | dict.fromkeys(basin_names, node_dim)
+
+        def read(times: pd.DatetimeIndex) -> dict[str, Any]:
+            window = (times[0], times[-1])
+            flow = self.read(
+                "flow",
+                columns=["time", "link_id", "flow_rate"],
+                time=window,
+                output="xarray",
+            ).reindex(time=times)
+            basin = self.read("basin", time=window, output="xarray").reindex(time=times)
+            values = {
+                "flow_rate": _on_grid(
+                    flow["flow_rate"], link_lookup, uds.sizes[link_dim]
+                )
+            }
+            for name in basin_names:
+                values[name] = _on_grid(basin[name], node_lookup, uds.sizes[node_dim])
+            return values
+
+        return _GridVariables(self.times("flow"), dims, read)
+
+    def _allocation_variables(self, uds: Any) -> _GridVariables:
+        """Return the allocated flow rates on the links.
+
+        "flow_rate_allocated" is the sum of all allocated flow rates over the demand priorities.
+        The flow rates of the individual demand priorities and optimization types
+        are added as separate variables to ensure QGIS / MDAL compatibility.
+        """
+        path = self._path("allocation_flow")
+        link_dim = uds.grid.edge_dimension
+        link_lookup = _link_lookup(uds)
+        groups = _unique_rows(path, ["optimization_type", "demand_priority"])
+        names = [
+            f"{optimization_type}_priority_{demand_priority}"
+            for optimization_type, demand_priority in groups
+        ]
+        dims = dict.fromkeys(["flow_rate_allocated", *names], link_dim)
+
+        def read(times: pd.DatetimeIndex) -> dict[str, Any]:
+            df = self.read(
+                "allocation_flow",
+                columns=[
+                    "time",
+                    "link_id",
+                    "flow_rate",
+                    "optimization_type",
+                    "demand_priority",
+                ],
+                time=(times[0], times[-1]),
+                output="arrow",
+            ).to_pandas()
+            _time_in_ns(df)
+
+            def on_grid(df: pd.DataFrame) -> Any:
+                values = np.full((len(times), uds.sizes[link_dim]), np.nan)
+                rows = times.get_indexer(pd.DatetimeIndex(df["time"]))
+                columns = link_lookup[df["link_id"]].to_numpy()
+                values[rows, columns] = df["flow_rate"].to_numpy()
+                return values
+
+            allocate = df[df["optimization_type"] == "allocate"]
+            values = {
+                "flow_rate_allocated": on_grid(
+                    allocate.groupby(["time", "link_id"], as_index=False)[
+                        "flow_rate"
+                    ].sum()
+                )
+            }
+            grouped = df.groupby(["optimization_type", "demand_priority"])
+            for name, group in zip(names, groups):
+                if group in grouped.groups:
+                    values[name] = on_grid(grouped.get_group(group))
+            return values
+
+        return _GridVariables(self.times("allocation_flow"), dims, read)
+
+    def _path(self, name: str) -> Path:
+        """Return the path of a results file, which needs to exist."""
+        if name not in DIMENSIONS:
+            raise ValueError(
+                f"Unknown results '{name}', use one of {', '.join(DIMENSIONS)}."
+            )
+        model = self.model
+        path = model._checked_toml_path().parent / model.results_dir / f"{name}.arrow"
+        if not path.is_file():
+            raise FileNotFoundError(
+                f"Cannot find results in '{path}', perhaps the model needs to be run first."
+            )
+        return path
@@ -1,13 +1,50 @@
+import hashlib
 import re
+from collections.abc import Callable, Iterable
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from pathlib import Path
+from typing import Any
 from warnings import catch_warnings, filterwarnings
 
+import geopandas as gpd
 import numpy as np
 import pandas as pd
-from pandera.dtypes import Int32
-from pandera.typing import Series
+import pyarrow as pa
+import shapely
+from numpy.typing import NDArray
 from pydantic import BaseModel, NonNegativeInt
 
 
+class _SerialExecutor(Executor):
+    """Executor that runs every call directly, in the calling thread."""
+
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> Future[Any]:
+        future: Future[Any] = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _executor(max_workers: int, processes: bool = False) -> Executor:
+    """Create a thread or process pool, or a serial executor if there is only one worker."""
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be at least 1, got {max_workers}.")
+    if max_workers == 1:
+        return _SerialExecutor()
+    if processes:
+        return ProcessPoolExecutor(max_workers)
+    return ThreadPoolExecutor(max_workers)
+
+
 def _pascal_to_snake(pascal_str):
     # Insert a '_' before all uppercase letters that are not at the start of the string
     # and convert the string to lowercase
@@ -30,7 +67,7 @@ class MissingOptionalModule:
         )
 
 
-def _node_lookup_numpy(node_id) -> Series[Int32]:
+def _node_lookup_numpy(node_id) -> pd.Series:
     """Create a lookup table from from node_id to the node dimension index.
 
     Used when adding data onto the nodes of an xugrid dataset.
@@ -42,7 +79,7 @@ def _node_lookup_numpy(node_id) -> Series[Int32]:
     )
 
 
-def _node_lookup(uds) -> Series[Int32]:
+def _node_lookup(uds) -> pd.Series:
     """Create a lookup table from from node_id to the node dimension index.
 
     Used when adding data onto the nodes of an xugrid dataset.
@@ -54,7 +91,7 @@ def _node_lookup(uds) -> Series[Int32]:
     )
 
 
-def _link_lookup(uds) -> Series[Int32]:
+def _link_lookup(uds) -> pd.Series:
     """Create a lookup table from link_id to the link dimension index.
 
     Used when adding data onto the links of an xugrid dataset.
@@ -66,6 +103,16 @@ def _link_lookup(uds) -> Series[Int32]:
     )
 
 
+def _on_grid(da, lookup: pd.Series, size: int) -> NDArray[np.float64]:
+    """Place the columns of a (time, ID) array at the dimension index of their ID.
+
+    Used when adding results onto an xugrid dataset, with NaN where there are none.
+    """
+    values = np.full((da.shape[0], size), np.nan)
+    values[:, lookup[da[da.dims[1]].to_numpy()].to_numpy()] = da.to_numpy()
+    return values
+
+
 def _time_in_ns(df) -> None:
     """Convert the time column to datetime64[ns] dtype."""
     # datetime64[ms] gives trouble; https://github.com/pydata/xarray/issues/6318
@@ -86,6 +133,84 @@ def _concat(dfs, **kwargs):
         return pd.concat(dfs, **kwargs)
 
 
+def _file_stamp(path: Path) -> tuple[int, int] | None:
+    """Return the size and modification time of a file, or None if it does not exist."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _content_hash(df: pd.DataFrame) -> str:
+    """Hash the content of a DataFrame, including the index, column names and dtypes."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((df.index.name, str(df.index.dtype))).encode())
+    digest.update(
+        repr([(name, str(dtype)) for name, dtype in df.dtypes.items()]).encode()
+    )
+    if isinstance(df, gpd.GeoDataFrame):
+        digest.update(str(df.crs).encode())
+        # Hash the geometries by their binary representation
+        df = pd.DataFrame(df).assign(
+            **{
+                name: shapely.to_wkb(df[name].to_numpy())
+                for name, dtype in df.dtypes.items()
+                if dtype == "geometry"
+            }
+        )
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    """Convert a table to Arrow, with the geometry of spatial tables as WKB."""
+    metadata = {}
+    if isinstance(df, gpd.GeoDataFrame):
+        if df.crs is not None:
+            # As given, so that it reads back the same
+            metadata[b"crs"] = df.crs.srs.encode()
+        df = pd.DataFrame(df).assign(geometry=shapely.to_wkb(df.geometry.to_numpy()))
+        metadata[b"geometry"] = b"wkb"
+    table = pa.Table.from_pandas(df)
+    return table.replace_schema_metadata({**table.schema.metadata, **metadata})
+
+
+def _from_arrow_table(table: pa.Table) -> pd.DataFrame:
+    """Convert a table made by `_to_arrow_table` back, with the same dtypes."""
+    metadata = table.schema.metadata
+    # The pandas metadata restores the dtypes, including the index,
+    # except that "string[pyarrow]" is taken to be a StringDtype instead of an ArrowDtype
+    df = table.to_pandas()
+    for column in table.schema.pandas_metadata["columns"]:
+        name = column["name"]
+        if column["numpy_type"] == "string[pyarrow]" and name in df.columns:
+            df[name] = df[name].astype(pd.ArrowDtype(table.schema.field(name).type))
+    if b"geometry" in metadata and "geometry" in df.columns:
+        crs = metadata.get(b"crs")
+        geometry = shapely.from_wkb(df["geometry"].to_numpy())
+        df = gpd.GeoDataFrame(
+            df.assign(geometry=geometry),
+            geometry="geometry",
+            crs=None if crs is None else crs.decode(),
+        )
+    return df
+
+
+def _to_ipc(df: pd.DataFrame) -> pa.Buffer:
+    """Serialize a table as an Arrow IPC stream, see `_to_arrow_table`."""
+    table = _to_arrow_table(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _from_ipc(buffer: pa.Buffer) -> pd.DataFrame:
+    """Deserialize a table written by `_to_ipc`, without copying the Arrow columns."""
+    return _from_arrow_table(pa.ipc.open_stream(buffer).read_all())
+
+
 class UsedIDs(BaseModel):
     """A helper class to manage globally unique node IDs.
 
@@ -101,6 +226,14 @@ class UsedIDs(BaseModel):
         self.node_ids.add(node_id)
         self.max_node_id = max(self.max_node_id, node_id)
 
+    def update(self, node_ids: Iterable[int]) -> None:
+        node_ids = [int(node_id) for node_id in node_ids]
+        self.node_ids.update(node_ids)
+        self.max_node_id = max(self.max_node_id, *node_ids, 0)
+
+    def new_ids(self, n: int) -> NDArray[np.int64]:
+        return np.arange(self.max_node_id + 1, self.max_node_id + 1 + n)
+
     def __contains__(self, value: int) -> bool:
         return self.node_ids.__contains__(value)
 
@@ -1,6 +1,10 @@
-from ribasim import geometry, nodes
+import pyarrow as pa
+import pytest
+from pandas.testing import assert_frame_equal
+from ribasim import db_utils, geometry, nodes
 from ribasim.input_base import TableModel
 from ribasim.schemas import BasinSubgridSchema
+from ribasim.utils import MissingOptionalModule
 
 
 def test_tablemodel_schema():
@@ -17,3 +21,41 @@ def test_tablename():
 
     cls = geometry.link.LinkTable
     assert cls.tablename() == "Link"
+
+
+@pytest.mark.parametrize("adbc", [True, False])
+def test_from_db(discrete_control_of_pid_control, tmp_path, monkeypatch, adbc):
+    if not adbc:
+        monkeypatch.setattr(
+            db_utils, "adbc_sqlite", MissingOptionalModule("adbc_driver_sqlite")
+        )
+    model = discrete_control_of_pid_control
+    model.write(tmp_path / "ribasim.toml")
+    db_path = tmp_path / "database.gpkg"
+
+    for table in (
+        model.discrete_control.condition,
+        model.discrete_control.logic,
+        model.level_boundary.time,
+        model.outlet.static,
+    ):
+        df = type(table)._from_db(db_path, table.tablename())
+        # The types already match the schema, before validation
+        validated = type(table)(df=df).df
+        assert df.dtypes.equals(validated.dtypes)
+        assert df.index.dtype == validated.index.dtype
+        assert_frame_equal(validated, table.df)
+
+
+def test_read_arrow_table_in_chunks(basic_transient, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        db_utils, "adbc_sqlite", MissingOptionalModule("adbc_driver_sqlite")
+    )
+    basic_transient.write(tmp_path / "ribasim.toml")
+    types = nodes.basin.Time._arrow_types()
+    table = db_utils._read_arrow_table(
+        tmp_path / "database.gpkg", "Basin / time", types, chunk_size=100
+    )
+    assert table.num_rows == len(basic_transient.basin.time.df)
+    assert table.schema.field("time").type == pa.timestamp("ms")
+    assert table.schema.field("node_id").type == pa.int32()
@@ -1,17 +1,32 @@
+import os
+import pickle
+import shutil
 from datetime import datetime
 from pathlib import Path
 
+import geopandas as gpd
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import pytest
 import ribasim
+import ribasim.bundle
 import tomli
 from pandas import DataFrame
-from pandas.testing import assert_frame_equal
+from pandas.testing import assert_frame_equal, assert_series_equal
 from pydantic import ValidationError
 from ribasim import Model, Node, Solver
-from ribasim.nodes import basin, flow_boundary, flow_demand, pump, user_demand
+from ribasim.input_base import context_file_loading
+from ribasim.nodes import (
+    basin,
+    flow_boundary,
+    flow_demand,
+    outlet,
+    pump,
+    user_demand,
+)
 from ribasim.utils import UsedIDs
+from shapely import points
 from shapely.geometry import Point
 
 
@@ -55,6 +70,433 @@ def test_basic_arrow(basic_arrow, tmp_path):
     __assert_equal(model_orig.basin.profile.df, model_loaded.basin.profile.df)
 
 
+def test_lazy_loading(basic_arrow, tmp_path):
+    basic_arrow.write(tmp_path / "basic_arrow/ribasim.toml")
+    model = Model.read(tmp_path / "basic_arrow/ribasim.toml")
+
+    # Only the spatial tables are read right away
+    assert "df" in model.basin.node.__dict__
+    for table in (model.basin.profile, model.basin.static):
+        assert "df" not in table.__dict__
+    assert model.basin.profile._source.table is None
+    assert model.basin.static._source.table == "Basin / static"
+    assert model.basin.time._source is None
+    assert model.basin.time.df is None
+    assert repr(model.basin) == repr(basic_arrow.basin)
+
+    # Unread tables are copied from their source on writing
+    model.write(tmp_path / "copied/ribasim.toml")
+    assert model.basin.static._source is not None
+    copied = Model.read(tmp_path / "copied/ribasim.toml")
+    assert copied.basin.static.df is not None
+    assert "df" in copied.basin.static.__dict__
+    assert copied.basin == basic_arrow.basin
+
+    # A table is read on first access, and written as usual afterwards
+    model.basin.static.df.loc[:, "drainage"] = 1.0
+    assert model.basin.static._source is None
+    model.write(tmp_path / "modified/ribasim.toml")
+    modified = Model.read(tmp_path / "modified/ribasim.toml")
+    assert (modified.basin.static.df["drainage"] == 1.0).all()
+
+    # A table that fails to be read keeps its source, so it can be read again
+    profile_path = tmp_path / "basic_arrow/input/profile.arrow"
+    moved_path = profile_path.with_name("moved.arrow")
+    profile_path.rename(moved_path)
+    for _ in range(2):
+        with pytest.raises(FileNotFoundError):
+            model.basin.profile.df
+    moved_path.rename(profile_path)
+    assert model.basin.profile.df is not None
+    assert model.basin.profile._source is None
+
+    # Assigning a table replaces its source
+    assert modified.basin.state._source is not None
+    modified.basin.state.df = basin.State(node_id=[1, 3, 6, 9], level=[2.0] * 4).df
+    assert modified.basin.state._source is None
+    modified.write(tmp_path / "assigned/ribasim.toml")
+    assigned = Model.read(tmp_path / "assigned/ribasim.toml")
+    assert (assigned.basin.state.df["level"] == 2.0).all()
+
+
+def test_parallel_io(basic_arrow, tmp_path):
+    basic_arrow.basin.static.set_filepath(Path("static.arrow"))
+    basic_arrow.write(tmp_path / "basic_arrow/ribasim.toml", max_workers=4)
+    assert (tmp_path / "basic_arrow/input/static.arrow").is_file()
+
+    # All tables are read right away
+    model = Model.read(tmp_path / "basic_arrow/ribasim.toml", max_workers=4)
+    for sub in model._nodes():
+        for table in sub._tables():
+            assert table._source is None
+            assert "df" in table.__dict__
+    assert model.basin == basic_arrow.basin
+    assert model.pump == basic_arrow.pump
+
+    model.write(tmp_path / "rewritten/ribasim.toml", max_workers=4)
+    rewritten = Model.read(tmp_path / "rewritten/ribasim.toml")
+    assert rewritten.basin == basic_arrow.basin
+
+    with pytest.raises(ValueError, match="max_workers must be at least 1"):
+        model.write(tmp_path / "invalid/ribasim.toml", max_workers=0)
+
+    # Reading the tables keeps the loading context it is called in
+    model = Model.read(tmp_path / "basic_arrow/ribasim.toml")
+    outer = {"directory": tmp_path}
+    token = context_file_loading.set(outer)
+    try:
+        model._read_tables(max_workers=4)
+        assert context_file_loading.get() is outer
+    finally:
+        context_file_loading.reset(token)
+    assert model.basin.profile._source is None
+
+
+def test_memory_map(basic_arrow, tmp_path):
+    profile = basic_arrow.basin.profile
+    profile.df = pd.concat([profile.df] * 1000, ignore_index=True)
+    basic_arrow.write(tmp_path / "zstd/ribasim.toml")
+    basic_arrow.write(tmp_path / "lz4/ribasim.toml", arrow_compression="lz4")
+    toml_path = tmp_path / "uncompressed/ribasim.toml"
+    basic_arrow.write(toml_path, arrow_compression="uncompressed")
+    sizes = [
+        (tmp_path / f"{name}/input/profile.arrow").stat().st_size
+        for name in ("zstd", "lz4", "uncompressed")
+    ]
+    assert sizes == sorted(sizes)
+
+    # Unread tables are recompressed if a compression is given
+    unread = Model.read(tmp_path / "zstd/ribasim.toml")
+    unread.write(
+        tmp_path / "recompressed/ribasim.toml", arrow_compression="uncompressed"
+    )
+    assert unread.basin.profile._source is not None
+    path = tmp_path / "recompressed/input/profile.arrow"
+    assert path.stat().st_size == sizes[-1]
+
+    model = Model.read(toml_path, memory_map=True)
+    assert model.basin.profile._source.memory_map
+    allocated = pa.total_allocated_bytes()
+    df = model.basin.profile.df
+    # Only the index is converted, the columns refer to the mapped file
+    assert pa.total_allocated_bytes() - allocated < df.memory_usage(index=False).sum()
+    assert_frame_equal(df, basic_arrow.basin.profile.df, check_dtype=False)
+
+    model.basin.profile.df = df.assign(area=2.0)
+    if os.name == "nt":
+        # Windows cannot replace the mapped file while a DataFrame refers to it
+        with pytest.raises(PermissionError, match="memory mapped"):
+            model.write(toml_path)
+        del df
+        model.write(toml_path)
+    else:
+        # Overwriting the mapped file leaves the DataFrame intact
+        model.write(toml_path)
+        assert (df["area"] != 2.0).any()
+    assert (Model.read(toml_path).basin.profile.df["area"] == 2.0).all()
+
+
+def test_release_memory_map(basic_arrow, tmp_path, monkeypatch):
+    toml_path = tmp_path / "basic_arrow/ribasim.toml"
+    basic_arrow.write(toml_path, arrow_compression="uncompressed")
+    model = Model.read(toml_path, memory_map=True)
+    profile = model.basin.profile
+    df = profile.df
+    path = toml_path.parent / "input/profile.arrow"
+    assert profile._memory_map == path.resolve()
+
+    # Only on Windows the table is copied into memory before its file is replaced
+    profile._release_memory_map(path)
+    assert profile.df is df
+    with monkeypatch.context() as m:
+        m.setattr(os, "name", "nt")
+        allocated = pa.total_allocated_bytes()
+        profile._release_memory_map(path)
+        assert (
+            pa.total_allocated_bytes() - allocated >= df.memory_usage(index=False).sum()
+        )
+    assert profile._memory_map is None
+    assert profile.df is not df
+    assert_frame_equal(profile.df, df)
+
+
+def test_incremental_write(basic_arrow, tmp_path, monkeypatch):
+    toml_path = tmp_path / "basic_arrow/ribasim.toml"
+    basic_arrow.write(toml_path)
+    # Reading and writing doesn't hash the tables
+    monkeypatch.setattr(ribasim.input_base, "_content_hash", None)
+    model = Model.read(toml_path)
+    model.write(toml_path)
+
+    written = []
+    save = ribasim.input_base.TableModel._save
+
+    def recording_save(self, directory, input_dir):
+        written.append(self.tablename())
+        return save(self, directory, input_dir)
+
+    monkeypatch.setattr(ribasim.input_base.TableModel, "_save", recording_save)
+
+    # Nothing changed since reading
+    model.write(toml_path, incremental=True)
+    assert written == []
+
+    # Only the changed tables are written, read or not.
+    # Tables that are edited in place count as changed once they are assigned again.
+    model.pump.static.df.loc[:, "flow_rate"] = 2.0
+    model.pump.static.df = model.pump.static.df
+    model.basin.profile.df = model.basin.profile.df.assign(area=3.0)
+    model.basin.node.df.loc[:, "name"] = "changed"
+    model.basin.node.df = model.basin.node.df
+    model.write(toml_path, incremental=True)
+    assert sorted(written) == ["Basin / profile", "Node", "Pump / static"]
+
+    # Tables that were removed are dropped
+    written.clear()
+    model.outlet.static.df = None
+    model.write(toml_path, incremental=True)
+    assert written == []
+    assert not (tmp_path / "basic_arrow/.database.gpkg").exists()
+
+    monkeypatch.undo()
+    updated = Model.read(toml_path)
+    assert (updated.pump.static.df["flow_rate"] == 2.0).all()
+    assert (updated.basin.profile.df["area"] == 3.0).all()
+    assert (updated.basin.node.df["name"] == "changed").all()
+    assert updated.outlet.static.df is None
+    assert updated.basin.state == basic_arrow.basin.state
+
+    # A full write gives the same result
+    model.write(tmp_path / "full/ribasim.toml")
+    full = Model.read(tmp_path / "full/ribasim.toml")
+    assert full.basin == updated.basin
+    assert full.pump == updated.pump
+
+
+def test_write_scenarios(basic_arrow, tmp_path):
+    static = basic_arrow.basin.static.df
+    profile = basic_arrow.basin.profile.df
+    scenarios = {
+        "wet": {"Basin / static": static.assign(precipitation=1e-6)},
+        "dry": {"Basin / static": static.assign(precipitation=0.0)},
+        "large": {"Basin / profile": profile.assign(area=profile.area * 2)},
+    }
+    paths = basic_arrow.write_scenarios(tmp_path, scenarios, max_workers=2)
+    assert sorted(paths) == ["dry", "large", "wet"]
+    assert basic_arrow.filepath is None
+    assert not (tmp_path / ".base").exists()
+
+    wet = Model.read(paths["wet"])
+    large = Model.read(paths["large"])
+    assert (wet.basin.static.df["precipitation"] == 1e-6).all()
+    assert wet.basin.profile == basic_arrow.basin.profile
+    assert large.basin.static == basic_arrow.basin.static
+    assert_frame_equal(
+        large.basin.profile.df, profile.assign(area=profile.area * 2), check_dtype=False
+    )
+
+    # Unchanged Arrow files are shared, the changed ones are not
+    profiles = {
+        scenario: path.parent / "input/profile.arrow"
+        for scenario, path in paths.items()
+    }
+    assert profiles["wet"].samefile(profiles["dry"])
+    assert not profiles["wet"].samefile(profiles["large"])
+
+    with pytest.raises(ValueError, match="replaces unknown table Basin / foo"):
+        basic_arrow.write_scenarios(tmp_path, {"wrong": {"Basin / foo": static}})
+
+
+def test_pickle(basic, basic_arrow, tmp_path):
+    model = pickle.loads(pickle.dumps(basic, protocol=5))
+    assert model.basin._parent is model
+    assert model.link._parent is model
+    assert_frame_equal(model.basin.profile.df, basic.basin.profile.df)
+    assert_frame_equal(model.node_table().df, basic.node_table().df)
+    assert model.fingerprint() == basic.fingerprint()
+
+    # The tables are passed out-of-band
+    buffers: list[pickle.PickleBuffer] = []
+    pickle.dumps(basic, protocol=5, buffer_callback=buffers.append)
+    assert buffers
+
+    model = Model.from_ipc_bytes(basic.to_ipc_bytes())
+    assert model.fingerprint() == basic.fingerprint()
+    model.basin.add(Node(100, Point(0, 0)), [basin.State(level=[1.0])])
+    assert 100 in model.node_table().df.index
+    assert 100 not in basic.node_table().df.index
+
+    # Tables that were not read yet are read when pickled
+    toml_path = tmp_path / "basic_arrow/ribasim.toml"
+    basic_arrow.write(toml_path)
+    model = Model.read(toml_path)
+    assert "df" not in model.basin.profile.__dict__
+    pickled = pickle.dumps(model)
+    data = Model.read(toml_path).to_ipc_bytes()
+    shutil.rmtree(toml_path.parent)
+    unpickled = pickle.loads(pickled)
+    assert unpickled.basin.profile._source is None
+    assert_frame_equal(unpickled.basin.profile.df, model.basin.profile.df)
+    assert Model.from_ipc_bytes(data).fingerprint() == model.fingerprint()
+
+
+def test_bundle(basic_arrow, tmp_path):
+    toml_path = tmp_path / "basic_arrow/ribasim.toml"
+    basic_arrow.write(toml_path)
+    model = Model.read(toml_path)
+
+    bundle_path = tmp_path / "bundle/ribasim.toml"
+    model.write(bundle_path, format="bundle")
+    input_dir = bundle_path.parent / model.input_dir
+    assert not (input_dir / "database.gpkg").exists()
+    assert (input_dir / "bundle/Basin_static.arrow").is_file()
+    # Tables with their own Arrow file are kept there
+    assert not (input_dir / "bundle/Basin_profile.arrow").exists()
+
+    bundle = Model.read(bundle_path)
+    assert_frame_equal(bundle.node_table().df, model.node_table().df)
+    assert_frame_equal(bundle.link.df, model.link.df)
+    assert bundle.fingerprint() == model.fingerprint()
+
+    # The conversion back to a GeoPackage is lossless
+    gpkg_path = tmp_path / "gpkg/ribasim.toml"
+    bundle.write(gpkg_path)
+    assert Model.read(gpkg_path).fingerprint() == model.fingerprint()
+
+    df = ribasim.bundle.read_table(bundle_path, "Basin / static", ["precipitation"])
+    assert list(df.columns) == ["precipitation"]
+    assert df.index.name == "fid"
+    assert_series_equal(df["precipitation"], model.basin.static.df["precipitation"])
+    node = ribasim.bundle.read_table(bundle_path, "Node", ["node_type"])
+    assert list(node.columns) == ["node_type"]
+
+    # An incremental write only writes the changed tables
+    bundle = Model.read(bundle_path)
+    bundle.basin.static.df = bundle.basin.static.df.assign(precipitation=1.0)
+    mtimes = {p: p.stat().st_mtime_ns for p in bundle_path.parent.rglob("*.arrow")}
+    bundle.write(bundle_path, format="bundle", incremental=True)
+    changed = {p.name for p, t in mtimes.items() if p.stat().st_mtime_ns != t}
+    assert changed == {"Basin_static.arrow"}
+    bundle = Model.read(bundle_path, memory_map=True)
+    assert (bundle.basin.static.df["precipitation"] == 1.0).all()
+
+    # Writing a GeoPackage to the same location replaces the bundle
+    bundle.write(bundle_path)
+    assert (input_dir / "database.gpkg").is_file()
+    assert not (input_dir / "bundle").exists()
+
+    with pytest.raises(ValueError, match="Unknown format 'parquet'"):
+        model.write(bundle_path, format="parquet")  # type: ignore[arg-type]
+
+
+def test_cache(basic_arrow, tmp_path, monkeypatch):
+    monkeypatch.setenv("RIBASIM_CACHE_DIR", str(tmp_path / "cache"))
+    toml_path = tmp_path / "basic_arrow/ribasim.toml"
+    basic_arrow.write(toml_path)
+    model = Model.read(toml_path, cache=True)
+    (entry,) = (tmp_path / "cache").iterdir()
+    assert (entry / "Basin_static.arrow").is_file()
+
+    # A cache hit doesn't read the GeoPackage or Arrow input tables
+    def fail(*args, **kwargs):
+        raise AssertionError("not cached")
+
+    with monkeypatch.context() as m:
+        m.setattr(ribasim.input_base, "_read_arrow_table", fail)
+        m.setattr(ribasim.input_base.TableModel, "_from_arrow", fail)
+        cached = Model.read(toml_path, cache=True)
+        assert cached.basin == model.basin
+        assert cached.pump == model.pump
+        assert_frame_equal(cached.link.df, model.link.df)
+        assert_frame_equal(cached.node_table().df, model.node_table().df)
+
+    # A model read from the cache doesn't depend on its entry being kept,
+    # and doesn't keep its files open, since the tables are read into memory
+    directory = toml_path.parent / model.input_dir
+    allocated = pa.total_allocated_bytes()
+    tables = ribasim.cache._lookup(entry.name, directory).tables
+    nbytes = sum(table.nbytes for table in tables.values())
+    assert pa.total_allocated_bytes() - allocated >= nbytes
+    del tables
+    cached = Model.read(toml_path, cache=True)
+    assert cached.basin.profile._source is not None
+    ribasim.cache.clear()
+    assert cached.basin.profile == model.basin.profile
+    cached.write(tmp_path / "from_cache/ribasim.toml")
+    assert Model.read(tmp_path / "from_cache/ribasim.toml").basin == model.basin
+    model = Model.read(toml_path, cache=True)
+    (entry,) = (tmp_path / "cache").iterdir()
+
+    # Another process storing the same entry in the meantime is not an error
+    with monkeypatch.context() as m:
+        rmtree = shutil.rmtree
+        m.setattr(
+            ribasim.cache.shutil,
+            "rmtree",
+            lambda path, **kwargs: path == entry or rmtree(path, **kwargs),
+        )
+        info = ribasim.cache._lookup(entry.name, directory).database_info
+        ribasim.cache._store(entry.name, model, directory, info)
+    assert ribasim.cache._lookup(entry.name, directory) is not None
+
+    # Changing an Arrow input file replaces the entry
+    basic_arrow.basin.profile.df = basic_arrow.basin.profile.df.assign(area=2.0)
+    basic_arrow.basin.profile._save(toml_path.parent, basic_arrow.input_dir)
+    changed = Model.read(toml_path, cache=True)
+    assert (changed.basin.profile.df["area"] == 2.0).all()
+    assert list((tmp_path / "cache").iterdir()) == [entry]
+    assert (Model.read(toml_path, cache=True).basin.profile.df["area"] == 2.0).all()
+
+    # Least recently used entries are evicted beyond the maximum size
+    entry_size = sum(file.stat().st_size for file in entry.iterdir())
+    monkeypatch.setenv("RIBASIM_CACHE_SIZE", str(entry_size))
+    basic_arrow.starttime = datetime(2021, 1, 1)
+    basic_arrow.write(tmp_path / "other/ribasim.toml")
+    Model.read(tmp_path / "other/ribasim.toml", cache=True)
+    (newest,) = (tmp_path / "cache").iterdir()
+    assert newest != entry
+
+    # Entries that cannot be removed are skipped, and the next one is evicted instead
+    monkeypatch.setenv("RIBASIM_CACHE_SIZE", str(2 * entry_size))
+    Model.read(toml_path, cache=True)
+    (entry,) = set((tmp_path / "cache").iterdir()) - {newest}
+    os.utime(newest / "manifest.json", (0, 0))
+    with monkeypatch.context() as m:
+        rmtree = shutil.rmtree
+
+        def failing_rmtree(path, **kwargs):
+            if path == newest:
+                raise PermissionError(path)
+            rmtree(path, **kwargs)
+
+        m.setattr(ribasim.cache.shutil, "rmtree", failing_rmtree)
+        ribasim.cache._evict(entry_size)
+    assert list((tmp_path / "cache").iterdir()) == [newest]
+
+    ribasim.cache.clear()
+    assert not (tmp_path / "cache").exists()
+
+
+def test_read_database_info_once(basic, tmp_path, monkeypatch):
+    basic.write(tmp_path / "basic/ribasim.toml")
+    calls = []
+    read_database_info = ribasim.db_utils._read_database_info
+
+    def counting_read_database_info(db_path):
+        calls.append(db_path)
+        return read_database_info(db_path)
+
+    monkeypatch.setattr(
+        ribasim.model, "_read_database_info", counting_read_database_info
+    )
+    monkeypatch.setattr(
+        ribasim.input_base, "_read_database_info", counting_read_database_info
+    )
+    model = Model.read(tmp_path / "basic/ribasim.toml")
+    assert calls == [tmp_path / "basic/database.gpkg"]
+    assert model.basin.static._source.schema_version == ribasim.__schema_version__
+
+
 def test_basic_transient(basic_transient, tmp_path):
     model_orig = basic_transient
     model_orig.write(tmp_path / "basic_transient/ribasim.toml")
@@ -209,6 +651,60 @@ def test_node_autoincrement():
     assert nbasin.node_id == 101
 
 
+def test_add_many():
+    model = Model(
+        starttime="2020-01-01",
+        endtime="2021-01-01",
+        crs="EPSG:28992",
+    )
+    model.basin.add(Node(2, Point(0, 0)), [basin.State(level=[1.0])])
+
+    node = gpd.GeoDataFrame(
+        data={"name": ["a", "b", "c"], "subnetwork_id": [1, 1, None]},
+        geometry=points([1.0, 2.0, 3.0], [0.0, 0.0, 0.0]),
+        index=pd.Index([10, 11, 12], name="label"),
+    )
+    nodes = model.basin.add_many(
+        node,
+        [
+            basin.Profile(
+                node_id=[10, 10, 11, 11, 12, 12],
+                area=[1.0, 1000.0] * 3,
+                level=[0.0, 1.0] * 3,
+            ),
+            basin.State(node_id=[12, 10, 11], level=[3.0, 1.0, 2.0]),
+        ],
+    )
+    # New IDs are generated since the index is not named node_id
+    assert [n.node_id for n in nodes] == [3, 4, 5]
+    assert nodes[0].node_type == "Basin"
+    assert model._used_node_ids.max_node_id == 5
+    df = model.basin.node.df
+    assert df.index.tolist() == [2, 3, 4, 5]
+    assert df["name"].tolist() == ["", "a", "b", "c"]
+    assert df.crs == model.crs
+    assert model.basin.profile.df["node_id"].tolist() == [3, 3, 4, 4, 5, 5]
+    state = model.basin.state.df
+    assert state["node_id"].tolist() == [2, 5, 3, 4]
+    assert state["level"].tolist() == [1.0, 3.0, 1.0, 2.0]
+
+    # With an index named node_id, the given IDs are used
+    node.index = pd.Index([20, 21, 22], name="node_id")
+    nodes = model.pump.add_many(node, [pump.Static(node_id=[20, 21, 22], flow_rate=1)])
+    assert [n.node_id for n in nodes] == [20, 21, 22]
+    assert nodes[0] == model.pump[20]
+    assert model.basin.add(Node(geometry=Point(0, 0))).node_id == 23
+
+    with pytest.raises(ValueError, match=r"but \[20, 21, 22\] already exist"):
+        model.outlet.add_many(node)
+    node.index = pd.Index([30, 30, 31], name="node_id")
+    with pytest.raises(ValueError, match=r"but \[30\] occur more than once"):
+        model.outlet.add_many(node)
+    node.index = pd.Index([30, 31, 32], name="node_id")
+    with pytest.raises(ValueError, match=r"refers to nodes that are not added: \[33\]"):
+        model.outlet.add_many(node, [outlet.Static(node_id=[30, 33], flow_rate=1)])
+
+
 def test_node_autoincrement_existing_model(basic, tmp_path):
     model = basic
 
@@ -1,8 +1,13 @@
+import re
+
 import geopandas as gpd
 import pytest
 import shapely.geometry as sg
 from pydantic import ValidationError
+from ribasim import Model, Node
 from ribasim.geometry.link import LinkTable, NodeData
+from ribasim.nodes import pump
+from ribasim.utils import UsedIDs
 
 
 @pytest.fixture(scope="session")
@@ -54,3 +59,104 @@ def test_invalid_retour_link(basic):
 def test_node_data():
     node = NodeData(node_id=5, node_type="Pump", geometry=sg.Point(0, 0))
     assert repr(node) == "Pump #5"
+
+
+def test_add_many(basic):
+    model = basic
+    df = model.link.df.copy()
+    model.link.df = df.iloc[0:0]
+    model.link._used_link_ids = UsedIDs()
+
+    model.link.add_many(df["from_node_id"], df["to_node_id"], name="bulk")
+    new = model.link.df
+    assert new.index.tolist() == list(range(1, len(df) + 1))
+    assert (new["from_node_id"].to_numpy() == df["from_node_id"].to_numpy()).all()
+    assert (new["to_node_id"].to_numpy() == df["to_node_id"].to_numpy()).all()
+    assert (new["link_type"].to_numpy() == df["link_type"].to_numpy()).all()
+    assert (new["name"] == "bulk").all()
+    assert new.crs == df.crs
+    # Straight lines between the nodes are created
+    assert new.geometry.equals(df.geometry)
+    assert model.link._used_link_ids.max_node_id == len(df)
+
+
+def test_add_many_missing_geometry(basic):
+    model = basic
+    df = model.link.df.copy()
+    model.link.df = df.iloc[0:0]
+    node = model.basin.node.df.copy()
+    node.loc[1, "geometry"] = None
+    model.basin.node.df = node
+
+    # The nodes after the one without geometry still get their own coordinates
+    keep = (df["from_node_id"] != 1) & (df["to_node_id"] != 1)
+    model.link.add_many(df["from_node_id"][keep], df["to_node_id"][keep])
+    assert model.link.df.geometry.reset_index(drop=True).equals(
+        df.geometry[keep].reset_index(drop=True)
+    )
+    with pytest.raises(ValueError, match="one of its nodes has none"):
+        model.link.add_many(df["from_node_id"][~keep], df["to_node_id"][~keep])
+
+
+def test_add_many_invalid(basic):
+    model = basic
+    with pytest.raises(ValueError, match=re.escape("Nodes [99] do not exist.")):
+        model.link.add_many([1], [99])
+    with pytest.raises(ValueError, match="cannot be downstream of node #1"):
+        model.link.add_many([1], [3])
+    with pytest.raises(ValueError, match="opposite link already exists"):
+        model.link.add_many([2], [1])
+    with pytest.raises(
+        ValueError,
+        match=re.escape("Node 2 can have at most 1 flow link inneighbor(s) (got 2)"),
+    ):
+        model.link.add_many([6], [2])
+    with pytest.raises(
+        ValueError,
+        match=re.escape(
+            "Links have to be unique, but link with from_node_id 16 to_node_id 1 already exists."
+        ),
+    ):
+        model.link.add_many([16], [1])
+    with pytest.raises(
+        ValueError,
+        match=re.escape(
+            "Link (Basin #6, ManningResistance #2) must be a flow link, not 'control'."
+        ),
+    ):
+        model.link.add_many([6], [2], link_type="control")
+    with pytest.raises(ValueError, match="must be a flow link, not 'foo'"):
+        model.link.add_many([6], [2], link_type=["foo"])
+    # Nothing is added when validation fails
+    assert len(model.link.df) == 16
+
+
+def test_link_index(basic, tmp_path):
+    model = basic
+    index = model.link._link_index()
+    assert (16, 1) in index.pairs
+    assert index.in_degree[(2, "flow")] == 1
+    assert index.out_degree[(3, "flow")] == 3
+
+    # The index is updated on add, and rebuilt when the table is replaced
+    model.pump.add(Node(20, sg.Point(0, 0)), [pump.Static(flow_rate=[1.0])])
+    model.link.add(model.basin[6], model.pump[20])
+    model.link.add(model.pump[20], model.basin[9])
+    assert model.link._link_index() is index
+    assert (6, 20) in index.pairs
+    assert index.out_degree[(6, "flow")] == 2
+    df = model.link.df
+    model.link.df = df.iloc[0:0]
+    assert model.link._link_index().pairs == set()
+    model.link.add(model.flow_boundary[16], model.basin[1])
+    model.link.df = df
+
+    # The index is built from a table that is read from the database
+    model.write(tmp_path / "ribasim.toml")
+    model = Model.read(tmp_path / "ribasim.toml")
+    with pytest.raises(ValueError, match="Links have to be unique"):
+        model.link.add(model.flow_boundary[16], model.basin[1])
+    with pytest.raises(ValueError, match="opposite link already exists"):
+        model.link.add(model.pump[20], model.basin[6])
+    # A failed add leaves the table untouched
+    assert len(model.link.df) == 18
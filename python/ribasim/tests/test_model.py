@@ -1,20 +1,22 @@
 import re
 from sqlite3 import connect
 
-import datacompy
 import numpy as np
 import pandas as pd
 import pytest
+import ribasim
 import tomli_w
 import xugrid
 from pydantic import ValidationError
 from pyproj import CRS
 from ribasim import Node
 from ribasim.config import Solver
+from ribasim.db_utils import _write_transaction, esc_id
+from ribasim.diff import TableDiff
 from ribasim.geometry.link import NodeData
-from ribasim.input_base import esc_id
 from ribasim.model import Model
-from ribasim.nodes import basin
+from ribasim.nodes import basin, linear_resistance
+from ribasim.utils import _content_hash
 from ribasim_testmodels import (
     basic_model,
     outlet_model,
@@ -148,6 +150,43 @@ def test_node_table(basic):
     assert df.crs == CRS.from_epsg(28992)
 
 
+def test_node_table_cache(basic, monkeypatch):
+    model = basic
+    node = model.node_table()
+    assert model.node_table() is node
+
+    model.basin.add(Node(100, Point(0.0, 0.0)), [basin.State(level=[1.0])])
+    added = model.node_table()
+    assert added is not node
+    assert added.df.index[-1] == 100
+    assert model.basin[100] == NodeData(100, "Basin", Point(0.0, 0.0))
+
+    model.pump.node.df = model.pump.node.df.assign(name="pump")
+    assert (model.node_table().df.query("node_type == 'Pump'").name == "pump").all()
+
+    # The cache is checked without looking at the data
+    node = model.node_table()
+    monkeypatch.setattr(ribasim.input_base, "_content_hash", None)
+    assert model.node_table() is node
+
+    # Edits in place are seen once the node table is assigned again,
+    # and right away by the lookup of nodes
+    model.pump.node.df.loc[7, "geometry"] = Point(5.0, 5.0)
+    model.pump.node.df.loc[7, "name"] = "moved"
+    assert model.node_table() is node
+    assert model.pump[7].geometry == Point(5.0, 5.0)
+    model.pump.node.df = model.pump.node.df
+    assert model.node_table() is not node
+    assert model.node_table().df.loc[7, "name"] == "moved"
+    assert model.pump[7].geometry == Point(5.0, 5.0)
+    uds = model.to_xugrid(add_flow=False)
+    assert uds.ugrid.grid.node_x[(uds["node_id"] == 7).to_numpy()] == [5.0]
+
+    # Node IDs of another node type are not found through the index
+    with pytest.raises(KeyError):
+        model.basin[2]
+
+
 def test_link_table(basic):
     model = basic
     df = model.link.df
@@ -216,9 +255,11 @@ def test_xugrid(model, tmp_path):
 
 def test_to_crs(bucket: Model):
     model = bucket
+    model.node_table()
 
     # Reproject to World Geodetic System 1984
     model.to_crs("EPSG:4326")
+    assert model.node_table().df.crs == CRS.from_epsg(4326)
 
     # Assert that the bucket is still at Deltares' headquarter
     assert model.basin.node.df["geometry"].iloc[0].x == pytest.approx(4.38, abs=0.1)
@@ -233,6 +274,74 @@ def test_styles(tabulated_rating_curve: Model, tmp_path):
         assert conn.execute("SELECT COUNT(*) FROM layer_styles").fetchone()[0] == 3
 
 
+def test_write_single_transaction(basic: Model, tmp_path):
+    model = basic
+    model.write(tmp_path / "basic" / "ribasim.toml")
+    assert not (tmp_path / "basic" / ".database.gpkg").exists()
+
+    with connect(tmp_path / "basic" / "database.gpkg") as conn:
+        contents = dict(
+            conn.execute("SELECT table_name, data_type FROM gpkg_contents").fetchall()
+        )
+    assert contents["Node"] == "features"
+    assert contents["Link"] == "features"
+    assert contents["ribasim_metadata"] == "attributes"
+    assert contents["layer_styles"] == "attributes"
+    for sub in model._nodes():
+        for table in sub._tables():
+            assert contents[table.tablename()] == "attributes"
+
+    # A failure halfway rolls back everything written in the transaction
+    db_path = tmp_path / "basic" / "database.gpkg"
+    with pytest.raises(RuntimeError):
+        with _write_transaction(db_path) as conn:
+            conn.execute(f"DROP TABLE {esc_id('Basin / static')}")
+            model.pump.static._write_table(conn)
+            raise RuntimeError()
+    with connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {esc_id('Basin / static')}")
+
+
+def test_batch():
+    def build(model: Model) -> None:
+        previous = None
+        for i in range(5):
+            basin_node = model.basin.add(
+                Node(geometry=Point(2.0 * i, 0.0), meta_index=i),
+                [
+                    basin.Profile(area=[1.0, 2.0], level=[0.0, 1.0]),
+                    basin.State(level=[1.0]),
+                ],
+            )
+            if previous is not None:
+                model.link.add(previous, model.basin[basin_node.node_id])
+            previous = model.linear_resistance.add(
+                Node(geometry=Point(2.0 * i + 1.0, 0.0)),
+                [linear_resistance.Static(resistance=[1.0])],
+            )
+            model.link.add(basin_node, previous)
+
+    expected = Model(starttime="2020-01-01", endtime="2021-01-01", crs="EPSG:28992")
+    build(expected)
+
+    model = Model(starttime="2020-01-01", endtime="2021-01-01", crs="EPSG:28992")
+    with model.batch():
+        build(model)
+        # The rows are only appended at the end of the block
+        assert model.basin.node.df is None
+        assert model.link.df.empty
+        assert model.basin[9] == expected.basin[9]
+        with pytest.raises(ValueError, match="already exists"):
+            model.basin.add(Node(1, Point(0.0, 0.0)))
+        with pytest.raises(ValueError, match="at most 1 flow link inneighbor"):
+            model.link.add(model.basin[1], model.linear_resistance[4])
+
+    assert model == expected
+    pd.testing.assert_frame_equal(model.basin.node.df, expected.basin.node.df)
+    pd.testing.assert_frame_equal(model.link.df, expected.link.df)
+    assert model.link._link_index().pairs == expected.link._link_index().pairs
+
+
 def test_non_existent_files(tmp_path):
     with pytest.raises(
         FileNotFoundError, match="File 'non_existent_file.toml' does not exist."
@@ -303,7 +412,8 @@ def test_model_diff(basic):
     x = nbasic.basin.static.diff(basic.basin.static, ignore_meta=False)
     assert isinstance(x, dict)
     assert "diff" in x
-    assert isinstance(x["diff"], datacompy.Compare)
+    assert isinstance(x["diff"], TableDiff)
+    assert x["diff"].columns_added == ["meta_data"]
 
     # Reset and add new basin / static node.
     nbasic.basin.static.df = basic.basin.static.df.copy()
@@ -319,7 +429,7 @@ def test_model_diff(basic):
     x = nbasic.basin.static.diff(basic.basin.static)
     assert isinstance(x, dict)
     assert "diff" in x
-    assert isinstance(x["diff"], datacompy.Compare)
+    assert isinstance(x["diff"], TableDiff)
 
     # Test DataFrame difference on model level
     x = nbasic.diff(basic)
@@ -328,4 +438,122 @@ def test_model_diff(basic):
     assert len(x) == 1  # only basin is different
     assert "static" in x["basin"]
     assert "diff" in x["basin"]["static"]
-    assert isinstance(x["basin"]["static"]["diff"], datacompy.Compare)
+    assert isinstance(x["basin"]["static"]["diff"], TableDiff)
+
+
+def test_table_diff(basic):
+    nbasic = basic.model_copy(deep=True)
+    static = nbasic.basin.static
+    static.df = static.df.assign(
+        potential_evaporation=static.df.potential_evaporation + 1e-12
+    )
+    assert nbasic.diff(basic, atol=1e-9) == {"basin": {"static": None}}
+
+    static.df = static.df.assign(
+        potential_evaporation=static.df.potential_evaporation + 1.0
+    ).iloc[1:]
+    nbasic.basin.add(Node(None, Point(-1.5, -1)), [basin.Static(precipitation=[4])])
+    x = nbasic.basin.static.diff(basic.basin.static)["diff"]
+    assert x.keys == ["node_id"]
+    assert x.added.column("node_id").to_pylist() == [nbasic.basin.node.df.index[-1]]
+    assert x.removed.column("node_id").to_pylist() == [
+        basic.basin.static.df.node_id.iloc[0]
+    ]
+    assert list(x.changed) == ["potential_evaporation"]
+    changed = x.changed["potential_evaporation"].to_pandas()
+    assert np.allclose(changed["self"] - changed["other"], 1.0)
+    assert "potential_evaporation: 3 rows differ" in x.report()
+
+    # Tables without sort keys are aligned on the index
+    x = nbasic.basin.node.diff(basic.basin.node)["diff"]
+    assert x.keys == ["node_id"]
+    assert x.added.num_rows == 1
+    assert not x.changed
+
+
+def test_clone(basic, tmp_path):
+    node_df = basic.basin.node.df.copy()
+    link_df = basic.link.df.copy()
+    static_df = basic.basin.static.df.copy()
+    model = basic.clone()
+    assert "df" not in model.basin.static.__dict__
+    assert "df" not in basic.basin.static.__dict__
+    assert model == basic
+    assert model.basin._parent is model
+    assert model.basin.static.df is not basic.basin.static.df
+
+    # Edits in place only change one model
+    model.basin.static.df.loc[0, "drainage"] = 1.0
+    model.basin.node.df.loc[1, "name"] = "clone"
+    model.link.df.loc[1, "name"] = "clone"
+    pd.testing.assert_frame_equal(basic.basin.static.df, static_df)
+    pd.testing.assert_frame_equal(basic.basin.node.df, node_df)
+    pd.testing.assert_frame_equal(basic.link.df, link_df)
+    other = basic.clone()
+    basic.basin.node.df.loc[1, "name"] = "original"
+    assert other.basin.node.df.loc[1, "name"] == node_df.loc[1, "name"]
+    basic.basin.node.df = node_df.copy()
+
+    model.to_crs("EPSG:4326")
+    assert basic.basin.node.df.crs == CRS.from_epsg(28992)
+    assert model.basin.node.df.crs == CRS.from_epsg(4326)
+
+    node = model.basin.add(Node(None, Point(4.4, 52.0)), [basin.State(level=[1.0])])
+    assert node.node_id not in basic.basin.node.df.index
+    assert node.node_id not in basic._used_node_ids
+    assert len(model.basin.state.df) == len(basic.basin.state.df) + 1
+
+    model.write(tmp_path / "clone/ribasim.toml")
+    pd.testing.assert_frame_equal(basic.basin.node.df, node_df)
+    pd.testing.assert_frame_equal(basic.link.df, link_df)
+
+
+def test_fingerprint(basic, tmp_path, monkeypatch):
+    nbasic = basic.model_copy(deep=True)
+    assert nbasic.fingerprint() == basic.fingerprint()
+
+    static = nbasic.basin.static
+    content_hash = static.content_hash()
+    assert content_hash is not None
+    assert static.content_hash() == content_hash
+    static.df = static.df.assign(precipitation=1.0)
+    assert static.content_hash() != content_hash
+    assert nbasic.fingerprint() != basic.fingerprint()
+
+    # The hash is cached, and edits in place are seen once `df` is assigned again
+    nbasic = basic.model_copy(deep=True)
+    assert nbasic.basin.static == basic.basin.static
+    fingerprint = nbasic.fingerprint()
+    calls = []
+    monkeypatch.setattr(
+        ribasim.input_base,
+        "_content_hash",
+        lambda df: calls.append(df) or _content_hash(df),
+    )
+    assert nbasic.fingerprint() == fingerprint
+    assert nbasic.basin.static == basic.basin.static
+    assert nbasic.basin.static.diff(basic.basin.static) is None
+    assert calls == []
+    nbasic.basin.static.df.loc[0, "potential_evaporation"] = 1.0
+    assert nbasic.fingerprint() == fingerprint
+    nbasic.basin.static.df = nbasic.basin.static.df
+    assert nbasic.fingerprint() != fingerprint
+    assert len(calls) == 1
+    assert nbasic.basin.static != basic.basin.static
+    assert nbasic.basin.static.diff(basic.basin.static) is not None
+    nbasic.basin.node.df.loc[1, "name"] = "renamed"
+    nbasic.basin.node.df = nbasic.basin.node.df
+    assert nbasic.basin.node.diff(basic.basin.node) is not None
+
+    nbasic = basic.model_copy(deep=True)
+    nbasic.solver.saveat = 0
+    assert nbasic.fingerprint() != basic.fingerprint()
+
+    # Tables that are read from the same file are equal without reading them
+    toml_path = tmp_path / "basic/ribasim.toml"
+    basic.write(toml_path)
+    model = Model.read(toml_path)
+    other = Model.read(toml_path)
+    assert model == other
+    assert model.basin.static._source is not None
+    assert model.fingerprint() == other.fingerprint()
@@ -0,0 +1,403 @@
+import os
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+import ribasim.results
+import xarray as xr
+from pyarrow import feather
+from ribasim import Model
+
+TIMES = pd.date_range("2020-01-01", periods=10, freq="D")
+
+
+def write_results(
+    model: Model,
+    chunksize: int | None = None,
+    times: pd.DatetimeIndex = TIMES,
+    compression: str = "zstd",
+) -> None:
+    """Write basin and flow results like the core does, ordered by time."""
+    assert model.filepath is not None
+    results_path = model.filepath.parent / model.results_dir
+    results_path.mkdir(parents=True, exist_ok=True)
+    node = model.node_table().df
+    assert node is not None
+    basin_ids = node.index[node["node_type"] == "Basin"].to_numpy()
+    link = model.link.df
+    assert link is not None
+
+    def table(ids: np.ndarray, **columns: np.ndarray) -> pa.Table:
+        n = len(times) * len(ids)
+        time = np.repeat(times.to_numpy(), len(ids)).astype("datetime64[ms]")
+        values = {
+            name: pa.array(np.tile(np.asarray(value), len(times)), pa.int32())
+            for name, value in columns.items()
+        }
+        return pa.table(
+            {"time": time, **values, "value": np.arange(n, dtype=np.float64)}
+        )
+
+    basin = table(basin_ids, node_id=basin_ids).rename_columns(
+        ["time", "node_id", "level"]
+    )
+    basin = basin.append_column("storage", pa.compute.multiply(basin["level"], 10.0))
+    flow = table(
+        link.index.to_numpy(),
+        link_id=link.index.to_numpy(),
+        from_node_id=link["from_node_id"].to_numpy(),
+        to_node_id=link["to_node_id"].to_numpy(),
+    ).rename_columns(["time", "link_id", "from_node_id", "to_node_id", "flow_rate"])
+    for name, results in (("basin", basin), ("flow", flow)):
+        feather.write_feather(
+            results,
+            results_path / f"{name}.arrow",
+            compression=compression,
+            chunksize=chunksize,
+        )
+
+
+@pytest.fixture()
+def basic_results(basic, tmp_path) -> Model:
+    basic.write(tmp_path / "basic/ribasim.toml")
+    model = Model.read(tmp_path / "basic/ribasim.toml")
+    write_results(model, chunksize=8)
+    return model
+
+
+@pytest.fixture()
+def single_batch_results(basic, tmp_path) -> Model:
+    """Compressed results in a single record batch per file, like the core writes."""
+    basic.write(tmp_path / "basic/ribasim.toml")
+    model = Model.read(tmp_path / "basic/ribasim.toml")
+    write_results(model)
+    return model
+
+
+def decoded_batches(monkeypatch) -> list[int]:
+    """Record the record batches that are read from results files."""
+    decoded: list[int] = []
+    open_ = ribasim.results._open
+
+    class Reader:
+        def __init__(self, reader):
+            self.reader = reader
+
+        def __getattr__(self, name):
+            return getattr(self.reader, name)
+
+        def get_batch(self, i):
+            decoded.append(i)
+            return self.reader.get_batch(i)
+
+    monkeypatch.setattr(ribasim.results, "_open", lambda *args: Reader(open_(*args)))
+    return decoded
+
+
+def peak_memory(fn: Callable[[], Any]) -> int:
+    """Return the peak memory that Arrow allocates while calling `fn`."""
+    default_pool = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(default_pool)
+    pa.set_memory_pool(pool)
+    try:
+        fn()
+    finally:
+        pa.set_memory_pool(default_pool)
+    return pool.max_memory()
+
+
+def test_read(basic_results):
+    results = basic_results.read_results()
+    basin = results.read("basin")
+    assert list(basin.columns) == ["time", "node_id", "level", "storage"]
+    assert len(basin) == len(TIMES) * 4
+    assert basin["level"].dtype == "double[pyarrow]"
+
+    df = results.read(
+        "basin",
+        columns=["level", "time"],
+        time=("2020-01-03", "2020-01-04"),
+        node_id=[3, 9],
+    )
+    assert list(df.columns) == ["level", "time"]
+    expected = basin[
+        basin["time"].between(pd.Timestamp("2020-01-03"), pd.Timestamp("2020-01-04"))
+        & basin["node_id"].isin([3, 9])
+    ]
+    np.testing.assert_array_equal(df["level"], expected["level"])
+
+    # Filters on node IDs and types of flow results match either end of the links
+    link = basic_results.link.df
+    flow = results.read("flow", node_type="Pump", output="arrow")
+    assert isinstance(flow, pa.Table)
+    pumps = [7]
+    n_links = (link["from_node_id"].isin(pumps) | link["to_node_id"].isin(pumps)).sum()
+    assert flow.num_rows == n_links * len(TIMES)
+    assert flow.equals(results.read("flow", node_id=7, output="arrow"))
+
+    flow = results.read("flow", link_id=1, time=(None, "2020-01-02"))
+    assert flow["time"].tolist() == list(TIMES[:2])
+
+    ds = results.read("basin", output="xarray")
+    assert ds["level"].dims == ("time", "node_id")
+    assert ds["time"].dtype == "datetime64[ns]"
+
+    with pytest.raises(ValueError, match="has no column 'x'"):
+        results.read("basin", columns=["x"])
+    with pytest.raises(ValueError, match="Unknown results 'foo'"):
+        results.read("foo")
+    with pytest.raises(FileNotFoundError, match="Cannot find results"):
+        results.read("allocation")
+    with pytest.raises(FileNotFoundError, match="must be written to disk"):
+        Model(
+            starttime="2020-01-01", endtime="2021-01-01", crs="EPSG:28992"
+        ).read_results()
+
+
+def test_to_xugrid_flow(basic_results):
+    uds = basic_results.to_xugrid(add_flow=True)
+    assert uds["flow_rate"].dims == ("time", uds.grid.edge_dimension)
+    assert uds["level"].dims == ("time", uds.grid.node_dimension)
+    flow = basic_results.read_results().read("flow")
+    np.testing.assert_array_equal(
+        uds["flow_rate"].to_numpy().ravel(), flow["flow_rate"].to_numpy()
+    )
+    is_basin = np.isin(uds["node_id"], [1, 3, 6, 9])
+    assert np.isnan(uds["level"].to_numpy()[:, ~is_basin]).all()
+    basin = basic_results.read_results().read("basin")
+    np.testing.assert_array_equal(
+        uds["level"].to_numpy()[:, is_basin].ravel(), basin["level"].to_numpy()
+    )
+
+
+def test_dense(basic_results):
+    results = basic_results.read_results()
+    flow = results.read("flow", output="arrow")
+    ds = results.read("flow", output="xarray")
+    assert ds["flow_rate"].dims == ("time", "link_id")
+    np.testing.assert_array_equal(ds["link_id"], basic_results.link.df.index)
+    df = flow.to_pandas().astype({"time": "datetime64[ns]"})
+    pivot = xr.Dataset.from_dataframe(df.set_index(["time", "link_id"]))
+    xr.testing.assert_equal(ds, pivot)
+
+    # Uncompressed results with a single record batch are not copied
+    results_path = basic_results.filepath.parent / basic_results.results_dir
+    feather.write_feather(
+        flow.combine_chunks(), results_path / "flow.arrow", compression="uncompressed"
+    )
+    table = results.read("flow", output="arrow")
+    ds = ribasim.results._dense_dataset(table, ["time", "link_id"])
+    buffer = table["flow_rate"].chunk(0).buffers()[1]
+    assert ds["flow_rate"].to_numpy().ctypes.data == buffer.address
+
+    # Results without the same IDs at every time are pivoted
+    assert ribasim.results._dense_dataset(table.slice(1), ["time", "link_id"]) is None
+    ds = results.read("flow", time=(TIMES[1], None), link_id=[2, 3], output="xarray")
+    assert ds.sizes == {"time": len(TIMES) - 1, "link_id": 2}
+
+
+def test_time_layout(basic_results):
+    results = basic_results.read_results()
+    results_path = basic_results.filepath.parent / basic_results.results_dir
+    pd.testing.assert_index_equal(results.times("flow"), TIMES.rename("time"))
+    # Reading doesn't write to the results directory
+    assert sorted(path.name for path in results_path.iterdir()) == [
+        "basin.arrow",
+        "flow.arrow",
+    ]
+
+    # A time window is read as a range of rows, spanning several record batches
+    layout = ribasim.results._time_layout(results_path / "flow.arrow")
+    assert layout is not None
+    assert layout.rows_per_time == len(basic_results.link.df)
+    flow = results.read("flow", time=("2020-01-03", "2020-01-05"), node_id=6)
+    expected = results.read("flow", output="arrow").to_pandas(
+        types_mapper=pd.ArrowDtype
+    )
+    expected = expected[
+        expected["time"].between(pd.Timestamp("2020-01-03"), pd.Timestamp("2020-01-05"))
+        & (expected["from_node_id"].eq(6) | expected["to_node_id"].eq(6))
+    ].reset_index(drop=True)
+    pd.testing.assert_frame_equal(flow, expected)
+    assert len(results.read("flow", time=("2019-01-01", "2019-12-31"))) == 0
+
+    # The layout is kept, but not used for a file that was written again
+    flow_path = results_path / "flow.arrow"
+    assert ribasim.results._time_layout(flow_path) is layout
+    write_results(basic_results)
+    os.utime(flow_path, ns=(0, 0))
+    assert ribasim.results._time_layout(flow_path) is not layout
+    assert len(results.read("flow", time=(TIMES[-1], None))) == layout.rows_per_time
+
+    # Results without the same number of rows at every time are filtered row by row
+    basin_path = results_path / "basin.arrow"
+    basin = feather.read_table(basin_path).slice(1)
+    feather.write_feather(basin, basin_path)
+    assert ribasim.results._time_layout(basin_path) is None
+    assert len(results.read("basin", time=(TIMES[0], TIMES[0]))) == 3
+    assert len(results.times("basin")) == len(TIMES)
+
+
+def test_to_ugrid_netcdf(basic_results, tmp_path):
+    pytest.importorskip("netCDF4")
+    results = basic_results.read_results()
+    basic_results.to_xugrid(add_flow=True).ugrid.to_netcdf(tmp_path / "expected.nc")
+    results.to_ugrid_netcdf(tmp_path / "ribasim.nc", chunk_time=3)
+    expected = xr.load_dataset(tmp_path / "expected.nc")
+    ds = xr.load_dataset(tmp_path / "ribasim.nc")
+    xr.testing.assert_identical(ds, expected)
+    with xr.open_dataset(tmp_path / "ribasim.nc") as ds:
+        assert ds["flow_rate"].encoding["chunksizes"] == (3, ds.sizes["ribasim_nEdges"])
+
+    # Allocation results, of which not every demand priority is at every time
+    results_path = basic_results.filepath.parent / basic_results.results_dir
+    allocation = pd.DataFrame(
+        {
+            "time": np.repeat(TIMES[::2].to_numpy(), 3).astype("datetime64[ms]"),
+            "link_id": np.tile(np.array([1, 2, 5], dtype=np.int32), 5),
+            "optimization_type": np.tile(["allocate", "allocate", "demand"], 5),
+            "demand_priority": np.tile(np.array([1, 2, 1], dtype=np.int32), 5),
+            "flow_rate": np.arange(15.0),
+        }
+    ).iloc[:-1]
+    feather.write_feather(allocation, results_path / "allocation_flow.arrow")
+    results.to_ugrid_netcdf(tmp_path / "allocation.nc", add_allocation=True)
+    ds = xr.load_dataset(tmp_path / "allocation.nc")
+    uds = basic_results.to_xugrid(add_allocation=True)
+    assert list(ds.data_vars)[2:] == [
+        "flow_rate_allocated",
+        "allocate_priority_1",
+        "allocate_priority_2",
+        "demand_priority_1",
+    ]
+    for name in ["flow_rate_allocated", "demand_priority_1"]:
+        np.testing.assert_array_equal(ds[name], uds[name])
+    assert np.isnan(ds["demand_priority_1"][-1]).all()
+
+    with pytest.raises(ValueError, match="chunk_time must be positive"):
+        results.to_ugrid_netcdf(tmp_path / "ribasim.nc", chunk_time=0)
+
+
+def test_to_ugrid_netcdf_single_batch(single_batch_results, tmp_path, monkeypatch):
+    pytest.importorskip("netCDF4")
+    results = single_batch_results.read_results()
+    assert ribasim.results._open(results._path("flow")).num_record_batches == 1
+    results.times("flow")
+    results.times("basin")
+    decoded = decoded_batches(monkeypatch)
+
+    # Nothing is kept between time windows, so every window decompresses both files
+    results.to_ugrid_netcdf(tmp_path / "ribasim.nc", chunk_time=1)
+    assert len(decoded) == 2 * len(TIMES)
+    decoded.clear()
+    results.to_ugrid_netcdf(tmp_path / "whole.nc", chunk_time=len(TIMES))
+    assert len(decoded) == 2
+    xr.testing.assert_identical(
+        xr.load_dataset(tmp_path / "ribasim.nc"), xr.load_dataset(tmp_path / "whole.nc")
+    )
+
+
+@pytest.mark.parametrize("compression", ["zstd", "uncompressed"])
+def test_to_ugrid_netcdf_memory(basic, tmp_path, compression):
+    """The memory use of the export does not grow with the run, if it can be streamed."""
+    pytest.importorskip("netCDF4")
+    basic.write(tmp_path / "basic/ribasim.toml")
+    model = Model.read(tmp_path / "basic/ribasim.toml")
+    times = pd.date_range("2020-01-01", periods=2000, freq="D")
+    model.endtime = times[-1]
+    results = model.read_results()
+
+    def export(**kwargs) -> int:
+        write_results(model, times=times, compression=compression, **kwargs)
+        results.times("flow")
+        results.times("basin")
+        return peak_memory(
+            lambda: results.to_ugrid_netcdf(tmp_path / "ribasim.nc", chunk_time=20)
+        )
+
+    write_results(model, times=times)
+    flow = feather.read_table(results._path("flow"))
+    basin = feather.read_table(results._path("basin"))
+    size = flow.nbytes + basin.nbytes
+    # Compressed results are streamed a record batch at a time
+    assert export(chunksize=20 * len(model.link.df)) < size / 10
+    if compression == "uncompressed":
+        # Uncompressed results are read as views of the file
+        assert export() < size / 10
+        assert not ribasim.results._is_compressed(results._path("flow"))
+    else:
+        # A single compressed record batch is not streamed
+        assert export() > size / 2
+        assert ribasim.results._is_compressed(results._path("flow"))
+
+
+def test_aggregate(basic_results):
+    results = basic_results.read_results()
+    basic_results.endtime = TIMES[-1] + pd.Timedelta("1D")
+    flow = results.read("flow")
+
+    # Every value is the mean rate over the day that starts at its time
+    daily = results.aggregate("flow", "D")
+    assert list(daily.columns) == ["time", "link_id", "flow_rate"]
+    np.testing.assert_allclose(daily["flow_rate"], flow["flow_rate"] * 86400.0)
+    monthly = results.aggregate("flow", "MS", output="arrow")
+    assert monthly["time"].to_pylist() == [pd.Timestamp("2020-01-01")] * len(
+        basic_results.link.df
+    )
+    volume = flow.groupby("link_id")["flow_rate"].sum().to_numpy() * 86400.0
+    np.testing.assert_allclose(monthly["flow_rate"], volume)
+
+    # Days that span two periods are split between them
+    edges = ["2020-01-01 12:00", "2020-01-02 12:00", "2020-01-05"]
+    mean = results.aggregate("basin", edges, columns=["level"], how="mean")
+    assert mean["time"].unique().tolist() == [pd.Timestamp(edge) for edge in edges[:2]]
+    level = results.read("basin", node_id=1)["level"].to_numpy()
+    expected = [level[:2].mean(), (0.5 * level[1] + level[2:4].sum()) / 2.5]
+    np.testing.assert_allclose(mean.loc[mean["node_id"] == 1, "level"], expected)
+    ds = results.aggregate("basin", "W", columns=["level"], how="mean", output="xarray")
+    assert ds["level"].dims == ("time", "node_id")
+
+    with pytest.raises(ValueError, match="Cannot take the volume of column 'level'"):
+        results.aggregate("basin", "D", columns=["level"])
+    with pytest.raises(ValueError, match="Unknown method 'max'"):
+        results.aggregate("flow", "D", how="max")
+
+
+def test_aggregate_single_batch(single_batch_results, monkeypatch):
+    results = single_batch_results.read_results()
+    single_batch_results.endtime = TIMES[-1] + pd.Timedelta("1D")
+    flow = results.read("flow")
+    expected = results.aggregate("basin", "W", how="mean")
+
+    # Slices that split the rows of a time add up to the same periods
+    monkeypatch.setattr(ribasim.results, "SLICE_ROWS", 7)
+    decoded = decoded_batches(monkeypatch)
+    mean = results.aggregate("basin", "W", how="mean")
+    assert decoded == [0]
+    pd.testing.assert_frame_equal(mean, expected)
+    daily = results.aggregate("flow", "D")
+    np.testing.assert_allclose(daily["flow_rate"], flow["flow_rate"] * 86400.0)
+
+
+@pytest.mark.parametrize("compression", ["zstd", "uncompressed"])
+def test_aggregate_memory(basic, tmp_path, monkeypatch, compression):
+    """Uncompressed results are aggregated a slice at a time, compressed ones at once."""
+    basic.write(tmp_path / "basic/ribasim.toml")
+    model = Model.read(tmp_path / "basic/ribasim.toml")
+    times = pd.date_range("2020-01-01", periods=2000, freq="D")
+    model.endtime = times[-1] + pd.Timedelta("1D")
+    write_results(model, times=times, compression=compression)
+    results = model.read_results()
+    results.times("flow")
+    monkeypatch.setattr(ribasim.results, "SLICE_ROWS", 1000)
+
+    columns = ["time", "link_id", "flow_rate"]
+    size = feather.read_table(results._path("flow"), columns=columns).nbytes
+    peak = peak_memory(lambda: results.aggregate("flow", "YS"))
+    if compression == "uncompressed":
+        assert peak < size / 4
+    else:
+        assert peak > size / 2
@@ -1,5 +1,6 @@
 import re
 
+import pandas as pd
 import pytest
 from ribasim import Node
 from ribasim.config import Solver
@@ -130,6 +131,45 @@ def test_minimum_flow_neighbor():
         model.write("test.toml")
 
 
+def test_neighbor_amount_report(basic):
+    assert basic.neighbor_amount_report().empty
+
+    basic.link.df = basic.link.df.loc[basic.link.df["to_node_id"] != 7]
+    report = basic.neighbor_amount_report()
+    assert report.to_dict("records") == [
+        {
+            "node_id": 7,
+            "node_type": "Pump",
+            "direction": "in",
+            "link_type": "flow",
+            "got": 0,
+            "minimum": 1,
+            "maximum": 1,
+        }
+    ]
+    with pytest.raises(
+        ValueError,
+        match=re.escape("Minimum flow inneighbor or outneighbor unsatisfied"),
+    ):
+        basic._validate_model()
+
+    # An excess is reported too, with the maximum that `LinkTable.add` enforces
+    df = basic.link.df
+    extra = df.loc[df["from_node_id"] == 7].assign(to_node_id=1)
+    extra.index = extra.index + df.index.max()
+    basic.link.df = pd.concat([df, extra])
+    report = basic.neighbor_amount_report()
+    assert report.to_dict("records")[-1] == {
+        "node_id": 7,
+        "node_type": "Pump",
+        "direction": "out",
+        "link_type": "flow",
+        "got": 2,
+        "minimum": 1,
+        "maximum": 1,
+    }
+
+
 def test_minimum_control_neighbor():
     model = Model(
         starttime="2020-01-01",
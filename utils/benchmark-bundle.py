@@ -0,0 +1,60 @@
+"""Benchmark writing and reading a model as a GeoPackage and as a bundle.
+
+The basic test model is scaled up by repeating the rows of its attribute tables,
+which are all stored in the GeoPackage, or in the Arrow files of the bundle.
+Reading reads all tables right away, and also checks that the conversion is lossless.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import pandas as pd
+import ribasim
+from ribasim import Model
+from ribasim.input_base import SpatialTableModel
+from ribasim_testmodels import basic_model
+
+
+def scaled_model(factor: int) -> Model:
+    """Create the basic model, with every attribute table repeated factor times."""
+    model = basic_model()
+    for sub in model._nodes():
+        for table in sub._tables():
+            if isinstance(table, SpatialTableModel):
+                continue
+            table.df = pd.concat([table.df] * factor, ignore_index=True)
+    return model
+
+
+def benchmark(
+    model: Model, toml_path: Path, format: ribasim.input_base.ModelFormat
+) -> tuple[float, float, Model]:
+    """Return the time to write and read the model in seconds, and the model read."""
+    start = perf_counter()
+    model.write(toml_path, format=format)
+    write = perf_counter() - start
+
+    start = perf_counter()
+    read_model = Model.read(toml_path, max_workers=1)
+    read = perf_counter() - start
+    return write, read, read_model
+
+
+if __name__ == "__main__":
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    model = scaled_model(factor)
+    print(f"ribasim {ribasim.__version__}, tables repeated {factor} times")
+    print(f"{'format':>10} {'write [s]':>15} {'read [s]':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        # Sort and validate the tables once, outside of the timing
+        model.write(Path(directory) / "warmup/ribasim.toml")
+        fingerprints = set()
+        for format in ("geopackage", "bundle"):
+            toml_path = Path(directory) / f"{format}/ribasim.toml"
+            write, read, read_model = benchmark(model, toml_path, format)
+            fingerprints.add(read_model.fingerprint())
+            print(f"{format:>10} {write:>15.2f} {read:>15.2f}")
+    if len(fingerprints) > 1:
+        sys.exit("The model read from the bundle differs from the GeoPackage.")
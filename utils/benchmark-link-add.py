@@ -0,0 +1,73 @@
+"""Benchmark the cost of adding links to link tables of increasing size.
+
+The validation of a new link uses the adjacency index of the LinkTable,
+and within `Model.batch` the new row is only appended to the table at the end of the block,
+so the cost of `add` should not depend on the number of links already present.
+The append of all added links at the end of the block is timed separately.
+"""
+
+import sys
+from time import perf_counter
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import ribasim
+from ribasim import Model
+from shapely import points
+
+
+def chain_model(n: int, free: int) -> Model:
+    """Create a model of alternating Basin and LinearResistance nodes, with n links.
+
+    Another `free` pairs of a Basin and a LinearResistance are not connected.
+    """
+    model = Model(starttime="2020-01-01", endtime="2021-01-01", crs="EPSG:28992")
+    n_basin = n // 2 + 1 + free
+    n_resistance = n // 2 + free
+    basin_id = np.arange(1, n_basin + 1)
+    resistance_id = np.arange(n_basin + 1, n_basin + n_resistance + 1)
+    for node_model, node_id in (
+        (model.basin, basin_id),
+        (model.linear_resistance, resistance_id),
+    ):
+        node = gpd.GeoDataFrame(
+            geometry=points(node_id.astype(float), np.zeros(len(node_id))),
+            index=pd.Index(node_id, name="node_id"),
+        )
+        node_model.add_many(node)
+    chain_basin = basin_id[: n // 2 + 1]
+    chain_resistance = resistance_id[: n // 2]
+    model.link.add_many(
+        np.concatenate([chain_basin[:-1], chain_resistance]),
+        np.concatenate([chain_resistance, chain_basin[1:]]),
+    )
+    return model
+
+
+def benchmark(n: int, repeats: int = 200) -> tuple[float, float]:
+    """Return the time per add in microseconds, and of the final append in milliseconds."""
+    model = chain_model(n, repeats)
+    link = model.link
+    basin_id = model.basin.node.df.index[-repeats:]
+    resistance_id = model.linear_resistance.node.df.index[-repeats:]
+    link._link_index()  # build the index outside of the timing
+
+    with model.batch():
+        start = perf_counter()
+        for from_id, to_id in zip(basin_id, resistance_id):
+            link.add(model.basin[int(from_id)], model.linear_resistance[int(to_id)])
+        add = (perf_counter() - start) / repeats
+        start = perf_counter()
+    append = perf_counter() - start
+    assert len(link.df) == n + repeats
+    return add * 1e6, append * 1e3
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    print(f"ribasim {ribasim.__version__}")
+    print(f"{'links':>10} {'add [us]':>15} {'append [ms]':>15}")
+    for n in sizes:
+        add, append = benchmark(n)
+        print(f"{n:>10} {add:>15.1f} {append:>15.1f}")
@@ -0,0 +1,56 @@
+"""Benchmark reading and writing a model with a number of I/O threads.
+
+The basic Arrow test model is scaled up by repeating the rows of its tables,
+which are all stored in Arrow files.
+The Arrow files are written and read concurrently, so with more threads
+the wall-clock time should go down on a multi-core machine.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import pandas as pd
+import ribasim
+from ribasim import Model
+from ribasim.input_base import SpatialTableModel
+from ribasim_testmodels import basic_arrow_model
+
+
+def scaled_model(factor: int) -> Model:
+    """Create the basic Arrow model, with every attribute table repeated factor times."""
+    model = basic_arrow_model()
+    for sub in model._nodes():
+        for table in sub._tables():
+            if isinstance(table, SpatialTableModel):
+                continue
+            table.df = pd.concat([table.df] * factor, ignore_index=True)
+            table.set_filepath(Path(f"{table.tablename()}.arrow".replace(" / ", "_")))
+    return model
+
+
+def benchmark(model: Model, directory: Path, max_workers: int) -> tuple[float, float]:
+    """Return the time to write and read the model, in seconds."""
+    toml_path = directory / f"{max_workers}/ribasim.toml"
+    start = perf_counter()
+    model.write(toml_path, max_workers=max_workers)
+    write = perf_counter() - start
+
+    start = perf_counter()
+    Model.read(toml_path, max_workers=max_workers)
+    read = perf_counter() - start
+    return write, read
+
+
+if __name__ == "__main__":
+    factor = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    model = scaled_model(factor)
+    print(f"ribasim {ribasim.__version__}, tables repeated {factor} times")
+    print(f"{'threads':>10} {'write [s]':>15} {'read [s]':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        # Sort and validate the tables once, outside of the timing
+        model.write(Path(directory) / "warmup/ribasim.toml")
+        for max_workers in (1, 2, 4, 8):
+            write, read = benchmark(model, Path(directory), max_workers)
+            print(f"{max_workers:>10} {write:>15.2f} {read:>15.2f}")